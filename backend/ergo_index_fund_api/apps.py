@@ -9,4 +9,16 @@ class ErgoIndexFundAppConfig(AppConfig):
         """
         Startup hook that gets called when the Django backend starts (or restarts).
         """
-        pass
+        from django.contrib.auth.models import User
+        from django.db.models.signals import post_save
+
+        from backend.ergo_index_fund_api.authentication import ClaimsJWTAuthentication
+        from backend.redis.RedisManager import RedisManager
+
+        # Wait for Redis once per process, so requests don't have to.
+        RedisManager.wait_until_ready()
+
+        # Revoke the tokens of users whose accounts change, since their tokens' claims may no longer hold.
+        post_save.connect(ClaimsJWTAuthentication.revoke_tokens_of_saved_user,
+                          sender=User,
+                          dispatch_uid='revoke_tokens_of_saved_user')
@@ -0,0 +1,53 @@
+from decouple import config
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTTokenUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+
+from backend.redis.LocalCache import LocalCache
+from backend.redis.RedisManager import RedisManager
+
+
+class ClaimsJWTAuthentication(JWTTokenUserAuthentication):
+    """
+    Authenticates requests from the signed claims of their access token (username, superuser flag and token version,
+        see ClaimsTokenObtainPairSerializer) instead of loading the user from the SQL database.
+    Tokens issued before the user's tokens were last revoked (RedisManager.revoke_user_tokens()) are refused.
+        Each user's token version is cached locally for TOKEN_VERSION_CACHE_TTL_SEC, and dropped from every
+        process's cache as soon as the user's tokens are revoked (a version read while they are being revoked
+        isn't cached).
+    Tokens issued without these claims are still accepted, by loading their user from the database.
+    """
+
+    # Token version of each user, by RedisManager.user_key().
+    _cache: LocalCache = LocalCache('token_versions',
+                                    ttl_sec=config('TOKEN_VERSION_CACHE_TTL_SEC', default=5, cast=float))
+
+    def get_user(self, validated_token):
+        if 'username' not in validated_token or 'token_version' not in validated_token:
+            return JWTAuthentication.get_user(self, validated_token)
+        username = validated_token['username']
+        cache_key = RedisManager.user_key(username)
+        token_version = self._cache.get(cache_key)
+        if token_version is LocalCache.MISSING:
+            generation = self._cache.generation()
+            redis = RedisManager.shared()
+            token_version = None if redis is None else redis.get_token_version(username)
+            if token_version is None:
+                raise AuthenticationFailed('Could not check whether the token was revoked')
+            self._cache.set(cache_key, token_version, generation)
+        if validated_token['token_version'] != token_version:
+            raise InvalidToken('Token was revoked')
+        return TokenUser(validated_token)
+
+    @staticmethod
+    def revoke_tokens_of_saved_user(sender, instance, created, update_fields=None, **kwargs):
+        """
+        Revokes the tokens of a Django user whose account changed (i.e. its password or superuser flag),
+            since their claims may no longer hold. Receiver of User's post_save signal.
+        """
+        if created or (update_fields is not None and set(update_fields) == {'last_login'}):
+            return
+        redis = RedisManager.shared()
+        if redis is None or redis.revoke_user_tokens(instance.username) is None:
+            print(f'ERROR! Could not revoke the tokens of "{instance.username}" after their account changed')
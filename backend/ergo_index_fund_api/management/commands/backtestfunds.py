@@ -0,0 +1,91 @@
+import time as pytime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.ProjectSettings import ProjectSettings
+from backend.fund.BacktestEngine import BacktestEngine
+from backend.fund.PriceHistory import PriceHistory
+from backend.redis.RedisManager import RedisManager
+
+
+class Command(BaseCommand):
+    """
+    Backtests funds' buy/sell targets over a CSV or Parquet price history, optionally sweeping
+        scaled versions of the targets, and writes one JSON result per line.
+    """
+
+    help = 'Backtests the buy/sell targets of funds over a price history file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prices', required=True,
+                            help='CSV or Parquet price history: a "timestamp" column and one column per token, '
+                                 'or "timestamp", "token" and "price" columns.')
+        parser.add_argument('--fund-ids', default=None,
+                            help='Comma-separated ids of the funds to backtest.')
+        parser.add_argument('--all-funds', action='store_true',
+                            help='Backtest every stored fund.')
+        parser.add_argument('--buy-scales', default='1',
+                            help='Comma-separated factors to apply to every buy_target, i.e. "0.9,0.95,1".')
+        parser.add_argument('--sell-scales', default='1',
+                            help='Comma-separated factors to apply to every sell_target, i.e. "1,1.05,1.1".')
+        parser.add_argument('--initial-value', type=float, default=10000,
+                            help='Starting value of each fund.')
+        parser.add_argument('--fee-pct', type=float, default=0,
+                            help='Cost of each trade, in percent of the value traded.')
+        parser.add_argument('--start-invested', action='store_true',
+                            help='Start holding every token, rather than cash.')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of funds per batch (and per Redis round trip).')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of processes backtesting batches (defaults to the number of CPUs).')
+        parser.add_argument('--output', default=None,
+                            help='File to write the results to, instead of printing them.')
+
+    def handle(self, *args, **options):
+        ProjectSettings.setup_and_validate_settings()
+        redis = RedisManager.shared()
+        if redis is None:
+            raise CommandError('Could not connect to redis')
+        if options['fund_ids'] is None and not options['all_funds']:
+            raise CommandError('One of --fund-ids or --all-funds is required')
+        start_time = pytime.monotonic()
+        history = PriceHistory.from_file(options['prices'])
+        print(f'Loaded {len(history)} prices of {len(history.token_strs)} tokens '
+              f'in {pytime.monotonic() - start_time:.1f}s')
+
+        # Load the portfolios in batches.
+        if options['all_funds']:
+            fund_id_batches = redis.scan_fund_ids(options['batch_size'])
+        else:
+            fund_ids = [fund_id.strip().lower() for fund_id in options['fund_ids'].split(',') if fund_id.strip()]
+            fund_id_batches = (fund_ids[batch_start:batch_start + options['batch_size']]
+                               for batch_start in range(0, len(fund_ids), options['batch_size']))
+        portfolios = {}
+        for fund_ids in fund_id_batches:
+            for fund_id, (manager_email, _, portfolio) in zip(fund_ids, redis.get_funds(fund_ids)):
+                if manager_email is not None and portfolio is not None:
+                    portfolios[fund_id] = portfolio
+        print(f'Loaded {len(portfolios)} portfolios in {pytime.monotonic() - start_time:.1f}s')
+
+        # Backtest and write the results.
+        results = BacktestEngine.backtest(portfolios=portfolios,
+                                          history=history,
+                                          buy_scales=[float(scale) for scale in options['buy_scales'].split(',')],
+                                          sell_scales=[float(scale) for scale in options['sell_scales'].split(',')],
+                                          initial_value=options['initial_value'],
+                                          fee_pct=options['fee_pct'],
+                                          start_invested=options['start_invested'],
+                                          batch_size=options['batch_size'],
+                                          num_workers=options['workers'])
+        output_file = None if options['output'] is None else open(options['output'], 'w')
+        try:
+            for result in results:
+                if output_file is None:
+                    print(result)
+                else:
+                    output_file.write(f'{result}\n')
+        finally:
+            if output_file is not None:
+                output_file.close()
+        print(f'Computed {len(results)} backtests of {len(portfolios)} funds '
+              f'in {pytime.monotonic() - start_time:.1f}s')
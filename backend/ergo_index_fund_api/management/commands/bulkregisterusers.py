@@ -0,0 +1,80 @@
+import csv
+import json
+import time as pytime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.ProjectSettings import ProjectSettings
+from backend.redis.RedisManager import RedisManager
+from backend.user.BulkUserRegistration import BulkUserRegistration
+
+
+class Command(BaseCommand):
+    """
+    Registers the users listed in a CSV file (with email_address, name and password columns), in batches,
+        and reports each row which couldn't be registered.
+    """
+
+    help = 'Registers the users listed in a CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', required=True,
+                            help='CSV file with email_address, name and password columns.')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of rows read, hashed and inserted per batch.')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Number of users inserted per bulk_create (defaults to BULK_REGISTRATION_CHUNK_SIZE).')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of processes hashing passwords (defaults to BULK_REGISTRATION_WORKERS).')
+        parser.add_argument('--errors', default=None,
+                            help='File to which the rows which failed are written, as JSON lines.')
+
+    def handle(self, *args, **options):
+        ProjectSettings.setup_and_validate_settings()
+        redis = RedisManager.shared()
+        if redis is None:
+            raise CommandError('Could not connect to redis')
+
+        start_time = pytime.monotonic()
+        num_created = 0
+        num_failed = 0
+        errors_file = None if options['errors'] is None else open(options['errors'], 'w')
+        try:
+            with open(options['file'], newline='') as csv_file:
+                reader = csv.DictReader(csv_file)
+                batch = []
+                batch_start = 0
+                for row in reader:
+                    batch.append(row)
+                    if len(batch) == options['batch_size']:
+                        num_batch_created = self.register_batch(batch, batch_start, redis, errors_file, options)
+                        num_created += num_batch_created
+                        num_failed += len(batch) - num_batch_created
+                        batch_start += len(batch)
+                        batch = []
+                        print(f'{batch_start} rows: {num_created} users created, {num_failed} failed '
+                              f'({pytime.monotonic() - start_time:.1f}s)')
+                if len(batch) != 0:
+                    num_batch_created = self.register_batch(batch, batch_start, redis, errors_file, options)
+                    num_created += num_batch_created
+                    num_failed += len(batch) - num_batch_created
+        finally:
+            if errors_file is not None:
+                errors_file.close()
+        print(f'Created {num_created} users ({num_failed} rows failed) in {pytime.monotonic() - start_time:.1f}s')
+
+    @staticmethod
+    def register_batch(batch, batch_start, redis, errors_file, options) -> int:
+        """
+        Registers a batch of rows, reports the rows which failed, and returns the number of users created.
+        """
+        results = BulkUserRegistration.register(batch, redis,
+                                                num_workers=options['workers'],
+                                                chunk_size=options['chunk_size'])
+        for result in results:
+            result['row'] += batch_start
+            if result['error'] is not None:
+                print(f"Row {result['row']} ({result['email_address']}): {result['error']}")
+                if errors_file is not None:
+                    errors_file.write(json.dumps(result) + '\n')
+        return sum(1 for result in results if result['created'])
@@ -0,0 +1,39 @@
+import time as pytime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.ProjectSettings import ProjectSettings
+from backend.fund.FundSimilarity import FundSimilarity
+from backend.redis.RedisManager import RedisManager
+
+
+class Command(BaseCommand):
+    """
+    Computes and caches the most similar funds of every stored fund, scoring whole batches of funds against
+        their candidates at once, so that the similar funds endpoint rarely has to compute them on request.
+    """
+
+    help = 'Computes and caches the most similar funds of every fund.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--metric', choices=FundSimilarity.METRICS, action='append',
+                            help='Similarity metric to cache (repeatable; defaults to every metric).')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Number of funds scored per batch.')
+
+    def handle(self, *args, **options):
+        ProjectSettings.setup_and_validate_settings()
+        redis = RedisManager.shared()
+        if redis is None:
+            raise CommandError('Could not connect to redis')
+
+        start_time = pytime.monotonic()
+        num_cached = 0
+        for fund_ids in redis.scan_fund_ids(options['batch_size']):
+            portfolios = {fund_id: portfolio
+                          for fund_id, (manager_email, _, portfolio) in zip(fund_ids, redis.get_funds(fund_ids))
+                          if manager_email is not None and portfolio is not None}
+            for metric in options['metric'] or FundSimilarity.METRICS:
+                FundSimilarity.cache_batch(portfolios, redis, metric)
+            num_cached += len(portfolios)
+        print(f'Cached the similar funds of {num_cached} funds in {pytime.monotonic() - start_time:.1f}s')
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.ProjectSettings import ProjectSettings
+from backend.redis.RedisDataDump import RedisDataDump
+from backend.redis.RedisManager import RedisManager
+
+
+class Command(BaseCommand):
+    """
+    Exports every user and fund stored in Redis to a file of JSON lines (see RedisDataDump),
+        compressed with gzip or Zstandard if the file ends in .gz or .zst.
+    """
+
+    help = 'Exports every user and fund stored in Redis as JSON lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', required=True,
+                            help='File to write (ending in .gz or .zst to compress it).')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of users or funds read per round trip.')
+        parser.add_argument('--users-only', action='store_true',
+                            help='Only export the users.')
+        parser.add_argument('--funds-only', action='store_true',
+                            help='Only export the funds.')
+
+    def handle(self, *args, **options):
+        ProjectSettings.setup_and_validate_settings()
+        redis = RedisManager.shared()
+        if redis is None:
+            raise CommandError('Could not connect to redis')
+        if options['users_only'] and options['funds_only']:
+            raise CommandError('--users-only and --funds-only are mutually exclusive')
+
+        try:
+            stats = RedisDataDump.export(options['file'], redis,
+                                         batch_size=options['batch_size'],
+                                         include_users=not options['funds_only'],
+                                         include_funds=not options['users_only'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        print(f"Exported {stats['user']} users and {stats['fund']} funds to {options['file']} "
+              f"in {stats['elapsed_sec']:.1f}s ({stats['records_per_sec']:.0f} records/s, "
+              f"{stats['mb_per_sec']:.1f} MB/s of JSON)")
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.ProjectSettings import ProjectSettings
+from backend.redis.RedisDataDump import RedisDataDump
+from backend.redis.RedisManager import RedisManager
+
+
+class Command(BaseCommand):
+    """
+    Imports the users and funds of a file written by exportredisdata (see RedisDataDump) into Redis,
+        and reports the records which couldn't be imported as they are found.
+    """
+
+    help = 'Imports users and funds exported by exportredisdata.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', required=True,
+                            help='File to read (ending in .gz or .zst if it is compressed).')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of users or funds written per round trip.')
+        parser.add_argument('--errors', default=None,
+                            help='File to which the records which failed are written, as JSON lines.')
+
+    def handle(self, *args, **options):
+        ProjectSettings.setup_and_validate_settings()
+        redis = RedisManager.shared()
+        if redis is None:
+            raise CommandError('Could not connect to redis')
+
+        errors_file = None if options['errors'] is None else open(options['errors'], 'w')
+        try:
+            stats = RedisDataDump.load(options['file'], redis,
+                                       batch_size=options['batch_size'],
+                                       errors_file=errors_file)
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            if errors_file is not None:
+                errors_file.close()
+        print(f"Imported {stats['user']} users and {stats['fund']} funds from {options['file']} "
+              f"({stats['failed']} records failed) in {stats['elapsed_sec']:.1f}s "
+              f"({stats['records_per_sec']:.0f} records/s, {stats['mb_per_sec']:.1f} MB/s of JSON)")
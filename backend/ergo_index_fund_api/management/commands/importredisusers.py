@@ -1,6 +1,9 @@
-from decouple import config
+import time as pytime
+from typing import List
+
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 from backend.ProjectSettings import ProjectSettings
 from backend.redis.RedisManager import RedisManager
@@ -8,12 +11,85 @@ from backend.redis.RedisManager import RedisManager
 
 class Command(BaseCommand):
     """
-    Browses entire user base from reddit and ensures the users are also present in Django.
+    Browses the entire user base in Redis and in Django, and reports (or repairs) the users missing from either:
+        + users in Redis but not in Django are registered in Django, without a usable password
+            (so they must reset it before logging in)
+        + users in Django but not in Redis are saved in Redis, named after their email
+    Redis users are streamed with HSCAN and Django users by primary key, both in fixed-size batches checked with a
+        single query each, so memory stays flat regardless of the number of users.
+    Superusers are skipped on the Django side, as admin accounts are not stored in Redis.
     """
 
+    help = 'Reconciles the users stored in Redis with the users registered in Django.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of users checked per round trip.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report the missing users, without repairing them.')
+
     def handle(self, *args, **options):
         ProjectSettings.setup_and_validate_settings()
-        redis = RedisManager()
-        # TODO Get all users from redis.
-        # TODO Check if each user is registered with Django.
-        # TODO If a user is not registered, print a warning.
+        redis = RedisManager.shared()
+        if redis is None:
+            raise CommandError('Could not connect to redis')
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        start_time = pytime.monotonic()
+
+        # Check each user in Redis against Django.
+        num_redis_users = 0
+        num_missing_in_django = 0
+        for user_emails in redis.scan_user_emails(batch_size):
+            registered_emails = set(User.objects.filter(username__in=user_emails)
+                                                .values_list('username', flat=True))
+            missing_emails = [user_email for user_email in user_emails if user_email not in registered_emails]
+            for user_email in missing_emails:
+                print(f'WARNING: User "{user_email}" is in Redis but not registered with Django')
+            if not dry_run and len(missing_emails) != 0:
+                self.register_users(missing_emails)
+            num_redis_users += len(user_emails)
+            num_missing_in_django += len(missing_emails)
+            print(f'...checked {num_redis_users} Redis users ({num_missing_in_django} missing in Django, '
+                  f'{pytime.monotonic() - start_time:.1f}s)')
+
+        # Check each user in Django against Redis, including the ones just registered.
+        num_django_users = 0
+        num_missing_in_redis = 0
+        last_pk = 0
+        while True:
+            users = list(User.objects.filter(pk__gt=last_pk, is_superuser=False)
+                                     .order_by('pk')
+                                     .values_list('pk', 'username')[:batch_size])
+            if len(users) == 0:
+                break
+            last_pk = users[-1][0]
+            user_emails = [username for _, username in users]
+            user_names = redis.get_user_names(user_emails)
+            if user_names is None:
+                raise CommandError(f'Could not read the names of {len(user_emails)} users from redis')
+            missing_emails = [user_email for user_email, user_name in zip(user_emails, user_names)
+                              if user_name is None]
+            for user_email in missing_emails:
+                print(f'WARNING: User "{user_email}" is registered with Django but not in Redis')
+            if not dry_run and len(missing_emails) != 0:
+                if not redis.save_new_users({user_email: '' for user_email in missing_emails}):
+                    raise CommandError(f'Could not save {len(missing_emails)} users in redis')
+            num_django_users += len(users)
+            num_missing_in_redis += len(missing_emails)
+            print(f'...checked {num_django_users} Django users ({num_missing_in_redis} missing in Redis, '
+                  f'{pytime.monotonic() - start_time:.1f}s)')
+
+        action = 'Found' if dry_run else 'Repaired'
+        print(f'{action} {num_missing_in_django} of {num_redis_users} Redis users missing in Django and '
+              f'{num_missing_in_redis} of {num_django_users} Django users missing in Redis '
+              f'in {pytime.monotonic() - start_time:.1f}s')
+
+    @staticmethod
+    def register_users(user_emails: List[str]) -> None:
+        """
+        Registers the users with Django, with unusable passwords, ignoring the ones registered in the meantime.
+        """
+        User.objects.bulk_create([User(username=user_email, password=make_password(None))
+                                  for user_email in user_emails],
+                                 ignore_conflicts=True)
@@ -0,0 +1,32 @@
+import time as pytime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.ProjectSettings import ProjectSettings
+from backend.redis.RedisManager import RedisManager
+
+
+class Command(BaseCommand):
+    """
+    Adds every stored fund to the sorted index of fund ids behind the fund listing endpoint, streaming the funds
+        in batches (with HSCAN in the legacy key layout) so memory stays flat, and converts each user's fund ids
+        from a set into the sorted set which the endpoint pages through.
+    Funds saved since the index was introduced are already in it, so this only needs to run once after deploying.
+    """
+
+    help = 'Indexes the ids of every stored fund, and of each user\'s funds, for the fund listing endpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of funds indexed per Redis round trip.')
+
+    def handle(self, *args, **options):
+        ProjectSettings.setup_and_validate_settings()
+        redis = RedisManager.shared()
+        if redis is None:
+            raise CommandError('Could not connect to redis')
+        start_time = pytime.monotonic()
+        num_funds = redis.rebuild_fund_ids_index(options['batch_size'])
+        num_users = redis.convert_user_fund_ids(options['batch_size'])
+        print(f'Indexed the ids of {num_funds} funds, and converted the fund ids of {num_users} users, '
+              f'in {pytime.monotonic() - start_time:.1f}s')
@@ -0,0 +1,49 @@
+import time as pytime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.ProjectSettings import ProjectSettings
+from backend.redis.RedisManager import LEGACY_FUND_HASHES, LEGACY_USER_HASHES, RedisManager
+
+
+class Command(BaseCommand):
+    """
+    Copies every user/fund field out of the global legacy hashes (i.e. 'fund_portfolio') into
+        one hash per user/fund, so the data can be sharded across a Redis Cluster.
+    Streams each hash with HSCAN, so it can be run against any amount of data.
+    Set REDIS_KEY_LAYOUT=entity once it has completed.
+    """
+
+    help = 'Moves user and fund fields from global hashes into per-user and per-fund hashes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of hash fields to move per round trip.')
+        parser.add_argument('--keep-legacy', action='store_true',
+                            help='Keep the global hashes after copying their fields.')
+
+    def handle(self, *args, **options):
+        ProjectSettings.setup_and_validate_settings()
+        redis = RedisManager.shared()
+        if redis is None:
+            raise CommandError('Could not connect to redis')
+        batch_size = options['batch_size']
+        start_time = pytime.monotonic()
+
+        legacy_hashes = [(RedisManager.user_key, field, legacy_hash)
+                         for field, legacy_hash in LEGACY_USER_HASHES.items()]
+        legacy_hashes += [(RedisManager.fund_key, field, legacy_hash)
+                          for field, legacy_hash in LEGACY_FUND_HASHES.items()]
+        for entity_key, field, legacy_hash in legacy_hashes:
+            num_moved = 0
+            for batch in redis.scan_hash(legacy_hash, batch_size):
+                pipe = redis.client.pipeline(transaction=False)
+                for entity_id, value in batch.items():
+                    pipe.hset(entity_key(entity_id.decode('utf-8')), field, value)
+                pipe.execute()
+                if not options['keep_legacy']:
+                    redis.client.hdel(legacy_hash, *batch.keys())
+                num_moved += len(batch)
+                print(f'...moved {num_moved} fields of "{legacy_hash}"')
+
+        print(f'Moved all legacy hashes in {pytime.monotonic() - start_time:.1f}s')
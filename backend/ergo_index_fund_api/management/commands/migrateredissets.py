@@ -0,0 +1,93 @@
+import time as pytime
+from typing import Dict, List
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.ProjectSettings import ProjectSettings
+from backend.redis.RedisManager import RedisManager
+
+
+class Command(BaseCommand):
+    """
+    Converts the comma-separated 'fund_investor_emails' and 'user_fund_ids' hash fields into
+        per-fund Redis sets and per-user sorted sets, and builds the user -> funds reverse index.
+    Streams each hash with HSCAN, so it can be run against any amount of data.
+    """
+
+    help = 'Converts comma-separated fund membership fields into Redis sets.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of hash fields to convert per round trip.')
+        parser.add_argument('--keep-legacy', action='store_true',
+                            help='Keep the old comma-separated hash fields after converting them.')
+
+    def handle(self, *args, **options):
+        ProjectSettings.setup_and_validate_settings()
+        redis = RedisManager.shared()
+        if redis is None:
+            raise CommandError('Could not connect to redis')
+        batch_size = options['batch_size']
+        delete_legacy = not options['keep_legacy']
+        start_time = pytime.monotonic()
+
+        # Each fund's manager participates in the fund.
+        num_managers = 0
+        for batch in redis.scan_hash('fund_manager_email', batch_size):
+            pipe = redis.client.pipeline(transaction=False)
+            for fund_id, manager_email in batch.items():
+                if len(manager_email) != 0:
+                    pipe.zadd(RedisManager.user_fund_ids_key(manager_email.decode('utf-8')), {fund_id: 0})
+            pipe.execute()
+            num_managers += len(batch)
+            print(f'...indexed {num_managers} fund managers')
+
+        # Convert each fund's investors, adding the fund to each investor's funds.
+        num_funds = 0
+        for batch in redis.scan_hash('fund_investor_emails', batch_size):
+            pipe = redis.client.pipeline(transaction=False)
+            for fund_id, investor_emails_str in batch.items():
+                investor_emails = self._split(investor_emails_str)
+                if len(investor_emails) == 0:
+                    continue
+                pipe.sadd(RedisManager.fund_investor_emails_key(fund_id.decode('utf-8')), *investor_emails)
+                for investor_email in investor_emails:
+                    pipe.zadd(RedisManager.user_fund_ids_key(investor_email), {fund_id: 0})
+            self._queue_delete(pipe, 'fund_investor_emails', batch, delete_legacy)
+            pipe.execute()
+            num_funds += len(batch)
+            print(f'...converted investors of {num_funds} funds')
+
+        # Merge in each user's previously stored funds.
+        num_users = 0
+        for batch in redis.scan_hash('user_fund_ids', batch_size):
+            pipe = redis.client.pipeline(transaction=False)
+            for user_email, fund_ids_str in batch.items():
+                fund_ids = self._split(fund_ids_str)
+                if len(fund_ids) != 0:
+                    pipe.zadd(RedisManager.user_fund_ids_key(user_email.decode('utf-8')),
+                              {fund_id: 0 for fund_id in fund_ids})
+            self._queue_delete(pipe, 'user_fund_ids', batch, delete_legacy)
+            pipe.execute()
+            num_users += len(batch)
+            print(f'...converted funds of {num_users} users')
+
+        print(f'Converted {num_funds} funds and {num_users} users in {pytime.monotonic() - start_time:.1f}s')
+
+    @staticmethod
+    def _split(value: bytes) -> List[str]:
+        """
+        Splits a comma-separated hash field, dropping blank entries.
+        """
+        return [item for item in value.decode('utf-8').split(',') if len(item.strip()) != 0]
+
+    @staticmethod
+    def _queue_delete(pipe,
+                      name: str,
+                      batch: Dict[bytes, bytes],
+                      delete_legacy: bool) -> None:
+        """
+        Queues the removal of the converted fields from the old hash.
+        """
+        if delete_legacy:
+            pipe.hdel(name, *batch.keys())
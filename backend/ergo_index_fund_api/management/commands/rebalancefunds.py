@@ -0,0 +1,87 @@
+import json
+import time as pytime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.ProjectSettings import ProjectSettings
+from backend.fund.RebalanceEngine import RebalanceEngine
+from backend.price.PriceOracle import PriceOracle
+from backend.redis.RedisManager import RedisManager
+
+
+class Command(BaseCommand):
+    """
+    Computes the drift and rebalance orders of many funds, given their holdings and token prices,
+        and writes one JSON plan per line.
+    """
+
+    help = 'Computes rebalance orders for funds, from holdings and prices JSON files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--holdings', required=True,
+                            help='JSON file of each fund\'s holdings, i.e. {"fund_id": {"BTC": 0.5}}.')
+        parser.add_argument('--prices', default=None,
+                            help='JSON file of token prices, i.e. {"BTC": 50000} (defaults to the price oracle).')
+        parser.add_argument('--all-funds', action='store_true',
+                            help='Rebalance every stored fund, not only those in the holdings file.')
+        parser.add_argument('--min-drift-pct', type=float, default=0,
+                            help='Skip tokens within this many percent of their target weight.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of funds per vectorized batch (and per Redis round trip).')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of processes computing batches (defaults to the number of CPUs).')
+        parser.add_argument('--output', default=None,
+                            help='File to write the plans to, instead of printing them.')
+
+    def handle(self, *args, **options):
+        ProjectSettings.setup_and_validate_settings()
+        redis = RedisManager.shared()
+        if redis is None:
+            raise CommandError('Could not connect to redis')
+        with open(options['holdings']) as holdings_file:
+            holdings = json.load(holdings_file)
+        prices = None
+        if options['prices'] is not None:
+            with open(options['prices']) as prices_file:
+                prices = json.load(prices_file)
+        start_time = pytime.monotonic()
+
+        # Load the portfolios in batches.
+        if options['all_funds']:
+            fund_id_batches = redis.scan_fund_ids(options['batch_size'])
+        else:
+            fund_ids = list(holdings.keys())
+            fund_id_batches = (fund_ids[batch_start:batch_start + options['batch_size']]
+                               for batch_start in range(0, len(fund_ids), options['batch_size']))
+        portfolios = {}
+        for fund_ids in fund_id_batches:
+            for fund_id, (manager_email, _, portfolio) in zip(fund_ids, redis.get_funds(fund_ids)):
+                if manager_email is not None and portfolio is not None:
+                    portfolios[fund_id] = portfolio
+        print(f'Loaded {len(portfolios)} portfolios in {pytime.monotonic() - start_time:.1f}s')
+        if prices is None:
+            prices = PriceOracle.shared().get_prices([str(token.token) for portfolio in portfolios.values()
+                                                      for token in portfolio.tokens]
+                                                     + [token for fund_holdings in holdings.values()
+                                                        for token in fund_holdings])
+            print(f'Priced {len(prices)} tokens in {pytime.monotonic() - start_time:.1f}s')
+
+        # Compute and write the plans.
+        plans = RebalanceEngine.rebalance(portfolios=portfolios,
+                                          holdings=holdings,
+                                          prices=prices,
+                                          min_drift_pct=options['min_drift_pct'],
+                                          batch_size=options['batch_size'],
+                                          num_workers=options['workers'])
+        output_file = None if options['output'] is None else open(options['output'], 'w')
+        try:
+            for plan in plans:
+                if output_file is None:
+                    print(plan)
+                else:
+                    output_file.write(f'{plan}\n')
+        finally:
+            if output_file is not None:
+                output_file.close()
+        num_orders = sum(len(plan.orders) for plan in plans)
+        print(f'Computed {num_orders} orders for {len(plans)} funds in {pytime.monotonic() - start_time:.1f}s')
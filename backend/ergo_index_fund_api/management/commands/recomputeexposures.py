@@ -0,0 +1,30 @@
+import time as pytime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.ProjectSettings import ProjectSettings
+from backend.redis.RedisManager import RedisManager
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the cross-fund exposure of every token (number of funds holding it, and their summed
+        portfolio_pct) from the stored portfolios, which are streamed in batches (with HSCAN in the legacy
+        key layout) so memory stays flat.
+    """
+
+    help = 'Recomputes token exposure aggregates from every stored portfolio.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of funds loaded per Redis round trip.')
+
+    def handle(self, *args, **options):
+        ProjectSettings.setup_and_validate_settings()
+        redis = RedisManager.shared()
+        if redis is None:
+            raise CommandError('Could not connect to redis')
+        start_time = pytime.monotonic()
+        num_funds = redis.recompute_token_exposures(options['batch_size'])
+        print(f'Recomputed the exposures of {len(redis.get_token_exposures())} tokens from {num_funds} funds '
+              f'in {pytime.monotonic() - start_time:.1f}s')
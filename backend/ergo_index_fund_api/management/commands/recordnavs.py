@@ -0,0 +1,59 @@
+import time as pytime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.ProjectSettings import ProjectSettings
+from backend.fund.FundNavSnapshot import FundNavSnapshot
+from backend.price.PriceOracle import PriceOracle
+from backend.redis.RedisManager import RedisManager
+
+
+class Command(BaseCommand):
+    """
+    Periodically values every stored fund at the price oracle's prices, and records the values in each
+        fund's NAV time series (which rolls them up into 1m/1h/1d buckets as they are written).
+    """
+
+    help = 'Records a NAV snapshot of every fund, once or at a fixed interval.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval-sec', type=float, default=60,
+                            help='Seconds between snapshots of every fund.')
+        parser.add_argument('--once', action='store_true',
+                            help='Record a single snapshot of every fund, then exit.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of funds loaded, priced and written per batch.')
+
+    def handle(self, *args, **options):
+        ProjectSettings.setup_and_validate_settings()
+        redis = RedisManager.shared()
+        price_oracle = PriceOracle.shared()
+        if redis is None or price_oracle is None:
+            raise CommandError('Could not connect to redis')
+
+        while True:
+            start_time = pytime.monotonic()
+            num_recorded = 0
+            num_skipped = 0
+            for fund_ids in redis.scan_fund_ids(options['batch_size']):
+                portfolios = {fund_id: portfolio
+                              for fund_id, (manager_email, _, portfolio) in zip(fund_ids, redis.get_funds(fund_ids))
+                              if manager_email is not None and portfolio is not None}
+                prices = price_oracle.get_prices(str(token.token) for portfolio in portfolios.values()
+                                                 for token in portfolio.tokens)
+                now = pytime.time()
+                snapshots = []
+                for fund_id, portfolio in portfolios.items():
+                    snapshot = FundNavSnapshot.from_portfolio(fund_id, portfolio, prices, now)
+                    if snapshot is not None:
+                        snapshots.append(snapshot)
+                if not redis.add_nav_snapshots(snapshots):
+                    raise CommandError(f'Could not write {len(snapshots)} NAV snapshots')
+                num_recorded += len(snapshots)
+                num_skipped += len(fund_ids) - len(snapshots)
+            elapsed_sec = pytime.monotonic() - start_time
+            print(f'Recorded {num_recorded} NAV snapshots ({num_skipped} funds skipped: missing, empty or unpriced) '
+                  f'in {elapsed_sec:.1f}s')
+            if options['once']:
+                return
+            pytime.sleep(max(0, options['interval_sec'] - elapsed_sec))
@@ -0,0 +1,38 @@
+import time as pytime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.ProjectSettings import ProjectSettings
+from backend.redis.RedisManager import RedisManager
+
+
+class Command(BaseCommand):
+    """
+    Rewrites every stored portfolio in the configured REDIS_PORTFOLIO_ENCODING (i.e. JSON -> binary).
+    Streams the fund ids in batches, so it can run in the background against any number of funds.
+    """
+
+    help = 'Re-encodes stored portfolios in the configured portfolio encoding.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of portfolios to read per round trip.')
+        parser.add_argument('--pause-sec', type=float, default=0,
+                            help='Seconds to sleep between batches, to limit the load on Redis.')
+
+    def handle(self, *args, **options):
+        ProjectSettings.setup_and_validate_settings()
+        redis = RedisManager.shared()
+        if redis is None:
+            raise CommandError('Could not connect to redis')
+        start_time = pytime.monotonic()
+        num_funds = 0
+        num_reencoded = 0
+        for fund_ids in redis.scan_fund_ids(options['batch_size']):
+            num_reencoded += redis.reencode_portfolios(fund_ids)
+            num_funds += len(fund_ids)
+            print(f'...re-encoded {num_reencoded} of {num_funds} portfolios')
+            if options['pause_sec'] > 0:
+                pytime.sleep(options['pause_sec'])
+        print(f'Re-encoded {num_reencoded} of {num_funds} portfolios as "{redis.portfolio_encoding}" '
+              f'in {pytime.monotonic() - start_time:.1f}s')
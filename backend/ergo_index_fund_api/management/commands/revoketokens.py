@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.ProjectSettings import ProjectSettings
+from backend.redis.RedisManager import RedisManager
+from backend.util import clean_email
+
+
+class Command(BaseCommand):
+    """
+    Revokes every access and refresh token issued to some users, i.e. after their account was compromised.
+    """
+
+    help = 'Revokes every token issued to the given users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('emails', nargs='+',
+                            help='Emails of the users whose tokens are revoked.')
+
+    def handle(self, *args, **options):
+        ProjectSettings.setup_and_validate_settings()
+        redis = RedisManager.shared()
+        if redis is None:
+            raise CommandError('Could not connect to redis')
+
+        for email in options['emails']:
+            token_version = redis.revoke_user_tokens(clean_email(email))
+            if token_version is None:
+                raise CommandError(f'Could not revoke the tokens of {email}')
+            print(f'Revoked the tokens of {email} (now at token version {token_version})')
@@ -0,0 +1,61 @@
+import time as pytime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.ProjectSettings import ProjectSettings
+from backend.fund.TriggerEngine import TriggerEngine
+from backend.price.FilePriceFeed import FilePriceFeed
+from backend.price.SocketPriceFeed import SocketPriceFeed
+from backend.redis.RedisManager import RedisManager, TRIGGER_EVENTS_STREAM
+
+
+class Command(BaseCommand):
+    """
+    Streams price ticks from a file or socket through the TriggerEngine, which appends an event to the
+        trigger events stream whenever a fund's buy/sell target is crossed.
+    """
+
+    help = 'Runs the price-tick trigger engine on a file or socket price feed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=None,
+                            help='File of ticks to replay, one "token,price[,timestamp]" or JSON object per line.')
+        parser.add_argument('--follow', action='store_true',
+                            help='Keep waiting for ticks appended to the file.')
+        parser.add_argument('--socket', default=None,
+                            help='host:port of a TCP server sending one tick per line.')
+        parser.add_argument('--batch-size', type=int, default=1,
+                            help='Number of ticks per Redis round trip (keep at 1 for live feeds).')
+        parser.add_argument('--rebuild-index', action='store_true',
+                            help='Rebuild the token and buy/sell target indexes from the stored portfolios first.')
+
+    def handle(self, *args, **options):
+        ProjectSettings.setup_and_validate_settings()
+        redis = RedisManager.shared()
+        if redis is None:
+            raise CommandError('Could not connect to redis')
+        if options['file'] is not None and options['socket'] is not None:
+            raise CommandError('Only one of --file or --socket can be given')
+        if options['file'] is None and options['socket'] is None and not options['rebuild_index']:
+            raise CommandError('One of --file or --socket is required')
+        start_time = pytime.monotonic()
+
+        if options['rebuild_index']:
+            num_indexed = redis.rebuild_token_indexes()
+            print(f'Indexed the tokens and targets of {num_indexed} funds in {pytime.monotonic() - start_time:.1f}s')
+        if options['file'] is not None:
+            feed = FilePriceFeed(options['file'], follow=options['follow'])
+        elif options['socket'] is not None:
+            host, port = options['socket'].rsplit(':', 1)
+            feed = SocketPriceFeed(host, int(port))
+        else:
+            return
+
+        engine = TriggerEngine(redis)
+        start_time = pytime.monotonic()
+        try:
+            engine.run(feed, batch_size=options['batch_size'])
+        except KeyboardInterrupt:
+            pass
+        print(f'Processed {engine.num_ticks} ticks into {engine.num_events} events on "{TRIGGER_EVENTS_STREAM}" '
+              f'in {pytime.monotonic() - start_time:.1f}s')
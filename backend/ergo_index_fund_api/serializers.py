@@ -0,0 +1,22 @@
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+
+from backend.redis.RedisManager import RedisManager
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Issues tokens carrying the claims which ClaimsJWTAuthentication trusts instead of loading the user:
+        the username, superuser flag and current token version of the user.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        redis = RedisManager.shared()
+        token_version = None if redis is None else redis.get_token_version(user.username)
+        if token_version is None:
+            raise ValueError('Could not load the token version of the user')
+        token = super().get_token(user)
+        token['username'] = user.username
+        token['is_superuser'] = user.is_superuser
+        token['token_version'] = token_version
+        return token
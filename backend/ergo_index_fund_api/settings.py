@@ -105,6 +105,10 @@ DATABASES = {
         'PASSWORD': config('POSTGRES_PASSWORD', cast=str),
         'HOST':     'ergo_index_fund_sql_container',
         'PORT':     config('POSTGRES_PORT', cast=int),
+
+        # Keep connections open across requests (for the paths which still need SQL), instead of reconnecting
+        # on every request.
+        'CONN_MAX_AGE': config('POSTGRES_CONN_MAX_AGE', default=60, cast=int),
     }
 }
 
@@ -145,7 +149,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'ergo_index_fund_api.authentication.ClaimsJWTAuthentication',
     ),
 }
 
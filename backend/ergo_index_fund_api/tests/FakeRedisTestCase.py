@@ -0,0 +1,40 @@
+import os
+import unittest
+
+import fakeredis
+
+from backend.redis.LocalCache import LocalCache
+from backend.redis.RedisManager import KEY_LAYOUT_LEGACY, RedisManager
+
+
+class FakeRedisTestCase(unittest.TestCase):
+    """
+    Runs each test against its own empty in-memory Redis (fakeredis, with Lua scripting), through the manager
+        returned by RedisManager.shared(), so tests need neither a Redis server nor Django settings.
+    """
+
+    # Key layout of the manager under test.
+    key_layout: str = KEY_LAYOUT_LEGACY
+
+    # Class attributes of RedisManager replaced for each test, and restored after it.
+    SWAPPED_ATTRIBUTES = ['_client', '_client_pid', '_shared', '_ready', '_replicas', '_replica_freshness',
+                          'is_cluster', 'key_layout']
+
+    def setUp(self):
+        self.saved_attributes = {name: RedisManager.__dict__[name] for name in self.SWAPPED_ATTRIBUTES}
+        RedisManager._client = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        RedisManager._client_pid = os.getpid()
+        RedisManager._shared = None
+        RedisManager._ready = True
+        RedisManager._replicas = []
+        RedisManager._replica_freshness = {}
+        RedisManager.is_cluster = False
+        RedisManager.key_layout = self.key_layout
+        LocalCache.clear_everywhere()
+        self.redis = RedisManager.shared()
+        self.assertIsNotNone(self.redis)
+
+    def tearDown(self):
+        for name, value in self.saved_attributes.items():
+            setattr(RedisManager, name, value)
+        LocalCache.clear_everywhere()
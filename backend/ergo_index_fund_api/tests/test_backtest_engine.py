@@ -0,0 +1,110 @@
+import math
+import unittest
+from typing import Dict
+
+import numpy as np
+
+from backend.fund.BacktestEngine import BacktestEngine
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.PriceHistory import PriceHistory
+from backend.fund.TokenAllocation import TokenAllocation
+
+
+class BacktestEngineTest(unittest.TestCase):
+    """
+    Checks the trades, fees and values of backtests against step by step simulations.
+    """
+
+    @staticmethod
+    def history(prices: Dict[str, list]) -> PriceHistory:
+        tokens = list(prices.keys())
+        return PriceHistory(np.arange(len(prices[tokens[0]])) * 60, tokens,
+                            np.array([prices[token] for token in tokens], dtype=float).T)
+
+    @staticmethod
+    def reference(portfolio: FundPortfolio,
+                  history: PriceHistory,
+                  buy_scale: float,
+                  sell_scale: float,
+                  initial_value: float,
+                  fee: float,
+                  start_invested: bool) -> Dict:
+        # One sleeve per token, stepped through time one price at a time.
+        total_pct = sum(float(token.portfolio_pct) for token in portfolio.tokens)
+        navs = np.zeros(len(history))
+        num_trades = 0
+        traded_value = 0
+        for token in portfolio.tokens:
+            prices = history.token_prices([str(token.token)])[:, 0]
+            value = initial_value * float(token.portfolio_pct) / total_pct
+            holding = start_invested
+            for step, price in enumerate(prices):
+                if step > 0 and holding and math.isfinite(price) and math.isfinite(prices[step - 1]):
+                    value *= price / prices[step - 1]
+                if not math.isfinite(price):
+                    signal = 0
+                elif price <= float(token.buy_target) * buy_scale:
+                    signal = 1
+                else:
+                    signal = -1 if price >= float(token.sell_target) * sell_scale else 0
+                if signal == 1 and not holding or signal == -1 and holding:
+                    holding = not holding
+                    num_trades += 1
+                    traded_value += value
+                    value *= 1 - fee
+                navs[step] += value
+        return {'final_value': navs[-1],
+                'num_trades':  num_trades,
+                'turnover':    traded_value / navs.mean()}
+
+    def test_single_token(self):
+        portfolio = FundPortfolio(tokens=[TokenAllocation(token='ERG', portfolio_pct=100, buy_target=1, sell_target=3)])
+        history = self.history({'ERG': [2, 1, 2, 3, 1.5]})
+        result, = BacktestEngine.backtest({'fund': portfolio}, history, initial_value=1000, fee_pct=1, num_workers=1)
+        # Buys at 1 (paying 1% of 1000), triples, then sells at 3 (paying 1% of 2970).
+        self.assertAlmostEqual(result.final_value, 2940.3)
+        self.assertAlmostEqual(result.return_pct, 194.03)
+        self.assertAlmostEqual(result.benchmark_return_pct, -25)
+        self.assertAlmostEqual(result.max_drawdown_pct, 1)
+        self.assertEqual(result.num_trades, 2)
+        self.assertAlmostEqual(result.turnover, (1000 + 2970) / np.mean([1000, 990, 1980, 2940.3, 2940.3]))
+
+    def test_start_invested(self):
+        portfolio = FundPortfolio(tokens=[TokenAllocation(token='ERG', portfolio_pct=100, buy_target=1, sell_target=3)])
+        history = self.history({'ERG': [2, 2.5, 3, 2]})
+        result, = BacktestEngine.backtest({'fund': portfolio}, history, initial_value=1000, fee_pct=1,
+                                          start_invested=True, num_workers=1)
+        self.assertAlmostEqual(result.final_value, 1500 * 0.99)
+        self.assertEqual(result.num_trades, 1)
+
+    def test_matches_step_by_step_simulation(self):
+        random = np.random.RandomState(3)
+        prices = {'ERG': np.exp(np.cumsum(random.normal(scale=0.05, size=300))),
+                  'SigUSD': 1 + random.normal(scale=0.02, size=300),
+                  'BTC': np.exp(np.cumsum(random.normal(scale=0.03, size=300)))}
+        prices['BTC'][:40] = np.nan
+        history = self.history(prices)
+        portfolio = FundPortfolio(tokens=[TokenAllocation(token='ERG', portfolio_pct=50, buy_target=0.9,
+                                                          sell_target=1.2),
+                                          TokenAllocation(token='SigUSD', portfolio_pct=30, buy_target=0.98,
+                                                          sell_target=1.02),
+                                          TokenAllocation(token='BTC', portfolio_pct=20, buy_target=0.95,
+                                                          sell_target=1.1)])
+        for start_invested in [False, True]:
+            results = BacktestEngine.backtest({'fund': portfolio}, history, buy_scales=[0.9, 1, 1.1],
+                                              sell_scales=[0.9, 1.2], fee_pct=0.5, start_invested=start_invested,
+                                              num_workers=1, max_cells=2000)
+            self.assertEqual(len(results), 6)
+            for result in results:
+                expected = self.reference(portfolio, history, result.buy_scale, result.sell_scale, 10000, 0.005,
+                                          start_invested)
+                self.assertAlmostEqual(result.final_value, expected['final_value'], places=6)
+                self.assertEqual(result.num_trades, expected['num_trades'])
+                self.assertGreater(result.num_trades, 0)
+                self.assertAlmostEqual(result.turnover, expected['turnover'], places=9)
+
+    def test_scenarios_too_large(self):
+        portfolio = FundPortfolio(tokens=[TokenAllocation(token='ERG', portfolio_pct=100, buy_target=1, sell_target=3)])
+        with self.assertRaises(ValueError):
+            BacktestEngine.backtest({'fund': portfolio}, self.history({'ERG': [1] * 100}), num_workers=1,
+                                    max_cells=10)
@@ -0,0 +1,72 @@
+import unittest
+
+import numpy as np
+
+from backend.fund.Downsampler import Downsampler
+
+
+class DownsamplerTest(unittest.TestCase):
+    """
+    Checks the points kept by each downsampling method.
+    """
+
+    def setUp(self):
+        random = np.random.RandomState(7)
+        self.x = np.arange(1000) * 60
+        self.y = np.cumsum(random.normal(size=1000))
+
+    @staticmethod
+    def reference_lttb(x: np.ndarray,
+                       y: np.ndarray,
+                       num_points: int) -> list:
+        # Point by point Largest-Triangle-Three-Buckets, with the same buckets as Downsampler.lttb.
+        bucket_edges = np.linspace(1, len(x) - 1, num_points - 1).astype(int)
+        kept = [0]
+        for bucket in range(num_points - 2):
+            start, end = bucket_edges[bucket], bucket_edges[bucket + 1]
+            if bucket + 1 < num_points - 2:
+                next_start, next_end = bucket_edges[bucket + 1], bucket_edges[bucket + 2]
+                next_x, next_y = np.mean(x[next_start:next_end]), np.mean(y[next_start:next_end])
+            else:
+                next_x, next_y = x[-1], y[-1]
+            previous = kept[-1]
+            best_area, best = -1, None
+            for idx in range(start, end):
+                area = abs((x[previous] - next_x) * (y[idx] - y[previous])
+                           - (x[previous] - x[idx]) * (next_y - y[previous]))
+                if area > best_area:
+                    best_area, best = area, idx
+            kept.append(best)
+        return kept + [len(x) - 1]
+
+    def test_short_series_are_kept_whole(self):
+        for method in [Downsampler.LTTB, Downsampler.MIN_MAX]:
+            self.assertEqual(list(Downsampler.downsample(self.x[:10], self.y[:10], 10, method)), list(range(10)))
+            self.assertEqual(list(Downsampler.downsample(self.x[:10], self.y[:10], 50, method)), list(range(10)))
+            self.assertEqual(list(Downsampler.downsample(self.x, self.y, 2, method)), [0, 999])
+
+    def test_lttb_matches_reference(self):
+        for num_points in [3, 10, 101, 500]:
+            kept = Downsampler.lttb(self.x, self.y, num_points)
+            self.assertEqual(list(kept), self.reference_lttb(self.x, self.y, num_points), num_points)
+
+    def test_lttb_keeps_spikes(self):
+        y = np.zeros(1000)
+        y[437] = 100
+        kept = Downsampler.lttb(self.x, y, 20)
+        self.assertEqual(len(kept), 20)
+        self.assertIn(437, kept)
+
+    def test_min_max_keeps_extremes_of_each_bucket(self):
+        kept = Downsampler.min_max(self.x, self.y, 42)
+        self.assertLessEqual(len(kept), 42)
+        self.assertEqual(list(kept), sorted(set(kept)))
+        self.assertEqual((kept[0], kept[-1]), (0, 999))
+        for bucket in range(20):
+            start, end = bucket * 50, (bucket + 1) * 50
+            self.assertIn(start + int(np.argmin(self.y[start:end])), kept)
+            self.assertIn(start + int(np.argmax(self.y[start:end])), kept)
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            Downsampler.downsample(self.x, self.y, 10, 'average')
@@ -0,0 +1,48 @@
+from backend.ergo_index_fund_api.tests.FakeRedisTestCase import FakeRedisTestCase
+from backend.fund.FundListing import FundListing
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.TokenAllocation import TokenAllocation
+
+
+class FundListingTest(FakeRedisTestCase):
+    """
+    Checks that a user's funds are listed a page at a time, in order of id, from the user's sorted set of fund ids.
+    """
+
+    def setUp(self):
+        super().setUp()
+        portfolio = FundPortfolio(tokens=[TokenAllocation(token='ERG', portfolio_pct=100, buy_target=1, sell_target=2)])
+        for idx in range(250):
+            manager_email = 'user@example.com' if idx % 3 == 0 else 'other@example.com'
+            investor_emails = ['user@example.com'] if idx % 3 == 1 else []
+            self.assertTrue(self.redis.save_fund(f'fund{idx:03}', manager_email, investor_emails, portfolio).saved)
+
+    def list_all(self,
+                 scope: str,
+                 page_size: int) -> list:
+        pages = []
+        cursor = None
+        while True:
+            funds, cursor = FundListing.list_funds(self.redis, scope, 'user@example.com', cursor, page_size)
+            pages.append([fund['fund_id'] for fund in funds])
+            if cursor is None:
+                return pages
+
+    def test_pages(self):
+        managed = [f'fund{idx:03}' for idx in range(250) if idx % 3 == 0]
+        invested = [f'fund{idx:03}' for idx in range(250) if idx % 3 == 1]
+        for page_size in [5, 7, 84, 200]:
+            pages = self.list_all(FundListing.MANAGED, page_size)
+            self.assertEqual(sum(pages, []), managed)
+            self.assertTrue(all(len(page) == page_size for page in pages[:-1]))
+            self.assertEqual(sum(self.list_all(FundListing.INVESTED, page_size), []), invested)
+
+    def test_sets_are_converted(self):
+        key = self.redis.user_fund_ids_key('user@example.com')
+        fund_ids = self.redis.get_user_fund_ids('user@example.com')
+        self.redis.client.delete(key)
+        self.redis.client.sadd(key, *fund_ids)
+        self.assertEqual(self.redis.convert_user_fund_ids(), 1)
+        self.assertEqual(self.redis.client.type(key), b'zset')
+        self.assertEqual(self.redis.get_user_fund_ids('user@example.com'), fund_ids)
+        self.assertEqual(self.redis.convert_user_fund_ids(), 0)
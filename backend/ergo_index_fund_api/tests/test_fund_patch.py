@@ -0,0 +1,53 @@
+from backend.ergo_index_fund_api.tests.FakeRedisTestCase import FakeRedisTestCase
+from backend.fund.FundPatch import FundPatch
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.TokenAllocation import TokenAllocation
+
+
+class FundPatchTest(FakeRedisTestCase):
+    """
+    Checks that patches apply on top of the fund's latest version, and that patches made against an older version
+        are refused.
+    """
+
+    def setUp(self):
+        super().setUp()
+        portfolio = FundPortfolio(tokens=[TokenAllocation(token='ERG', portfolio_pct=60, buy_target=1, sell_target=2),
+                                          TokenAllocation(token='SigUSD', portfolio_pct=40, buy_target=1,
+                                                          sell_target=2)])
+        result = self.redis.save_fund('fund', 'manager@example.com', [], portfolio)
+        self.assertEqual((result.saved, result.version), (True, 1))
+
+    def portfolio_json(self) -> dict:
+        return {token['token']: token for token in self.redis.get_fund_portfolio('fund').to_json()['tokens']}
+
+    def test_patch_applies(self):
+        result = self.redis.patch_fund('fund', FundPatch(set_tokens=[{'token': 'ERG', 'sell_target': 3}],
+                                                         remove_tokens=['SigUSD'],
+                                                         version=1))
+        self.assertEqual((result.saved, result.version), (True, 2))
+        self.assertEqual(result.changes['removed_tokens'], ['SigUSD'])
+        tokens = self.portfolio_json()
+        self.assertEqual(list(tokens.keys()), ['ERG'])
+        self.assertEqual(tokens['ERG']['sell_target'], 3)
+
+    def test_stale_patch_is_refused(self):
+        self.assertTrue(self.redis.patch_fund('fund', FundPatch(set_tokens=[{'token': 'ERG', 'sell_target': 3}],
+                                                                version=1)).saved)
+        result = self.redis.patch_fund('fund', FundPatch(set_tokens=[{'token': 'ERG', 'sell_target': 4}],
+                                                         version=1))
+        self.assertEqual((result.saved, result.is_stale, result.version), (False, True, 2))
+        self.assertEqual(self.portfolio_json()['ERG']['sell_target'], 3)
+
+    def test_unversioned_patch_applies_to_the_latest_version(self):
+        self.assertTrue(self.redis.patch_fund('fund', FundPatch(set_tokens=[{'token': 'ERG', 'sell_target': 3}],
+                                                                version=1)).saved)
+        result = self.redis.patch_fund('fund', FundPatch(set_tokens=[{'token': 'SigUSD', 'sell_target': 4}]))
+        self.assertEqual((result.saved, result.version), (True, 3))
+        tokens = self.portfolio_json()
+        self.assertEqual((tokens['ERG']['sell_target'], tokens['SigUSD']['sell_target']), (3, 4))
+
+    def test_patch_by_another_manager_is_refused(self):
+        result = self.redis.patch_fund('fund', FundPatch(remove_tokens=['SigUSD']), manager_email='other@example.com')
+        self.assertEqual((result.saved, result.conflicting_manager_email), (False, 'manager@example.com'))
+        self.assertEqual(sorted(self.portfolio_json().keys()), ['ERG', 'SigUSD'])
@@ -0,0 +1,50 @@
+from backend.ergo_index_fund_api.tests.FakeRedisTestCase import FakeRedisTestCase
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.FundSearch import FundSearch
+from backend.fund.TokenAllocation import TokenAllocation
+
+
+class FundSearchTest(FakeRedisTestCase):
+    """
+    Checks that searches page through the driving token's matches, and that their cursors keep that token.
+    """
+
+    def save_fund(self,
+                  fund_id: str,
+                  **pcts) -> None:
+        portfolio = FundPortfolio(tokens=[TokenAllocation(token=token, portfolio_pct=pct, buy_target=1, sell_target=2)
+                                          for token, pct in pcts.items()])
+        self.assertTrue(self.redis.save_fund(fund_id, 'manager@example.com', [], portfolio).saved)
+
+    def test_pages(self):
+        for idx in range(5):
+            self.save_fund(f'fund{idx}', ERG=50 + idx, SigUSD=50 - idx)
+        self.save_fund('other', SigUSD=100)
+        pct_ranges = [('ERG', 51, 100), ('SigUSD', float('-inf'), float('inf'))]
+        funds, cursor = FundSearch.search(self.redis, pct_ranges, page_size=3)
+        self.assertEqual([fund['fund_id'] for fund in funds], ['fund4', 'fund3', 'fund2'])
+        self.assertEqual(cursor, 'ERG:3')
+        funds, cursor = FundSearch.search(self.redis, pct_ranges, cursor=cursor, page_size=3)
+        self.assertEqual([fund['fund_id'] for fund in funds], ['fund1'])
+        self.assertIsNone(cursor)
+
+    def test_cursor_keeps_its_driving_token(self):
+        for idx in range(4):
+            self.save_fund(f'fund{idx}', ERG=50 + idx, SigUSD=50 - idx)
+        pct_ranges = [('ERG', float('-inf'), float('inf')), ('SigUSD', float('-inf'), float('inf'))]
+        funds, cursor = FundSearch.search(self.redis, pct_ranges, page_size=2)
+        self.assertEqual([fund['fund_id'] for fund in funds], ['fund3', 'fund2'])
+        self.assertEqual(cursor, 'ERG:2')
+
+        # SigUSD now has fewer matches, but the next page still continues down ERG's index.
+        for idx in range(3):
+            self.save_fund(f'erg{idx}', ERG=10 + idx)
+        funds, cursor = FundSearch.search(self.redis, pct_ranges, cursor=cursor, page_size=2)
+        self.assertEqual([fund['fund_id'] for fund in funds], ['fund1', 'fund0'])
+
+    def test_invalid_cursors(self):
+        pct_ranges = [('ERG', 0, 100)]
+        self.assertEqual(FundSearch.parse_cursor('ERG:12', pct_ranges), ('ERG', 12))
+        for cursor in ['12', 'BTC:12', 'ERG:', 'ERG:-1', 'ERG:x']:
+            with self.assertRaises(ValueError):
+                FundSearch.parse_cursor(cursor, pct_ranges)
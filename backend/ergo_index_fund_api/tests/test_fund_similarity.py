@@ -0,0 +1,86 @@
+from typing import Dict
+
+import numpy as np
+
+from backend.ergo_index_fund_api.tests.FakeRedisTestCase import FakeRedisTestCase
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.FundSimilarity import FundSimilarity
+from backend.fund.TokenAllocation import TokenAllocation
+
+
+class FundSimilarityTest(FakeRedisTestCase):
+    """
+    Checks similarity scores against pairwise computations over every fund, and the caching of similar funds.
+    """
+
+    TOKENS = ['ERG', 'SigUSD', 'BTC', 'ETH', 'ADA', 'NETA']
+
+    def setUp(self):
+        super().setUp()
+        random = np.random.RandomState(5)
+        self.pcts = {}
+        for idx in range(30):
+            held = random.choice(len(self.TOKENS), size=random.randint(1, 4), replace=False)
+            self.pcts[f'fund{idx:02}'] = {self.TOKENS[token_idx]: float(random.randint(1, 100)) for token_idx in held}
+            self.save_fund(f'fund{idx:02}', self.pcts[f'fund{idx:02}'])
+
+    def save_fund(self,
+                  fund_id: str,
+                  pcts: Dict[str, float]) -> None:
+        portfolio = FundPortfolio(tokens=[TokenAllocation(token=token, portfolio_pct=pct, buy_target=1, sell_target=2)
+                                          for token, pct in pcts.items()])
+        self.assertTrue(self.redis.save_fund(fund_id, 'manager@example.com', [], portfolio).saved)
+
+    @staticmethod
+    def similarity(pcts: Dict[str, float],
+                   other_pcts: Dict[str, float],
+                   metric: str) -> float:
+        tokens = set(pcts).intersection(other_pcts)
+        if metric == FundSimilarity.COSINE:
+            norm = sum(pct * pct for pct in pcts.values()) ** 0.5
+            other_norm = sum(pct * pct for pct in other_pcts.values()) ** 0.5
+            return sum(pcts[token] * other_pcts[token] for token in tokens) / (norm * other_norm)
+        total, other_total = sum(pcts.values()), sum(other_pcts.values())
+        return sum(min(pcts[token] / total, other_pcts[token] / other_total) for token in tokens)
+
+    def test_nearest_matches_pairwise_scores(self):
+        portfolios = {fund_id: self.redis.get_fund_portfolio(fund_id) for fund_id in ['fund00', 'fund07', 'fund19']}
+        for metric in FundSimilarity.METRICS:
+            neighbours, versions = FundSimilarity.nearest(portfolios, self.redis, metric, 5)
+            for fund_id, fund_neighbours in neighbours.items():
+                expected = sorted(((other_id, self.similarity(self.pcts[fund_id], other_pcts, metric))
+                                   for other_id, other_pcts in self.pcts.items()
+                                   if other_id != fund_id and set(self.pcts[fund_id]).intersection(other_pcts)),
+                                  key=lambda pair: (-pair[1], pair[0]))[:5]
+                self.assertEqual([neighbour_id for neighbour_id, _ in fund_neighbours],
+                                 [other_id for other_id, _ in expected], (fund_id, metric))
+                for (_, score), (_, expected_score) in zip(fund_neighbours, expected):
+                    self.assertAlmostEqual(score, expected_score)
+            self.assertTrue(all(version == 1 for version in versions.values()))
+
+    def test_cached_funds_are_dropped_when_a_fund_changes(self):
+        similar = FundSimilarity.similar_funds('fund00', self.redis, k=3)
+        self.assertEqual(FundSimilarity.similar_funds('fund00', self.redis, k=3), similar)
+        token = next(iter(self.pcts['fund00']))
+        self.save_fund('twin', self.pcts['fund00'])
+        similar = FundSimilarity.similar_funds('fund00', self.redis, k=3)
+        self.assertEqual(similar[0]['fund_id'], 'twin')
+        self.assertAlmostEqual(similar[0]['similarity'], 1)
+        self.save_fund('twin', {token: 1, 'OTHER': 1000})
+        self.assertNotEqual(FundSimilarity.similar_funds('fund00', self.redis, k=3)[0]['fund_id'], 'twin')
+
+    def test_vectors_live_on_each_fund_and_token(self):
+        self.assertEqual(self.redis.client.hmget(self.redis.fund_key('fund00'), ['vector_version', 'vector_total']),
+                         [b'1', str(sum(self.pcts['fund00'].values())).encode('utf-8')])
+        token = next(iter(self.pcts['fund00']))
+        num_holders = sum(1 for pcts in self.pcts.values() if token in pcts)
+        self.assertEqual(self.redis.get_similarity_versions(['fund00'], [token, 'OTHER']), ([1], [num_holders, 0]))
+        self.assertEqual(self.redis.client.keys('{fund_vectors}*'), [])
+
+    def test_older_vectors_are_ignored(self):
+        self.save_fund('fund00', {'ERG': 3, 'SigUSD': 4})
+        pipe = self.redis.client.pipeline(transaction=False)
+        self.redis._update_fund_vector(pipe, 'fund00', 1, None, self.redis.get_fund_portfolio('fund01'))
+        pipe.execute()
+        norms, totals, versions = self.redis.get_fund_vectors(['fund00'])
+        self.assertEqual((norms, totals, versions), ([5], [7], [2]))
@@ -0,0 +1,80 @@
+from typing import Dict, List
+
+from backend.ergo_index_fund_api.tests.FakeRedisTestCase import FakeRedisTestCase
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.FundVersionHistory import FundVersionHistory
+from backend.fund.TokenAllocation import TokenAllocation
+from backend.redis.RedisManager import RedisManager
+
+
+class FundVersionHistoryTest(FakeRedisTestCase):
+    """
+    Checks that past versions of a fund's portfolio are rebuilt from its history, before and after compaction.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.saved_history_settings = (RedisManager.fund_history_checkpoint_interval,
+                                       RedisManager.fund_history_full_versions)
+        RedisManager.fund_history_checkpoint_interval = 4
+        RedisManager.fund_history_full_versions = 8
+
+    def tearDown(self):
+        RedisManager.fund_history_checkpoint_interval, RedisManager.fund_history_full_versions = \
+            self.saved_history_settings
+        super().tearDown()
+
+    @staticmethod
+    def portfolio(version: int) -> FundPortfolio:
+        # Every version changes a position, and every third one swaps a token in or out.
+        tokens = [TokenAllocation(token='ERG', portfolio_pct=50 + version, buy_target=1, sell_target=2 + version)]
+        if version % 3 != 0:
+            tokens.append(TokenAllocation(token='SigUSD', portfolio_pct=50 - version, buy_target=1, sell_target=2))
+        return FundPortfolio(tokens=tokens)
+
+    @staticmethod
+    def positions(portfolio: FundPortfolio) -> Dict[str, List[float]]:
+        return {str(token.token): [float(token.portfolio_pct), float(token.buy_target), float(token.sell_target)]
+                for token in portfolio.tokens}
+
+    def save_versions(self,
+                      num_versions: int) -> None:
+        self.assertTrue(self.redis.save_fund('fund', 'manager@example.com', [], self.portfolio(1)).saved)
+        for version in range(2, num_versions + 1):
+            self.assertTrue(self.redis.set_fund_portfolio('fund', self.portfolio(version)))
+
+    def test_delta_chain_rebuilds_every_version(self):
+        self.save_versions(11)
+        for version in range(1, 12):
+            fund_version, portfolio = FundVersionHistory.load('fund', self.redis, version)
+            self.assertEqual(fund_version.version, version)
+            self.assertEqual(self.positions(portfolio), self.positions(self.portfolio(version)), version)
+        fund_version, portfolio = FundVersionHistory.load('fund', self.redis)
+        self.assertEqual(fund_version.version, 11)
+        self.assertEqual(self.positions(portfolio), self.positions(self.portfolio(11)))
+        self.assertIsNone(FundVersionHistory.load('fund', self.redis, 12))
+
+    def test_versions_load_after_compaction(self):
+        self.save_versions(61)
+        num_entries = len(self.redis.get_fund_version_entries('fund', None, 1000))
+        self.assertLess(num_entries, 61)
+        num_loaded = 0
+        for version in range(1, 62):
+            loaded = FundVersionHistory.load('fund', self.redis, version)
+            if version >= 61 - RedisManager.fund_history_full_versions:
+                self.assertIsNotNone(loaded, version)
+            if loaded is not None:
+                self.assertEqual(self.positions(loaded[1]), self.positions(self.portfolio(version)), version)
+                num_loaded += 1
+        self.assertGreater(num_loaded, RedisManager.fund_history_full_versions)
+
+    def test_diff(self):
+        self.save_versions(5)
+        diff = FundVersionHistory.diff('fund', self.redis, 2, 3)
+        self.assertEqual((diff['from_version'], diff['to_version']), (2, 3))
+        self.assertEqual(self.positions(FundPortfolio.from_json(diff)), {'ERG': [53, 1, 5]})
+        self.assertEqual(diff['removed_tokens'], ['SigUSD'])
+        diff = FundVersionHistory.diff('fund', self.redis, 3, 4)
+        self.assertEqual(self.positions(FundPortfolio.from_json(diff)), {'ERG': [54, 1, 6], 'SigUSD': [46, 1, 2]})
+        self.assertEqual(diff['removed_tokens'], [])
+        self.assertIsNone(FundVersionHistory.diff('fund', self.redis, 2, 6))
@@ -0,0 +1,68 @@
+import time as pytime
+import unittest
+import uuid
+
+from decouple import config
+
+from backend.fund.FundNavSnapshot import FundNavSnapshot
+from backend.fund.FundPatch import FundPatch
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.TokenAllocation import TokenAllocation
+from backend.redis.RedisManager import RedisManager
+
+
+@unittest.skipUnless(config('REDIS_CLUSTER', default=False, cast=bool), 'Requires REDIS_CLUSTER=True')
+class RedisClusterScriptTest(unittest.TestCase):
+    """
+    Runs the writes which use server-side scripts against a Redis Cluster whose nodes haven't cached any script,
+        i.e. the one in docker-compose.redis-cluster.yml:
+        docker-compose -f docker-compose.redis-cluster.yml up -d
+        REDIS_IP=127.0.0.1 REDIS_PORT=7000 REDIS_CLUSTER=True python manage.py test ergo_index_fund_api
+    """
+
+    def setUp(self):
+        self.redis = RedisManager.shared()
+        self.assertIsNotNone(self.redis)
+        self.redis.client.script_flush()
+        self.prefix = uuid.uuid4().hex
+
+    def test_release_locks(self):
+        keys = [RedisManager.token_price_lock_key(f'{self.prefix}-{token_idx}') for token_idx in range(10)]
+        self.assertEqual(self.redis.acquire_locks(keys, 'lock-token', 60), [True] * len(keys))
+        self.redis.release_locks(keys, 'lock-token')
+        self.assertEqual(sum(self.redis.client.exists(key) for key in keys), 0)
+
+    def test_add_nav_snapshots(self):
+        fund_ids = [f'{self.prefix}-{fund_idx}' for fund_idx in range(10)]
+        snapshots = [FundNavSnapshot(fund_id=fund_id, timestamp=0, nav=100 + fund_idx, allocations={'ERG': 1.0})
+                     for fund_idx, fund_id in enumerate(fund_ids)]
+        self.assertTrue(self.redis.add_nav_snapshots(snapshots))
+        for fund_idx, fund_id in enumerate(fund_ids):
+            nav_snapshots = self.redis.get_nav_snapshots(fund_id, 0, pytime.time() + 60)
+            self.assertEqual([nav_snapshot.nav for nav_snapshot in nav_snapshots], [100 + fund_idx])
+
+    def test_save_and_patch_fund(self):
+        fund_id = f'{self.prefix}-fund'
+        token = f'{self.prefix}-token'
+        portfolio = FundPortfolio(tokens=[TokenAllocation(token=token, portfolio_pct=60, buy_target=1, sell_target=2)])
+        write_result = self.redis.save_fund(fund_id, 'manager@example.com', ['investor@example.com'], portfolio)
+        self.assertTrue(write_result.saved)
+        write_result = self.redis.patch_fund(fund_id, FundPatch(set_tokens=[{'token':         token,
+                                                                              'portfolio_pct': 40,
+                                                                              'buy_target':    1,
+                                                                              'sell_target':   2}]))
+        self.assertTrue(write_result.saved)
+        self.assertEqual(write_result.version, 2)
+        self.assertEqual(len(self.redis.get_fund_version_entries(fund_id, None, 10)), 2)
+        self.assertEqual(self.redis.get_token_funds(token, 0, 100, 0, 10), [(fund_id, 40.0)])
+
+    def test_save_funds(self):
+        token = f'{self.prefix}-token'
+        portfolio = FundPortfolio(tokens=[TokenAllocation(token=token, portfolio_pct=10, buy_target=1, sell_target=2)])
+        funds = [(f'{self.prefix}-{fund_idx}', 'manager@example.com', [], portfolio) for fund_idx in range(20)]
+        self.assertTrue(all(write_result.saved for write_result in self.redis.save_funds(funds)))
+        self.assertEqual(len(self.redis.get_token_funds(token, 0, 100, 0, 100)), len(funds))
+        fund_ids = sorted(fund_id for fund_id, _, _, _ in funds)
+        self.assertEqual(self.redis.get_fund_ids_page(f'{self.prefix}-', len(funds)), fund_ids)
+        conflicts = self.redis.save_funds([(fund_id, 'other@example.com', [], portfolio) for fund_id, _, _, _ in funds])
+        self.assertTrue(all(write_result.is_conflict for write_result in conflicts))
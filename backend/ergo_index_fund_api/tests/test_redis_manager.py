@@ -0,0 +1,130 @@
+import unittest
+from typing import Dict
+
+from backend.ergo_index_fund_api.tests.FakeRedisTestCase import FakeRedisTestCase
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.TokenAllocation import TokenAllocation
+from backend.redis.RedisManager import RedisManager
+
+
+class StubRedis:
+    """
+    Answers INFO REPLICATION with fixed fields, or raises if there are none.
+    """
+
+    def __init__(self,
+                 replication: Dict = None):
+        self.replication = replication
+
+    def info(self,
+             section: str) -> Dict:
+        if self.replication is None:
+            raise ConnectionError('Replica unreachable')
+        return self.replication
+
+
+class RedisReplicaFreshnessTest(unittest.TestCase):
+    """
+    Checks that replicas are judged by how far behind the primary's replication offset they are.
+    """
+
+    def setUp(self):
+        self.saved_client = RedisManager._client
+        self.saved_replica_freshness = RedisManager._replica_freshness
+        self.saved_replica_max_lag_bytes = RedisManager.replica_max_lag_bytes
+        RedisManager._client = StubRedis({'role': 'master', 'master_repl_offset': 5000})
+        RedisManager._replica_freshness = {}
+        RedisManager.replica_max_lag_bytes = 100
+
+    def tearDown(self):
+        RedisManager._client = self.saved_client
+        RedisManager._replica_freshness = self.saved_replica_freshness
+        RedisManager.replica_max_lag_bytes = self.saved_replica_max_lag_bytes
+
+    @staticmethod
+    def replica(offset: int,
+                last_io_seconds_ago: int = 0,
+                link_status: str = 'up',
+                sync_in_progress: int = 0) -> StubRedis:
+        return StubRedis({'role':                       'slave',
+                          'master_link_status':         link_status,
+                          'master_last_io_seconds_ago': last_io_seconds_ago,
+                          'master_sync_in_progress':    sync_in_progress,
+                          'slave_repl_offset':          offset})
+
+    def test_caught_up_replica_is_fresh(self):
+        self.assertTrue(RedisManager._is_replica_fresh(self.replica(5000)))
+        self.assertTrue(RedisManager._is_replica_fresh(self.replica(4900)))
+
+    def test_idle_replica_is_fresh(self):
+        # The primary only pings its replicas every repl-ping-replica-period (10s by default) while writes are idle.
+        self.assertTrue(RedisManager._is_replica_fresh(self.replica(5000, last_io_seconds_ago=9)))
+
+    def test_replica_behind_is_stale(self):
+        self.assertFalse(RedisManager._is_replica_fresh(self.replica(4899, last_io_seconds_ago=0)))
+
+    def test_disconnected_or_syncing_replica_is_stale(self):
+        self.assertFalse(RedisManager._is_replica_fresh(self.replica(5000, link_status='down')))
+        self.assertFalse(RedisManager._is_replica_fresh(self.replica(5000, sync_in_progress=1)))
+        self.assertFalse(RedisManager._is_replica_fresh(self.replica(-1)))
+
+    def test_unreachable_replica_is_stale(self):
+        self.assertFalse(RedisManager._is_replica_fresh(StubRedis()))
+
+    def test_check_is_reused_until_the_interval_passes(self):
+        replica = self.replica(5000)
+        self.assertTrue(RedisManager._is_replica_fresh(replica))
+        replica.replication = None
+        self.assertTrue(RedisManager._is_replica_fresh(replica))
+        RedisManager._replica_freshness[id(replica)] = (0, True)
+        self.assertFalse(RedisManager._is_replica_fresh(replica))
+
+
+class RedisTokenIndexesTest(FakeRedisTestCase):
+    """
+    Checks that each token's indexes end up matching the newest version of a fund, whatever order the index
+        updates of its saves land in.
+    """
+
+    @staticmethod
+    def portfolio(**pcts) -> FundPortfolio:
+        return FundPortfolio(tokens=[TokenAllocation(token=token, portfolio_pct=pct, buy_target=pct / 100,
+                                                     sell_target=pct) for token, pct in pcts.items()])
+
+    def update(self,
+               version: int,
+               previous_portfolio: FundPortfolio,
+               portfolio: FundPortfolio) -> None:
+        pipe = self.redis.client.pipeline(transaction=False)
+        self.redis._update_token_indexes(pipe, 'fund', version, previous_portfolio, portfolio)
+        pipe.execute()
+
+    def indexes(self,
+                token: str) -> tuple:
+        return (self.redis.client.zscore(self.redis.token_funds_key(token), 'fund'),
+                self.redis.client.zscore(self.redis.token_buy_targets_key(token), 'fund'),
+                self.redis.client.zscore(self.redis.token_sell_targets_key(token), 'fund'))
+
+    def test_updates_in_order(self):
+        first, second = self.portfolio(ERG=60, SigUSD=40), self.portfolio(ERG=100)
+        self.update(1, None, first)
+        self.update(2, first, second)
+        self.assertEqual(self.indexes('ERG'), (100, 1, 100))
+        self.assertEqual(self.indexes('SigUSD'), (None, None, None))
+
+    def test_updates_out_of_order(self):
+        first, second, third = self.portfolio(ERG=60, SigUSD=40), self.portfolio(ERG=100), self.portfolio(SigUSD=100)
+        self.update(3, second, third)
+        self.update(1, None, first)
+        self.update(2, first, second)
+        self.assertEqual(self.indexes('ERG'), (None, None, None))
+        self.assertEqual(self.indexes('SigUSD'), (100, 1, 100))
+
+    def test_rebuild_matches_saved_funds(self):
+        self.assertTrue(self.redis.save_fund('fund', 'manager@example.com', [], self.portfolio(ERG=100)).saved)
+        self.assertTrue(self.redis.save_fund('fund', 'manager@example.com', [], self.portfolio(SigUSD=100)).saved)
+        self.update(1, None, self.portfolio(ERG=100))
+        self.assertEqual(self.indexes('ERG'), (None, None, None))
+        self.redis.rebuild_token_indexes()
+        self.assertEqual(self.indexes('ERG'), (None, None, None))
+        self.assertEqual(self.indexes('SigUSD'), (100, 1, 100))
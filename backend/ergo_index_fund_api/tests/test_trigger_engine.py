@@ -0,0 +1,54 @@
+import unittest
+
+from backend.ergo_index_fund_api.tests.FakeRedisTestCase import FakeRedisTestCase
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.TokenAllocation import TokenAllocation
+from backend.fund.TriggerEngine import TriggerEngine
+from backend.fund.TriggerEvent import TriggerEvent
+from backend.price.PriceTick import PriceTick
+
+
+class PriceTickTest(unittest.TestCase):
+    """
+    Checks which feed lines become price ticks.
+    """
+
+    def test_valid_lines(self):
+        tick = PriceTick.from_line('ERG,1.5,2')
+        self.assertEqual((tick.token, tick.price, tick.timestamp), ('ERG', 1.5, 2))
+        tick = PriceTick.from_line('{"token": "ERG", "price": 1.5, "timestamp": 2}')
+        self.assertEqual((tick.token, tick.price, tick.timestamp), ('ERG', 1.5, 2))
+
+    def test_invalid_prices_are_rejected(self):
+        for line in ['ERG,nan,2', 'ERG,inf,2', 'ERG,-inf,2', 'ERG,0,2', 'ERG,-1,2', 'ERG,1,nan', 'ERG',
+                     '{"token": "ERG", "price": NaN}', '{"token": "ERG", "price": Infinity}',
+                     '{"token": "ERG", "price": -1}']:
+            self.assertIsNone(PriceTick.from_line(line), line)
+
+
+class TriggerEngineTest(FakeRedisTestCase):
+    """
+    Checks the events triggered by price moves across funds' buy and sell targets.
+    """
+
+    def setUp(self):
+        super().setUp()
+        portfolio = FundPortfolio(tokens=[TokenAllocation(token='ERG', portfolio_pct=100, buy_target=1.5,
+                                                          sell_target=3)])
+        self.assertTrue(self.redis.save_fund('fund', 'manager@example.com', [], portfolio).saved)
+        self.engine = TriggerEngine(self.redis)
+
+    def test_crossed_targets(self):
+        events = self.engine.process_ticks([PriceTick('ERG', 2, 0), PriceTick('ERG', 1.5, 1),
+                                            PriceTick('ERG', 2.5, 2), PriceTick('ERG', 3.5, 3)])
+        self.assertEqual([(event.fund_id, event.side, event.target, event.price) for event in events],
+                         [('fund', TriggerEvent.BUY, 1.5, 1.5), ('fund', TriggerEvent.SELL, 3, 3.5)])
+        self.assertEqual(self.redis.get_trigger_last_prices(), {'ERG': 3.5})
+
+    def test_invalid_prices_are_skipped(self):
+        events = self.engine.process_ticks([PriceTick('ERG', 2, 0), PriceTick('ERG', float('nan'), 1),
+                                            PriceTick('ERG', float('inf'), 2), PriceTick('ERG', -1, 3),
+                                            PriceTick('ERG', 1, 4)])
+        self.assertEqual([(event.side, event.previous_price, event.price) for event in events],
+                         [(TriggerEvent.BUY, 2, 1)])
+        self.assertEqual(self.engine.last_prices, {'ERG': 1})
@@ -16,19 +16,37 @@ Including another URLconf
 from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from backend.ergo_index_fund_api.serializers import ClaimsTokenObtainPairSerializer
 from backend.ergo_index_fund_api.views import views
 
 urlpatterns = [
     # Auth endpoint.
-    path('api/token/new', TokenObtainPairView.as_view()),
+    path('api/token/new', TokenObtainPairView.as_view(serializer_class=ClaimsTokenObtainPairSerializer)),
     path('api/token/refresh', TokenRefreshView.as_view()),
 
     # User endpoint.
     path('api/user/new/', views.new_user),
+    path('api/user/bulk_new/', views.bulk_new_users),
     path('api/user/profile/', views.user_profile),
 
     # Fund endpoint.
     path('api/fund/save/', views.save_fund),
+    path('api/fund/patch/', views.patch_fund),
+    path('api/fund/version/', views.fund_version),
+    path('api/fund/version/diff/', views.fund_version_diff),
+    path('api/fund/rebalance/', views.rebalance_funds),
+    path('api/fund/history/', views.fund_history),
+    path('api/fund/list/', views.list_funds),
+    path('api/fund/search/', views.search_funds),
+    path('api/fund/similar/', views.similar_funds),
+    path('api/fund/backtest/', views.backtest_funds),
+    path('api/fund/backtest/job/', views.backtest_job),
+
+    # Token endpoint.
+    path('api/token/exposures/', views.token_exposures),
+
+    # Cache endpoint.
+    path('api/cache/stats/', views.cache_stats),
 
     # Not-found endpoint.
     path('', views.do_nothing)
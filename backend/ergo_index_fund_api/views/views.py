@@ -1,15 +1,31 @@
 import json
+import math
+import os
+import time as pytime
 import traceback
 
+from decouple import config
 from django.contrib.auth.models import User
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 
+from backend.fund.BacktestJob import BacktestJob
+from backend.fund.Downsampler import Downsampler
+from backend.fund.FundHistory import FundHistory
+from backend.fund.FundListing import FundListing
+from backend.fund.FundPatch import FundPatch
 from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.FundSearch import FundSearch
+from backend.fund.FundSimilarity import FundSimilarity
+from backend.fund.FundVersionHistory import FundVersionHistory
 from backend.fund.IndexFundSnapshot import IndexFundSnapshot
+from backend.fund.RebalanceEngine import RebalanceEngine
+from backend.price.PriceOracle import PriceOracle
+from backend.redis.LocalCache import LocalCache
 from backend.redis.RedisManager import RedisManager
+from backend.user.BulkUserRegistration import BulkUserRegistration
 from backend.user.FundUser import FundUser
 from backend.util import clean_email
 
@@ -76,8 +92,8 @@ def new_user(request):
 
     # Save name in Redis database.
     try:
-        redis = RedisManager()
-        if not redis.connect():
+        redis = RedisManager.shared()
+        if redis is None:
             raise ValueError('Could not initialize reddit connection')
         redis.save_new_user(user_email=email_address,
                             user_name=name)
@@ -91,6 +107,44 @@ def new_user(request):
                     status=status.HTTP_200_OK)
 
 
+@api_view(['POST'])
+def bulk_new_users(request):
+    """
+    Registers a batch of new users (i.e. a fund's investors) at once, and returns whether each one was created,
+        or why it wasn't.
+
+    NOTE: Only admins can register users in bulk.
+
+    Parameters:
+        + 'users' json array is required, i.e. [{email_address: a@b.com, name: Alice, password: ...}, ...]
+            (at most BULK_REGISTRATION_MAX_ROWS users; register more with the bulkregisterusers command)
+    """
+
+    # Get and validate parameters.
+    if not request.user.is_superuser:
+        return Response('Only admins can register users in bulk',
+                        status=status.HTTP_401_UNAUTHORIZED)
+    try:
+        rows = _json_param(request, 'users', [])
+        assert isinstance(rows, list) and 1 <= len(rows) <= BulkUserRegistration.max_request_rows
+        assert all(isinstance(row, dict) for row in rows)
+    except Exception as e:
+        return Response("Invalid 'users' parameter",
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # Register the users.
+    redis = RedisManager.shared()
+    if redis is None:
+        return Response('Error connecting to redis. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    results = BulkUserRegistration.register(rows, redis)
+    num_created = sum(1 for result in results if result['created'])
+    return Response({'created': num_created,
+                     'failed':  len(results) - num_created,
+                     'results': results},
+                    status=status.HTTP_200_OK)
+
+
 @api_view(['POST'])
 def user_profile(request):
     """
@@ -130,8 +184,8 @@ def user_profile(request):
         return Response(f'Could not load Django user matching your access token')
 
     # Get data from redis.
-    redis = RedisManager()
-    if not redis.connect():
+    redis = RedisManager.shared(requester_email=request.user.username)
+    if redis is None:
         return Response('Error connecting to redis. See docker logs.',
                         status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     user_profile = FundUser.from_db(email_address, redis)
@@ -187,14 +241,9 @@ def save_fund(request):
             return Response(f"Invalid 'fund_id' parameter: '{fund_id}'",
                     status=status.HTTP_400_BAD_REQUEST)
         fund_id = str(fund_id).lower().strip()
-        redis = RedisManager()
-        if not redis.connect():
+        redis = RedisManager.shared()
+        if redis is None:
             raise ValueError('Could not connect to redis')
-        existing_manager = redis.get_fund_manager_email(fund_id)
-        if existing_manager is not None and existing_manager != manager_email:
-            return Response(f"{fund_id} is already managed by {existing_manager}. To switch managers, "
-                            f"use /api/fund/transfer",
-                            status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         error_msg = f"ERROR! Could not validate 'fund_id' parameter: {traceback.format_exc()}"
         print(error_msg)
@@ -220,11 +269,550 @@ def save_fund(request):
                                       investor_emails=investor_emails,
                                       portfolio=portfolio)
 
-    # Update fund data in Redis.
-    redis.set_fund_manager_email(fund_id, manager_email)
-    redis.set_fund_investor_emails(fund_id, investor_emails)
-    redis.set_fund_portfolio(fund_id, portfolio)
+    # Claim the fund and update its data in Redis, in a single atomic step.
+    write_result = redis.save_fund(fund_id=fund_id,
+                                   manager_email=manager_email,
+                                   investor_emails=investor_emails,
+                                   portfolio=portfolio)
+    if write_result.is_conflict:
+        return Response(f"{fund_id} is already managed by {write_result.conflicting_manager_email}. "
+                        f"To switch managers, use /api/fund/transfer",
+                        status=status.HTTP_400_BAD_REQUEST)
+    if not write_result.saved:
+        return Response(f'Could not save fund {fund_id} in redis. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    # Return new fund object.
-    return Response(fund_snapshot.to_json(),
+    # Return new fund object, with the version to patch it from.
+    return Response({**fund_snapshot.to_json(), 'version': write_result.version},
                     status=status.HTTP_200_OK)
+
+
+@api_view(['PATCH'])
+def patch_fund(request):
+    """
+    Changes individual positions and investors of a fund, without resending the rest of the fund,
+        and returns the fund's new version and only the fields which changed.
+
+    NOTE: A fund can only be patched by its manager (or an admin).
+
+    Parameters:
+        + 'fund_id' string is required
+        + 'set_tokens' json array is optional: positions to add, or fields to change in existing positions,
+            i.e. [{token: ERG, sell_target: 3}, {token: BTC, portfolio_pct: 5, buy_target: 20000, sell_target: 90000}]
+        + 'remove_tokens' string array is optional
+        + 'add_investor_emails' string array is optional
+        + 'remove_investor_emails' string array is optional
+        + 'version' number is optional: the fund's version (from save or a previous patch) the changes were made
+            against, to refuse them if the fund changed since
+    """
+
+    # Get and validate parameters.
+    try:
+        fund_id = request.data.get('fund_id', None)
+        assert fund_id is not None and len(str(fund_id).strip()) != 0
+        fund_id = str(fund_id).lower().strip()
+        patch = FundPatch.from_json({field: _json_param(request, field, None)
+                                     for field in ['set_tokens', 'remove_tokens', 'add_investor_emails',
+                                                   'remove_investor_emails', 'version']
+                                     if request.data.get(field, None) is not None})
+        assert patch is not None and len(patch) != 0
+    except Exception as e:
+        return Response("Invalid 'fund_id' parameter, or no valid changes to make",
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # Patch the fund in Redis, in a single atomic step.
+    redis = RedisManager.shared()
+    if redis is None:
+        return Response('Error connecting to redis. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    try:
+        write_result = redis.patch_fund(fund_id, patch,
+                                        manager_email=None if request.user.is_superuser else request.user.username)
+    except ValueError as e:
+        return Response(f'Invalid changes: {e}',
+                        status=status.HTTP_400_BAD_REQUEST)
+    if write_result.is_missing:
+        return Response(f'Fund not found: {fund_id}',
+                        status=status.HTTP_404_NOT_FOUND)
+    if write_result.is_conflict:
+        return Response(f'You do not have permission to patch {fund_id}',
+                        status=status.HTTP_401_UNAUTHORIZED)
+    if write_result.is_stale:
+        return Response({'error':   f'{fund_id} changed since version {patch.version}',
+                         'version': write_result.version},
+                        status=status.HTTP_409_CONFLICT)
+    if not write_result.saved:
+        return Response(f'Could not patch fund {fund_id} in redis. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response({'fund_id': fund_id, 'version': write_result.version, **write_result.changes},
+                    status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def fund_version(request):
+    """
+    Returns a fund's portfolio as it was at a past version, and when that version was written.
+
+    NOTE: Anyone can pull this data on any fund as long as they have an account.
+
+    Parameters:
+        + 'fund_id' of the fund
+        + 'version' number is optional, defaults to the latest version
+    """
+
+    # Get and validate parameters.
+    try:
+        fund_id = request.query_params.get('fund_id', None)
+        assert fund_id is not None and len(fund_id.strip()) != 0
+        fund_id = fund_id.lower().strip()
+        version = request.query_params.get('version', None)
+        version = None if version is None else int(version)
+        assert version is None or version >= 1
+    except Exception as e:
+        return Response("Invalid 'fund_id' or 'version' parameter",
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # Rebuild the version from the fund's history.
+    redis = RedisManager.shared()
+    if redis is None:
+        return Response('Error connecting to redis. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    loaded_version = FundVersionHistory.load(fund_id, redis, version)
+    if loaded_version is None:
+        return Response(f'Version {version} of {fund_id} was not found (or is no longer kept)',
+                        status=status.HTTP_404_NOT_FOUND)
+    fund_version, portfolio = loaded_version
+    return Response({'fund_id':   fund_id,
+                     'version':   fund_version.version,
+                     'timestamp': fund_version.timestamp,
+                     'portfolio': portfolio.to_json()},
+                    status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def fund_version_diff(request):
+    """
+    Returns the positions which were added or changed between two versions of a fund's portfolio,
+        and the tokens which were removed.
+
+    NOTE: Anyone can pull this data on any fund as long as they have an account.
+
+    Parameters:
+        + 'fund_id' of the fund
+        + 'from' version number
+        + 'to' version number
+    """
+
+    # Get and validate parameters.
+    try:
+        fund_id = request.query_params.get('fund_id', None)
+        assert fund_id is not None and len(fund_id.strip()) != 0
+        fund_id = fund_id.lower().strip()
+        from_version = int(request.query_params.get('from'))
+        to_version = int(request.query_params.get('to'))
+        assert from_version >= 1 and to_version >= 1
+    except Exception as e:
+        return Response("Invalid 'fund_id', 'from' or 'to' parameter",
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # Rebuild both versions from the fund's history, and compare them.
+    redis = RedisManager.shared()
+    if redis is None:
+        return Response('Error connecting to redis. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    diff = FundVersionHistory.diff(fund_id, redis, from_version, to_version)
+    if diff is None:
+        return Response(f'Versions {from_version} and {to_version} of {fund_id} were not both found '
+                        f'(or are no longer kept)',
+                        status=status.HTTP_404_NOT_FOUND)
+    return Response(diff, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+def rebalance_funds(request):
+    """
+    Returns, for each fund, how far its holdings drifted from its portfolio's target weights
+        and the buy/sell orders that bring them back (within each token's buy/sell targets).
+
+    NOTE: Funds can only be rebalanced by their manager (or an admin).
+
+    Parameters:
+        + 'holdings' json object is required, i.e. {fund_id: {BTC: 0.5, ERG: 1200}, ...}
+        + 'prices' json object is optional, i.e. {BTC: 50000, ERG: 2.5} (defaults to the price oracle's prices)
+        + 'min_drift_pct' number is optional, i.e. 1.5 to ignore tokens within 1.5% of their target weight
+    """
+
+    # Get and validate parameters.
+    try:
+        holdings = _json_param(request, 'holdings', {})
+        prices = _json_param(request, 'prices', {})
+        min_drift_pct = float(request.data.get('min_drift_pct', 0))
+        assert isinstance(holdings, dict) and len(holdings) != 0 and isinstance(prices, dict)
+        holdings = {str(fund_id).lower().strip(): {str(token): float(quantity)
+                                                    for token, quantity in fund_holdings.items()}
+                    for fund_id, fund_holdings in holdings.items()}
+        prices = {str(token): float(price) for token, price in prices.items()}
+    except Exception as e:
+        return Response("Invalid 'holdings', 'prices' or 'min_drift_pct' parameter",
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # Load portfolios, checking that the requester manages every fund.
+    redis = RedisManager.shared(requester_email=request.user.username)
+    if redis is None:
+        return Response('Error connecting to redis. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    portfolios = {}
+    for snapshot in IndexFundSnapshot.load_many(list(holdings.keys()), redis):
+        if snapshot.manager_email != request.user.username and not request.user.is_superuser:
+            return Response(f'You do not have permission to rebalance {snapshot.fund_id}',
+                            status=status.HTTP_401_UNAUTHORIZED)
+        portfolios[snapshot.fund_id] = snapshot.portfolio
+    missing_fund_ids = [fund_id for fund_id in holdings.keys() if fund_id not in portfolios]
+    if len(missing_fund_ids) != 0:
+        return Response(f'Funds not found: {missing_fund_ids}',
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # Price every token involved, unless prices were given.
+    if len(prices) == 0:
+        price_oracle = PriceOracle.shared()
+        if price_oracle is None:
+            return Response('Error connecting to redis. See docker logs.',
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        prices = price_oracle.get_prices([str(token.token) for portfolio in portfolios.values()
+                                          for token in portfolio.tokens]
+                                         + [token for fund_holdings in holdings.values() for token in fund_holdings])
+
+    # Compute the plans.
+    plans = RebalanceEngine.rebalance(portfolios=portfolios,
+                                      holdings=holdings,
+                                      prices=prices,
+                                      min_drift_pct=min_drift_pct,
+                                      num_workers=1)
+    return Response([plan.to_json() for plan in plans], status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+def backtest_funds(request):
+    """
+    Starts a backtest of funds' buy/sell targets over a stored price history, and returns the queued job
+        (whose results are then polled from the backtest job endpoint).
+
+    NOTE: Funds can only be backtested by their manager (or an admin).
+
+    Parameters:
+        + 'fund_ids' json list is required, i.e. ["fund1", "fund2"]
+        + 'prices_file' is required: the name of a CSV or Parquet price history in the BACKTEST_DATA_DIR directory
+        + 'buy_scales' json list is optional, i.e. [0.9, 1] to also try every buy_target 10% lower
+            (the number of funds x buy_scales x sell_scales is limited to BACKTEST_MAX_RESULTS)
+        + 'sell_scales' json list is optional, i.e. [1, 1.1] to also try every sell_target 10% higher
+        + 'initial_value' number is optional, defaults to 10000
+        + 'fee_pct' number is optional, the cost of each trade in percent (defaults to 0)
+        + 'start_invested' is optional: 'true' to start holding every token rather than cash
+    """
+
+    # Get and validate parameters.
+    try:
+        fund_ids = list(dict.fromkeys(str(fund_id).lower().strip() for fund_id in _json_param(request, 'fund_ids', [])))
+        prices_file = os.path.basename(str(request.data.get('prices_file', '')))
+        history_path = os.path.join(config('BACKTEST_DATA_DIR', default='/resources/backtest'), prices_file)
+        buy_scales = [float(scale) for scale in _json_param(request, 'buy_scales', [1])]
+        sell_scales = [float(scale) for scale in _json_param(request, 'sell_scales', [1])]
+        initial_value = float(request.data.get('initial_value', 10000))
+        fee_pct = float(request.data.get('fee_pct', 0))
+        start_invested = str(request.data.get('start_invested', 'false')).lower() == 'true'
+        assert 1 <= len(fund_ids) <= 1000 and os.path.isfile(history_path)
+        assert 1 <= len(buy_scales) <= 20 and 1 <= len(sell_scales) <= 20
+        assert len(fund_ids) * len(buy_scales) * len(sell_scales) <= config('BACKTEST_MAX_RESULTS', default=20000,
+                                                                            cast=int)
+        assert all(math.isfinite(value) and value > 0 for value in buy_scales + sell_scales + [initial_value])
+        assert math.isfinite(fee_pct) and 0 <= fee_pct < 100
+    except Exception as e:
+        return Response("Invalid 'fund_ids', 'prices_file', 'buy_scales', 'sell_scales', 'initial_value', "
+                        "'fee_pct' or 'start_invested' parameter",
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # Check that the requester manages every fund.
+    redis = RedisManager.shared(requester_email=request.user.username)
+    if redis is None:
+        return Response('Error connecting to redis. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    snapshots = IndexFundSnapshot.load_many(fund_ids, redis)
+    for snapshot in snapshots:
+        if snapshot.manager_email != request.user.username and not request.user.is_superuser:
+            return Response(f'You do not have permission to backtest {snapshot.fund_id}',
+                            status=status.HTTP_401_UNAUTHORIZED)
+    if len(snapshots) != len(fund_ids):
+        return Response(f'Funds not found: {sorted(set(fund_ids) - {snapshot.fund_id for snapshot in snapshots})}',
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # Queue the backtest.
+    job = BacktestJob.submit(requester_email=request.user.username,
+                             fund_ids=fund_ids,
+                             history_path=history_path,
+                             redis=redis,
+                             buy_scales=buy_scales,
+                             sell_scales=sell_scales,
+                             initial_value=initial_value,
+                             fee_pct=fee_pct,
+                             start_invested=start_invested,
+                             num_workers=config('BACKTEST_WORKERS', default=1, cast=int),
+                             max_cells=config('BACKTEST_MAX_CELLS', default=2000000, cast=int))
+    if job is None:
+        return Response('Could not queue the backtest. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response(job.to_json(), status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+def backtest_job(request):
+    """
+    Returns the status of a backtest job, and its results once it is done.
+
+    NOTE: Jobs can only be viewed by the user who started them (or an admin).
+
+    Parameters:
+        + 'job_id' returned when the backtest was started
+    """
+    redis = RedisManager.shared()
+    if redis is None:
+        return Response('Error connecting to redis. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    job = BacktestJob.from_db(str(request.query_params.get('job_id', '')).strip(), redis)
+    if job is None:
+        return Response('Backtest job not found (jobs expire a day after they finish)',
+                        status=status.HTTP_404_NOT_FOUND)
+    if job.requester_email != request.user.username and not request.user.is_superuser:
+        return Response('You do not have permission to view this backtest job',
+                        status=status.HTTP_401_UNAUTHORIZED)
+    return Response(job.to_json(), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def list_funds(request):
+    """
+    Returns every fund, or the funds a user manages or invests in, one page at a time, in order of id.
+
+    NOTE: Anyone can list every fund as long as they have an account, but only admins can list another user's funds.
+
+    Parameters:
+        + 'scope' is optional: 'all' (default), 'managed' or 'invested'
+        + 'email_address' is optional: the user whose 'managed' or 'invested' funds are listed,
+            defaults to the requester
+        + 'cursor' is optional: the 'next_cursor' of the previous page
+        + 'limit' number is optional, defaults to 50 (at most 500)
+        + 'full' is optional: 'true' to list full snapshots (with portfolios and investors) rather than summaries
+    """
+
+    # Get and validate parameters.
+    try:
+        scope = request.query_params.get('scope', FundListing.ALL)
+        email_address = clean_email(request.query_params.get('email_address', request.user.username))
+        cursor = request.query_params.get('cursor', None)
+        limit = int(request.query_params.get('limit', 50))
+        full = request.query_params.get('full', 'false').lower() == 'true'
+        assert scope in FundListing.SCOPES and 1 <= limit <= 500 and (cursor is None or len(cursor) != 0)
+    except Exception as e:
+        return Response("Invalid 'scope', 'email_address', 'cursor', 'limit' or 'full' parameter",
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # Validate requester permissions.
+    if scope != FundListing.ALL and email_address != request.user.username and not request.user.is_superuser:
+        return Response(f'You do not have permission to list the funds of {email_address}',
+                        status=status.HTTP_401_UNAUTHORIZED)
+
+    # List the funds.
+    redis = RedisManager.shared(requester_email=request.user.username)
+    if redis is None:
+        return Response('Error connecting to redis. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    listing = FundListing.list_funds(redis, scope, email_address, cursor=cursor, page_size=limit, full=full)
+    if listing is None:
+        return Response('Could not list funds. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    funds, next_cursor = listing
+    return Response({'funds': funds, 'next_cursor': next_cursor}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def search_funds(request):
+    """
+    Returns the funds holding every one of the given tokens (within an optional range of portfolio_pct),
+        one page at a time, from highest to lowest portfolio_pct in the least held token.
+
+    NOTE: Anyone can search funds as long as they have an account.
+
+    Parameters:
+        + 'tokens' is required: comma-separated token[:min_pct[:max_pct]] filters, i.e. 'ERG:10,BTC'
+            for funds holding at least 10% ERG and any BTC
+        + 'cursor' is optional: the 'next_cursor' of the previous page, for the same 'tokens'
+        + 'limit' number is optional, defaults to 50 (at most 500)
+    """
+
+    # Get and validate parameters.
+    try:
+        pct_ranges = []
+        for token_filter in request.query_params.get('tokens', '').split(','):
+            fields = token_filter.strip().split(':')
+            assert 1 <= len(fields) <= 3 and len(fields[0]) != 0
+            assert all(math.isfinite(float(field)) for field in fields[1:] if len(field) != 0)
+            pct_ranges.append((fields[0],
+                               float(fields[1]) if len(fields) > 1 and len(fields[1]) != 0 else float('-inf'),
+                               float(fields[2]) if len(fields) > 2 and len(fields[2]) != 0 else float('inf')))
+        assert 1 <= len(pct_ranges) <= 20 and len({token for token, _, _ in pct_ranges}) == len(pct_ranges)
+        cursor = request.query_params.get('cursor', None)
+        if cursor is not None:
+            FundSearch.parse_cursor(cursor, pct_ranges)
+        limit = int(request.query_params.get('limit', 50))
+        assert 1 <= limit <= 500
+    except Exception as e:
+        return Response("Invalid 'tokens', 'cursor' or 'limit' parameter",
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # Search the token indexes.
+    redis = RedisManager.shared()
+    if redis is None:
+        return Response('Error connecting to redis. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    search_results = FundSearch.search(redis, pct_ranges, cursor=cursor, page_size=limit)
+    if search_results is None:
+        return Response('Could not search funds. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    funds, next_cursor = search_results
+    return Response({'funds': funds, 'next_cursor': next_cursor}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def similar_funds(request):
+    """
+    Returns the funds whose portfolios are most similar to a fund's, from most to least similar.
+
+    NOTE: Anyone can pull this data on any fund as long as they have an account.
+
+    Parameters:
+        + 'fund_id' of the fund
+        + 'metric' is optional: 'cosine' (default) to compare the portfolio_pct vectors' directions, or 'overlap'
+            for the share of the portfolios' weights held in common
+        + 'k' number is optional, defaults to 10 (at most SIMILAR_FUNDS_MAX_K)
+    """
+
+    # Get and validate parameters.
+    try:
+        fund_id = request.query_params.get('fund_id', None)
+        assert fund_id is not None and len(fund_id.strip()) != 0
+        fund_id = fund_id.lower().strip()
+        metric = request.query_params.get('metric', FundSimilarity.COSINE)
+        k = int(request.query_params.get('k', 10))
+        assert metric in FundSimilarity.METRICS and 1 <= k <= FundSimilarity.max_k
+    except Exception as e:
+        return Response("Invalid 'fund_id', 'metric' or 'k' parameter",
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # Find the similar funds.
+    redis = RedisManager.shared()
+    if redis is None:
+        return Response('Error connecting to redis. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    funds = FundSimilarity.similar_funds(fund_id, redis, metric, k)
+    if funds is None:
+        return Response(f'Could not find {fund_id}, or compare it with other funds. See docker logs.',
+                        status=status.HTTP_404_NOT_FOUND)
+    return Response(funds, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def fund_history(request):
+    """
+    Returns a fund's NAV over a time range, downsampled on the server to at most 'points' points.
+
+    NOTE: Anyone can pull this data on any fund as long as they have an account.
+
+    Parameters:
+        + 'fund_id' of the fund
+        + 'start' unix time (in seconds) is optional, defaults to one day before 'end'
+        + 'end' unix time (in seconds) is optional, defaults to now
+        + 'points' number is optional, defaults to 500 (at most 5000)
+        + 'method' is optional: 'lttb' (default) to keep the shape of the line, or 'minmax' to keep every spike
+    """
+
+    # Get and validate parameters.
+    try:
+        fund_id = request.query_params.get('fund_id', None)
+        assert fund_id is not None and len(fund_id.strip()) != 0
+        fund_id = fund_id.lower().strip()
+        end = float(request.query_params.get('end', pytime.time()))
+        start = float(request.query_params.get('start', end - 86400))
+        num_points = int(request.query_params.get('points', 500))
+        method = request.query_params.get('method', Downsampler.LTTB)
+        assert start < end and 3 <= num_points <= 5000 and method in [Downsampler.LTTB, Downsampler.MIN_MAX]
+    except Exception as e:
+        return Response("Invalid 'fund_id', 'start', 'end', 'points' or 'method' parameter",
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # Load the history.
+    redis = RedisManager.shared()
+    if redis is None:
+        return Response('Error connecting to redis. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    history = FundHistory.from_db(fund_id, redis, start, end, num_points, method)
+    if history is None:
+        return Response(f'Could not load the history of {fund_id}. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response(history.to_json(), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def token_exposures(request):
+    """
+    Returns, for each token, the number of funds holding it and their summed and average portfolio_pct,
+        from highest to lowest.
+
+    Parameters:
+        + 'sort' is optional: 'fund_count' (default) or 'total_pct'
+        + 'limit' number is optional, to only return the most held tokens
+    """
+
+    # Get and validate parameters.
+    try:
+        sort = request.query_params.get('sort', 'fund_count')
+        limit = request.query_params.get('limit', None)
+        limit = None if limit is None else int(limit)
+        assert sort in ['fund_count', 'total_pct'] and (limit is None or limit > 0)
+    except Exception as e:
+        return Response("Invalid 'sort' or 'limit' parameter",
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # Load the exposures.
+    redis = RedisManager.shared()
+    if redis is None:
+        return Response('Error connecting to redis. See docker logs.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    exposures = [{'token':      token,
+                  'fund_count': fund_count,
+                  'total_pct':  total_pct,
+                  'avg_pct':    total_pct / fund_count}
+                 for token, (fund_count, total_pct) in redis.get_token_exposures().items()]
+    exposures.sort(key=lambda exposure: (-exposure[sort], exposure['token']))
+    return Response(exposures[:limit], status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def cache_stats(request):
+    """
+    Returns the hit/miss/eviction counters of the local caches of the worker process serving the request.
+
+    NOTE: Only admins can view cache stats.
+    """
+    if not request.user.is_superuser:
+        return Response('You do not have permission to view cache stats',
+                        status=status.HTTP_401_UNAUTHORIZED)
+    return Response(LocalCache.all_stats(), status=status.HTTP_200_OK)
+
+
+def _json_param(request,
+                name: str,
+                default):
+    """
+    Returns the request parameter, decoded from JSON if it was sent as a string.
+    """
+    value = request.data.get(name, default)
+    return json.loads(value) if isinstance(value, str) else value
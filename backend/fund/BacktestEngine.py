@@ -0,0 +1,164 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.fund.BacktestResult import BacktestResult
+from backend.fund.ColumnarPortfolio import ColumnarPortfolio
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.PriceHistory import PriceHistory
+
+
+class BacktestEngine:
+    """
+    Replays a price history against funds' buy/sell targets and reports how the targets would have performed.
+
+    Each token is a sleeve worth its portfolio weight of the initial value. A sleeve in cash buys the token
+        (with all of its value) once the price is at or below the buy_target, and a sleeve holding the token
+        sells it once the price is at or above the sell_target. A sleeve's position only depends on the last
+        target that was hit, so every time step is computed at once with NumPy rather than step by step.
+    Every combination of buy_scales and sell_scales (factors applied to the saved targets) is simulated in the
+        same pass, as many scenarios at a time as fit in max_cells array cells (so memory stays bounded however
+        many scenarios there are), and batches of funds are spread across a process pool.
+    """
+
+    @classmethod
+    def backtest(cls,
+                 portfolios: Dict[str, FundPortfolio],
+                 history: PriceHistory,
+                 buy_scales: Optional[List[float]] = None,
+                 sell_scales: Optional[List[float]] = None,
+                 initial_value: float = 10000,
+                 fee_pct: float = 0,
+                 start_invested: bool = False,
+                 batch_size: int = 100,
+                 num_workers: Optional[int] = None,
+                 max_cells: int = 2000000,
+                 on_batch: Optional[Callable[[int], None]] = None) -> List[BacktestResult]:
+        """
+        Returns one result per fund and per (buy_scale, sell_scale) combination.
+        Sleeves start in cash, or holding their token if start_invested is True, and each trade costs fee_pct.
+        Set num_workers to 1 to compute every batch in the current process.
+        on_batch (if any) is called with the number of funds backtested so far, after each batch.
+        Raises a ValueError if a single scenario of a fund (time steps x tokens) doesn't fit in max_cells.
+        """
+        scales = [(float(buy_scale), float(sell_scale))
+                  for buy_scale in buy_scales or [1] for sell_scale in sell_scales or [1]]
+        batches = []
+        fund_ids = list(portfolios.keys())
+        for batch_start in range(0, len(fund_ids), batch_size):
+            batches.append([(fund_id, portfolios[fund_id].to_bytes())
+                            for fund_id in fund_ids[batch_start:batch_start + batch_size]])
+        settings = (scales, float(initial_value), float(fee_pct) / 100, bool(start_invested), int(max_cells))
+        if len(batches) <= 1 or num_workers == 1:
+            return cls._collect((cls.backtest_batch(batch, history, settings) for batch in batches),
+                                batches, on_batch)
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            batch_results = executor.map(cls.backtest_batch,
+                                         batches,
+                                         [history] * len(batches),
+                                         [settings] * len(batches))
+            return cls._collect(batch_results, batches, on_batch)
+
+    @staticmethod
+    def _collect(batch_results,
+                 batches: List[List[Tuple[str, bytes]]],
+                 on_batch: Optional[Callable[[int], None]]) -> List[BacktestResult]:
+        """
+        Returns the results of every batch, as each batch finishes.
+        """
+        results = []
+        num_funds = 0
+        for batch, batch_result in zip(batches, batch_results):
+            results.extend(batch_result)
+            num_funds += len(batch)
+            if on_batch is not None:
+                on_batch(num_funds)
+        return results
+
+    @classmethod
+    def backtest_batch(cls,
+                       batch: List[Tuple[str, bytes]],
+                       history: PriceHistory,
+                       settings: Tuple[List[Tuple[float, float]], float, float, bool, int]) -> List[BacktestResult]:
+        """
+        Returns the results of a batch of (fund id, encoded portfolio) pairs.
+        """
+        scales, initial_value, fee, start_invested, max_cells = settings
+        results = []
+        for fund_id, portfolio_bytes in batch:
+            portfolio = ColumnarPortfolio.from_bytes(portfolio_bytes)
+            if portfolio is None or len(portfolio) == 0 or len(history) == 0:
+                continue
+            chunk_size = max_cells // (len(history) * len(portfolio))
+            if chunk_size == 0:
+                raise ValueError(f'Backtesting {fund_id} ({len(portfolio)} tokens) over {len(history)} time steps '
+                                 f'needs more than {max_cells} array cells')
+            for chunk_start in range(0, len(scales), chunk_size):
+                chunk = scales[chunk_start:chunk_start + chunk_size]
+                for (buy_scale, sell_scale), metrics in zip(chunk, cls._simulate(portfolio, history, chunk,
+                                                                                  initial_value, fee,
+                                                                                  start_invested)):
+                    results.append(BacktestResult(fund_id=fund_id,
+                                                  buy_scale=buy_scale,
+                                                  sell_scale=sell_scale,
+                                                  **metrics))
+        return results
+
+    @staticmethod
+    def _simulate(portfolio: ColumnarPortfolio,
+                  history: PriceHistory,
+                  scales: List[Tuple[float, float]],
+                  initial_value: float,
+                  fee: float,
+                  start_invested: bool) -> List[Dict]:
+        """
+        Returns the metrics of the portfolio for each (buy_scale, sell_scale) pair,
+            simulated as a scenario x time x position array.
+        """
+        weights = np.clip(portfolio.portfolio_pcts, 0, None)
+        weights = weights / weights.sum() if weights.sum() > 0 else np.full(len(weights), 1 / len(weights))
+        prices = history.token_prices(portfolio.tokens)
+        priced = np.isfinite(prices)
+        buy_scales = np.array([buy_scale for buy_scale, _ in scales])[:, None, None]
+        sell_scales = np.array([sell_scale for _, sell_scale in scales])[:, None, None]
+        buy_targets = portfolio.buy_targets[None, None, :] * buy_scales
+        sell_targets = portfolio.sell_targets[None, None, :] * sell_scales
+
+        # The last target hit decides whether each sleeve holds its token.
+        with np.errstate(invalid='ignore'):
+            signals = np.where(priced & (prices <= buy_targets), 1,
+                               np.where(priced & (prices >= sell_targets), -1, 0))
+        time_steps = np.arange(len(history))[None, :, None]
+        last_signal_steps = np.maximum.accumulate(np.where(signals != 0, time_steps, -1), axis=1)
+        holding = np.take_along_axis(signals, np.clip(last_signal_steps, 0, None), axis=1) == 1
+        holding = np.where(last_signal_steps < 0, start_invested, holding)
+
+        # Grow each sleeve by its token's returns while it holds the token, and charge a fee on each trade.
+        with np.errstate(invalid='ignore', divide='ignore'):
+            returns = np.nan_to_num(prices[1:] / prices[:-1] - 1, nan=0.0, posinf=0.0, neginf=0.0)
+        growth = np.ones(holding.shape)
+        growth[:, 1:] += holding[:, :-1] * returns[None]
+        previous_holding = np.concatenate([np.full(holding[:, :1].shape, start_invested), holding[:, :-1]], axis=1)
+        trades = holding != previous_holding
+        pre_fee_values = initial_value * weights * np.cumprod(growth * np.where(trades, 1 - fee, 1), axis=1) \
+            / np.where(trades, 1 - fee, 1)
+        sleeve_values = pre_fee_values * np.where(trades, 1 - fee, 1)
+        navs = sleeve_values.sum(axis=2)
+
+        # Summarize each scenario.
+        peaks = np.maximum.accumulate(navs, axis=1)
+        drawdowns = 1 - navs / peaks
+        traded_values = (pre_fee_values * trades).sum(axis=(1, 2))
+        first_prices = np.take_along_axis(prices, np.argmax(priced, axis=0)[None, :], axis=0)[0]
+        last_prices = prices[-1]
+        benchmark_growth = np.where(np.isfinite(first_prices) & np.isfinite(last_prices),
+                                    last_prices / np.where(np.isfinite(first_prices), first_prices, 1), 1)
+        benchmark_return_pct = float((weights * benchmark_growth).sum() - 1) * 100
+        return [{'final_value':          float(navs[scenario, -1]),
+                 'return_pct':           float(navs[scenario, -1] / initial_value - 1) * 100,
+                 'benchmark_return_pct': benchmark_return_pct,
+                 'max_drawdown_pct':     float(drawdowns[scenario].max()) * 100,
+                 'turnover':             float(traded_values[scenario] / navs[scenario].mean()),
+                 'num_trades':           int(trades[scenario].sum())}
+                for scenario in range(len(scales))]
@@ -0,0 +1,209 @@
+import copy
+import json
+import os
+import threading
+import time as pytime
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from decouple import config
+
+from backend.fund.BacktestEngine import BacktestEngine
+from backend.fund.PriceHistory import PriceHistory
+from backend.redis.RedisManager import RedisManager
+
+
+class BacktestJob:
+    """
+    Wrapper for a backtest run in the background of an API worker, whose state is kept in Redis
+        so that any worker can report its progress and results.
+    A running job saves its state after each batch of funds. A queued or running job whose state wasn't updated
+        for timeout_sec (e.g. because its worker was restarted or killed) is reported as failed.
+    """
+
+    # The job is waiting for a free background thread.
+    QUEUED = 'queued'
+
+    # The job is running.
+    RUNNING = 'running'
+
+    # The job finished, and its results are available.
+    DONE = 'done'
+
+    # The job failed, and its error is available.
+    FAILED = 'failed'
+
+    # Seconds for which the state of a job is kept after its last update.
+    ttl_sec: float = config('BACKTEST_JOB_TTL_SEC', default=86400, cast=float)
+
+    # Seconds after the last update of a queued or running job's state at which it is considered lost.
+    timeout_sec: float = config('BACKTEST_JOB_TIMEOUT_SEC', default=3600, cast=float)
+
+    # Threads running jobs, re-created lazily in each forked (gunicorn worker) process.
+    _executor: Optional[ThreadPoolExecutor] = None
+
+    # Id of the process that created the job threads.
+    _executor_pid: Optional[int] = None
+
+    # Guards the creation of the job threads.
+    _executor_lock = threading.Lock()
+
+    # Unique id of the job.
+    job_id: str
+
+    # Email of the user who submitted the job, who alone (with admins) may view it.
+    requester_email: str
+
+    # QUEUED, RUNNING, DONE or FAILED.
+    status: str
+
+    # Unix time (in seconds) at which the job was submitted.
+    submitted_at: float
+
+    # Unix time (in seconds) at which the job's state was last saved.
+    updated_at: float
+
+    # Unix time (in seconds) at which the job finished, if it did.
+    finished_at: Optional[float]
+
+    # JSON of each BacktestResult, once the job is done.
+    results: List[Dict]
+
+    # Description of what went wrong, if the job failed.
+    error: Optional[str]
+
+    def __init__(self,
+                 job_id: str,
+                 requester_email: str,
+                 status: str,
+                 submitted_at: float,
+                 updated_at: Optional[float] = None,
+                 finished_at: Optional[float] = None,
+                 results: Optional[List[Dict]] = None,
+                 error: Optional[str] = None):
+        self.job_id = job_id
+        self.requester_email = requester_email
+        self.status = status
+        self.submitted_at = submitted_at
+        self.updated_at = submitted_at if updated_at is None else updated_at
+        self.finished_at = finished_at
+        self.results = results or []
+        self.error = error
+
+    def __str__(self):
+        return json.dumps(self.to_json())
+
+    def to_json(self) -> Dict:
+        return {
+            'job_id':          self.job_id,
+            'requester_email': self.requester_email,
+            'status':          self.status,
+            'submitted_at':    self.submitted_at,
+            'updated_at':      self.updated_at,
+            'finished_at':     self.finished_at,
+            'results':         self.results,
+            'error':           self.error
+        }
+
+    @classmethod
+    def from_json(cls,
+                  json_data: Dict) -> Optional['BacktestJob']:
+        """
+        Converts the json object into a BacktestJob wrapper,
+            or None if the data is invalid.
+        """
+        try:
+            return BacktestJob(job_id=json_data['job_id'],
+                               requester_email=json_data['requester_email'],
+                               status=json_data['status'],
+                               submitted_at=json_data['submitted_at'],
+                               updated_at=json_data.get('updated_at', None),
+                               finished_at=json_data.get('finished_at', None),
+                               results=json_data.get('results', []),
+                               error=json_data.get('error', None))
+        except Exception as e:
+            print(f'ERROR! Something went wrong trying to load a backtest job '
+                  f'from json: {traceback.format_exc()}')
+            return None
+
+    @classmethod
+    def from_db(cls,
+                job_id: str,
+                redis: RedisManager) -> Optional['BacktestJob']:
+        """
+        Loads and returns the job, or None if there is no such job (or it expired).
+        A queued or running job which timed out is marked as failed.
+        """
+        job_str = redis.get_job(job_id)
+        job = None if job_str is None else cls.from_json(json.loads(job_str))
+        if job is not None and job.status in [cls.QUEUED, cls.RUNNING] \
+                and pytime.time() - job.updated_at > cls.timeout_sec:
+            job.error = f'The job was {job.status} without any progress for over {cls.timeout_sec:.0f}s'
+            job.status = cls.FAILED
+            job.finished_at = pytime.time()
+            job.save(redis)
+        return job
+
+    @classmethod
+    def submit(cls,
+               requester_email: str,
+               fund_ids: List[str],
+               history_path: str,
+               redis: RedisManager,
+               **backtest_options) -> Optional['BacktestJob']:
+        """
+        Queues a backtest of the funds over the price history file, and returns the queued job
+            (or None if it couldn't be stored).
+        The backtest_options are passed on to BacktestEngine.backtest().
+        """
+        job = BacktestJob(job_id=uuid.uuid4().hex,
+                          requester_email=requester_email,
+                          status=cls.QUEUED,
+                          submitted_at=pytime.time())
+        if not job.save(redis):
+            return None
+        queued_job = copy.copy(job)
+        with cls._executor_lock:
+            if cls._executor_pid != os.getpid():
+                cls._executor = ThreadPoolExecutor(max_workers=config('BACKTEST_JOB_THREADS', default=1, cast=int),
+                                                   thread_name_prefix='backtest-job')
+                cls._executor_pid = os.getpid()
+            cls._executor.submit(job.run, fund_ids, history_path, redis, backtest_options)
+        return queued_job
+
+    def run(self,
+            fund_ids: List[str],
+            history_path: str,
+            redis: RedisManager,
+            backtest_options: Dict) -> None:
+        """
+        Runs the backtest, saving the job's state as it starts and finishes.
+        """
+        try:
+            self.status = BacktestJob.RUNNING
+            self.save(redis)
+            history = PriceHistory.from_file(history_path)
+            portfolios = {fund_id: portfolio
+                          for fund_id, (manager_email, _, portfolio) in zip(fund_ids, redis.get_funds(fund_ids))
+                          if manager_email is not None and portfolio is not None}
+            results = BacktestEngine.backtest(portfolios, history,
+                                              on_batch=lambda num_funds: self.save(redis),
+                                              **backtest_options)
+            self.results = [result.to_json() for result in results]
+            self.status = BacktestJob.DONE
+        except Exception as e:
+            print(f'Error running backtest job "{self.job_id}": {traceback.format_exc()}')
+            self.error = str(e)
+            self.status = BacktestJob.FAILED
+        self.finished_at = pytime.time()
+        self.save(redis)
+
+    def save(self,
+             redis: RedisManager) -> bool:
+        """
+        Stores the job's current state.
+        """
+        self.updated_at = pytime.time()
+        return redis.set_job(self.job_id, str(self), self.ttl_sec)
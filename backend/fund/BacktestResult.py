@@ -0,0 +1,71 @@
+import json
+from typing import Dict
+
+
+class BacktestResult:
+    """
+    Wrapper for the performance of a fund's buy/sell targets over a price history.
+    """
+
+    # The fund which was backtested.
+    fund_id: str
+
+    # Factor applied to every buy_target of the portfolio (1 for the targets as saved).
+    buy_scale: float
+
+    # Factor applied to every sell_target of the portfolio (1 for the targets as saved).
+    sell_scale: float
+
+    # Value of the fund at the end of the history.
+    final_value: float
+
+    # Return over the history, in percent.
+    return_pct: float
+
+    # Return of buying the portfolio's weights at the start and holding them, in percent.
+    benchmark_return_pct: float
+
+    # Largest fall from a previous peak value, in percent.
+    max_drawdown_pct: float
+
+    # Total value traded, as a multiple of the average value of the fund.
+    turnover: float
+
+    # Number of buys and sells.
+    num_trades: int
+
+    def __init__(self,
+                 fund_id: str,
+                 buy_scale: float,
+                 sell_scale: float,
+                 final_value: float,
+                 return_pct: float,
+                 benchmark_return_pct: float,
+                 max_drawdown_pct: float,
+                 turnover: float,
+                 num_trades: int):
+        self.fund_id = fund_id
+        self.buy_scale = buy_scale
+        self.sell_scale = sell_scale
+        self.final_value = final_value
+        self.return_pct = return_pct
+        self.benchmark_return_pct = benchmark_return_pct
+        self.max_drawdown_pct = max_drawdown_pct
+        self.turnover = turnover
+        self.num_trades = num_trades
+
+    def __str__(self):
+        return json.dumps(self.to_json())
+
+    def to_json(self) -> Dict:
+        return {
+            'fund_id':              self.fund_id,
+            'buy_scale':            self.buy_scale,
+            'sell_scale':           self.sell_scale,
+            'final_value':          self.final_value,
+            'return_pct':           self.return_pct,
+            'benchmark_return_pct': self.benchmark_return_pct,
+            'max_drawdown_pct':     self.max_drawdown_pct,
+            'turnover':             self.turnover,
+            'num_trades':           self.num_trades
+        }
@@ -0,0 +1,202 @@
+import json
+import traceback
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.PortfolioCodec import PortfolioCodec
+from backend.fund.TokenAllocation import TokenAllocation
+from backend.fund.TokenAllocationView import TokenAllocationView
+
+
+class ColumnarPortfolio:
+    """
+    Column-oriented alternative to FundPortfolio, backed by parallel NumPy arrays
+        so that large portfolios are cheap to store and to compute over.
+    """
+
+    # Distinct tokens held in the portfolio.
+    token_strs: List[str]
+
+    # Index (in token_strs) of the token of each position.
+    token_indexes: np.ndarray
+
+    # One row per position: portfolio_pct, buy_target, sell_target.
+    values: np.ndarray
+
+    def __init__(self,
+                 token_strs: List[str],
+                 token_indexes: np.ndarray,
+                 values: np.ndarray):
+        self.token_strs = token_strs
+        self.token_indexes = token_indexes
+        self.values = values
+
+    def __len__(self):
+        return len(self.token_indexes)
+
+    def __getitem__(self, index: int) -> TokenAllocationView:
+        if not -len(self) <= index < len(self):
+            raise IndexError(f'Position {index} is out of range')
+        return TokenAllocationView(self, index % len(self))
+
+    def __iter__(self) -> Iterator[TokenAllocationView]:
+        return (TokenAllocationView(self, index) for index in range(len(self)))
+
+    def __str__(self):
+        return json.dumps(self.to_json())
+
+    @property
+    def tokens(self) -> List[str]:
+        """
+        Token of each position.
+        """
+        return [self.token_strs[token_index] for token_index in self.token_indexes.tolist()]
+
+    @property
+    def portfolio_pcts(self) -> np.ndarray:
+        return self.values[:, 0]
+
+    @property
+    def buy_targets(self) -> np.ndarray:
+        return self.values[:, 1]
+
+    @property
+    def sell_targets(self) -> np.ndarray:
+        return self.values[:, 2]
+
+    def to_json(self) -> Dict:
+        return {
+            'tokens': [{'token':         token,
+                        'portfolio_pct': portfolio_pct,
+                        'buy_target':    buy_target,
+                        'sell_target':   sell_target}
+                       for token, (portfolio_pct, buy_target, sell_target) in zip(self.tokens,
+                                                                                  self.values.tolist())],
+        }
+
+    def to_bytes(self) -> bytes:
+        """
+        Returns the positions in PortfolioCodec's compact binary format.
+        """
+        return PortfolioCodec.encode_packed(token_strs=self.token_strs,
+                                            num_allocations=len(self),
+                                            packed_token_indexes=self.token_indexes.astype('<u4').tobytes(),
+                                            packed_values=self.values.astype('<f8').tobytes())
+
+    def to_portfolio(self) -> FundPortfolio:
+        """
+        Converts the positions into a (lazily decoded) FundPortfolio.
+        """
+        return FundPortfolio.from_bytes(self.to_bytes())
+
+    def normalized(self,
+                   total_pct: float = 100) -> 'ColumnarPortfolio':
+        """
+        Returns a copy of the portfolio whose portfolio_pcts are scaled to add up to total_pct.
+        A portfolio without any weight is given equal weights.
+        """
+        values = self.values.copy()
+        weight_sum = values[:, 0].sum()
+        if weight_sum > 0:
+            values[:, 0] *= total_pct / weight_sum
+        elif len(values) != 0:
+            values[:, 0] = total_pct / len(values)
+        return ColumnarPortfolio(self.token_strs, self.token_indexes, values)
+
+    def invalid_positions(self) -> np.ndarray:
+        """
+        Returns a boolean mask of the positions with a negative or non-finite portfolio_pct,
+            a non-positive or non-finite target, or a buy_target above their sell_target.
+        """
+        finite = np.isfinite(self.values).all(axis=1)
+        return (~finite
+                | (self.portfolio_pcts < 0)
+                | (self.buy_targets <= 0)
+                | (self.sell_targets <= 0)
+                | (self.buy_targets > self.sell_targets))
+
+    def validation_errors(self) -> List[str]:
+        """
+        Returns a description of each problem with the portfolio, or an empty list if it is valid.
+        """
+        errors = [f'Invalid portfolio_pct, buy_target or sell_target for {self.tokens[index]}'
+                  for index in np.flatnonzero(self.invalid_positions()).tolist()]
+        token_counts = np.bincount(self.token_indexes, minlength=len(self.token_strs))
+        errors += [f'{self.token_strs[token_index]} is held in more than one position'
+                   for token_index in np.flatnonzero(token_counts > 1).tolist()]
+        if len(self) != 0 and not self.portfolio_pcts.sum() > 0:
+            errors.append('The portfolio_pcts must add up to more than 0')
+        return errors
+
+    def top_n(self,
+              n: int) -> 'ColumnarPortfolio':
+        """
+        Returns the n positions with the highest portfolio_pct, from highest to lowest.
+        """
+        if n < len(self):
+            top_indexes = np.argpartition(-self.portfolio_pcts, n)[:n]
+        else:
+            top_indexes = np.arange(len(self))
+        top_indexes = top_indexes[np.argsort(-self.portfolio_pcts[top_indexes], kind='stable')]
+        return ColumnarPortfolio(self.token_strs, self.token_indexes[top_indexes], self.values[top_indexes])
+
+    @classmethod
+    def from_bytes(cls,
+                   bytes_data: bytes) -> Optional['ColumnarPortfolio']:
+        """
+        Converts stored bytes (binary-encoded or JSON) into a ColumnarPortfolio,
+            or None if the data is invalid.
+        Binary-encoded positions are viewed in place, without copying them.
+        """
+        try:
+            if not PortfolioCodec.is_binary(bytes_data):
+                return cls.from_json(json.loads(bytes_data.decode('utf-8')))
+            token_strs, num_allocations, token_indexes_offset, values_offset = \
+                PortfolioCodec.decode_header(bytes_data)
+            token_indexes = np.frombuffer(bytes_data, dtype='<u4', count=num_allocations,
+                                          offset=token_indexes_offset)
+            values = np.frombuffer(bytes_data, dtype='<f8', count=num_allocations * PortfolioCodec.VALUES_PER_TOKEN,
+                                   offset=values_offset).reshape(num_allocations, PortfolioCodec.VALUES_PER_TOKEN)
+            return ColumnarPortfolio(token_strs=token_strs,
+                                     token_indexes=token_indexes,
+                                     values=values)
+        except Exception as e:
+            print(f'ERROR! Something went wrong trying to load portfolio data '
+                  f'from bytes: {traceback.format_exc()}')
+            return None
+
+    @classmethod
+    def from_portfolio(cls,
+                       portfolio: FundPortfolio) -> Optional['ColumnarPortfolio']:
+        """
+        Converts a FundPortfolio into a ColumnarPortfolio (without decoding it if it is still encoded).
+        """
+        return cls.from_bytes(portfolio.to_bytes())
+
+    @classmethod
+    def from_json(cls,
+                  json_data: Dict) -> Optional['ColumnarPortfolio']:
+        """
+        Converts the json object (in FundPortfolio's to_json() shape) into a ColumnarPortfolio,
+            or None if the data is invalid.
+        """
+        try:
+            token_allocations = [TokenAllocation.from_json(token_json) for token_json in json_data.get('tokens', [])]
+            token_indexes = {}
+            for token_allocation in token_allocations:
+                token_indexes.setdefault(str(token_allocation.token), len(token_indexes))
+            return ColumnarPortfolio(
+                token_strs=list(token_indexes.keys()),
+                token_indexes=np.array([token_indexes[str(token_allocation.token)]
+                                        for token_allocation in token_allocations], dtype='<u4'),
+                values=np.array([[token_allocation.portfolio_pct,
+                                  token_allocation.buy_target,
+                                  token_allocation.sell_target]
+                                 for token_allocation in token_allocations],
+                                dtype='<f8').reshape(len(token_allocations), PortfolioCodec.VALUES_PER_TOKEN))
+        except Exception as e:
+            print(f'ERROR! Something went wrong trying to load portfolio data '
+                  f'from json: {traceback.format_exc()}')
+            return None
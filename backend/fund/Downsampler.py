@@ -0,0 +1,92 @@
+import numpy as np
+
+
+class Downsampler:
+    """
+    Picks which points of a time series to keep so that it still looks the same when drawn with fewer points.
+    Both methods return the sorted indexes of the kept points, always including the first and last points.
+    """
+
+    # Largest-Triangle-Three-Buckets: keeps the most visually significant point of each bucket.
+    LTTB = 'lttb'
+
+    # Keeps the lowest and highest point of each bucket, so that no spike is lost.
+    MIN_MAX = 'minmax'
+
+    @classmethod
+    def downsample(cls,
+                   x: np.ndarray,
+                   y: np.ndarray,
+                   num_points: int,
+                   method: str = LTTB) -> np.ndarray:
+        """
+        Returns the indexes of (at most) num_points points of the series, chosen by the method (LTTB or MIN_MAX).
+        """
+        if method == cls.LTTB:
+            return cls.lttb(x, y, num_points)
+        if method == cls.MIN_MAX:
+            return cls.min_max(x, y, num_points)
+        raise ValueError(f'Unknown downsampling method: "{method}"')
+
+    @staticmethod
+    def lttb(x: np.ndarray,
+             y: np.ndarray,
+             num_points: int) -> np.ndarray:
+        """
+        Returns the indexes of the points kept by Largest-Triangle-Three-Buckets.
+        The points between the first and last are split into num_points - 2 buckets, and each bucket keeps the
+            point forming the largest triangle with the previously kept point and the next bucket's average.
+        """
+        num_source_points = len(x)
+        if num_points >= num_source_points:
+            return np.arange(num_source_points)
+        if num_points < 3:
+            return np.array([0, num_source_points - 1])[:max(num_points, 0)]
+
+        # Bucket averages, from cumulative sums.
+        x = x.astype(float)
+        y = y.astype(float)
+        bucket_edges = np.linspace(1, num_source_points - 1, num_points - 1).astype(int)
+        x_sums = np.concatenate([[0], np.cumsum(x)])
+        y_sums = np.concatenate([[0], np.cumsum(y)])
+        bucket_sizes = np.diff(bucket_edges)
+        x_averages = (x_sums[bucket_edges[1:]] - x_sums[bucket_edges[:-1]]) / bucket_sizes
+        y_averages = (y_sums[bucket_edges[1:]] - y_sums[bucket_edges[:-1]]) / bucket_sizes
+        x_averages = np.append(x_averages, x[-1])
+        y_averages = np.append(y_averages, y[-1])
+
+        kept = np.empty(num_points, dtype=int)
+        kept[0] = 0
+        kept[-1] = num_source_points - 1
+        previous = 0
+        for bucket in range(num_points - 2):
+            start, end = bucket_edges[bucket], bucket_edges[bucket + 1]
+            next_x, next_y = x_averages[bucket + 1], y_averages[bucket + 1]
+            areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                           - (x[previous] - x[start:end]) * (next_y - y[previous]))
+            previous = start + int(np.argmax(areas))
+            kept[bucket + 1] = previous
+        return kept
+
+    @staticmethod
+    def min_max(x: np.ndarray,
+                y: np.ndarray,
+                num_points: int) -> np.ndarray:
+        """
+        Returns the indexes of the first and last points, and of the lowest and highest point of each of
+            (num_points - 2) / 2 equal-width buckets (so only the first and last if num_points is below 4).
+        """
+        num_source_points = len(x)
+        if num_points >= num_source_points:
+            return np.arange(num_source_points)
+        if num_points < 4:
+            return np.array([0, num_source_points - 1])[:max(num_points, 0)]
+        num_buckets = (num_points - 2) // 2
+        bucket_ids = np.minimum((np.arange(num_source_points) * num_buckets) // num_source_points, num_buckets - 1)
+
+        # Sort by bucket, then by value: each bucket's minimum comes first and its maximum last.
+        order = np.lexsort((y, bucket_ids))
+        bucket_starts = np.flatnonzero(np.diff(bucket_ids[order], prepend=-1))
+        bucket_ends = np.append(bucket_starts[1:], num_source_points) - 1
+        kept = np.concatenate([[0, num_source_points - 1], order[bucket_starts], order[bucket_ends]])
+        return np.unique(kept)
@@ -0,0 +1,145 @@
+import json
+import math
+import time as pytime
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from decouple import config
+
+from backend.fund.Downsampler import Downsampler
+from backend.redis.LocalCache import LocalCache
+from backend.redis.RedisManager import NAV_RESOLUTIONS, RedisManager
+
+
+class FundHistory:
+    """
+    Wrapper for a fund's NAV over a time range, downsampled to a point budget for drawing.
+    """
+
+    # Source resolution when the raw snapshots are used instead of a rollup.
+    RAW = 'raw'
+
+    # Most points read from Redis to answer one query; coarser rollups are used for longer ranges.
+    max_source_points: int = config('NAV_HISTORY_MAX_SOURCE_POINTS', default=20000, cast=int)
+
+    # Downsampled histories, by fund id, aligned range, number of points and method.
+    _cache: LocalCache = LocalCache('fund_histories',
+                                    ttl_sec=config('NAV_HISTORY_CACHE_TTL_SEC', default=30, cast=float))
+
+    # The fund whose NAV is drawn.
+    fund_id: str
+
+    # Unix time (in seconds) at which the range starts.
+    start: float
+
+    # Unix time (in seconds) at which the range ends.
+    end: float
+
+    # Data the points were taken from: RAW or a NAV_RESOLUTIONS key.
+    resolution: str
+
+    # Downsampling method: Downsampler.LTTB or Downsampler.MIN_MAX.
+    method: str
+
+    # (unix time, NAV) points, oldest first.
+    points: List[Tuple[float, float]]
+
+    def __init__(self,
+                 fund_id: str,
+                 start: float,
+                 end: float,
+                 resolution: str,
+                 method: str,
+                 points: List[Tuple[float, float]]):
+        self.fund_id = fund_id
+        self.start = start
+        self.end = end
+        self.resolution = resolution
+        self.method = method
+        self.points = points
+
+    def __str__(self):
+        return json.dumps(self.to_json())
+
+    def to_json(self) -> Dict:
+        return {
+            'fund_id':    self.fund_id,
+            'start':      self.start,
+            'end':        self.end,
+            'resolution': self.resolution,
+            'method':     self.method,
+            'points':     self.points
+        }
+
+    @classmethod
+    def from_db(cls,
+                fund_id: str,
+                redis: RedisManager,
+                start: float,
+                end: float,
+                num_points: int,
+                method: str = Downsampler.LTTB,
+                use_cache: bool = True) -> Optional['FundHistory']:
+        """
+        Loads the fund's NAV between start and end, from the finest data which covers the range without reading
+            more than max_source_points, and downsamples it to num_points.
+        The range is widened to a multiple of (end - start) / num_points, so that dashboards reloading a
+            moving range reuse recently cached results.
+        """
+        try:
+            granularity = max(1, int((end - start) / max(num_points, 1)))
+            start = math.floor(start / granularity) * granularity
+            end = math.ceil(end / granularity) * granularity
+            cache_key = f'{RedisManager.fund_key(fund_id)}:{start}:{end}:{num_points}:{method}'
+            if use_cache:
+                cached_history = cls._cache.get(cache_key)
+                if cached_history is not LocalCache.MISSING:
+                    return cached_history
+
+            # Load the series.
+            resolution = cls.source_resolution(redis, start, end, num_points)
+            if resolution == cls.RAW:
+                snapshots = redis.get_nav_snapshots(fund_id, start, end)
+                times = np.array([snapshot.timestamp for snapshot in snapshots])
+                navs = np.array([snapshot.nav for snapshot in snapshots])
+            else:
+                buckets = redis.get_nav_buckets(fund_id, resolution, start, end)
+                times = np.array([bucket.start for bucket in buckets])
+                navs = np.array([bucket.close for bucket in buckets])
+
+            # Downsample it.
+            kept = Downsampler.downsample(times, navs, num_points, method)
+            history = FundHistory(fund_id=fund_id,
+                                  start=start,
+                                  end=end,
+                                  resolution=resolution,
+                                  method=method,
+                                  points=list(zip(times[kept].tolist(), navs[kept].tolist())))
+            cls._cache.set(cache_key, history)
+            return history
+        except Exception as e:
+            print(f'ERROR! Something went wrong trying to load the NAV history of "{fund_id}" '
+                  f'from redis: {traceback.format_exc()}')
+            return None
+
+    @classmethod
+    def source_resolution(cls,
+                          redis: RedisManager,
+                          start: float,
+                          end: float,
+                          num_points: int) -> str:
+        """
+        Returns the data to draw the range from: the raw snapshots if even 1m buckets would be fewer than
+            num_points, or else the finest rollup which is retained back to start and has at most
+            max_source_points buckets in the range.
+        """
+        now = pytime.time()
+        range_sec = end - start
+        if range_sec / NAV_RESOLUTIONS['1m'] <= num_points and start >= now - redis.nav_snapshot_retention_sec:
+            return cls.RAW
+        for resolution, bucket_sec in NAV_RESOLUTIONS.items():
+            if range_sec / bucket_sec <= cls.max_source_points \
+                    and start >= now - redis.nav_rollup_retention_sec[resolution]:
+                return resolution
+        return list(NAV_RESOLUTIONS.keys())[-1]
@@ -0,0 +1,93 @@
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+from backend.fund.IndexFundSnapshot import IndexFundSnapshot
+from backend.redis.RedisManager import RedisManager
+
+
+class FundListing:
+    """
+    Lists funds a page at a time, in order of id, either among every fund or among a user's funds.
+    Every fund is listed from the sorted index of fund ids (which save_fund() keeps up to date), and a user's
+        funds from the user's sorted set of fund ids, both read from the cursor onwards with ZRANGEBYLEX. The cursor
+        is the id of the last fund of the previous page, so pages stay consistent while funds are being created.
+    Funds are listed as summaries (without their portfolios) by default, or as full snapshots loaded in batches.
+    """
+
+    # Every fund.
+    ALL = 'all'
+
+    # Funds managed by the user.
+    MANAGED = 'managed'
+
+    # Funds in which the user invests, but doesn't manage.
+    INVESTED = 'invested'
+
+    # Every supported scope.
+    SCOPES = [ALL, MANAGED, INVESTED]
+
+    @classmethod
+    def list_funds(cls,
+                   redis: RedisManager,
+                   scope: str = ALL,
+                   user_email: Optional[str] = None,
+                   cursor: Optional[str] = None,
+                   page_size: int = 50,
+                   full: bool = False) -> Optional[Tuple[List[Dict], Optional[str]]]:
+        """
+        Returns up to page_size funds in the scope (the user's funds, for MANAGED and INVESTED) after the cursor,
+            each as a summary ({fund_id, manager_email, num_investors, version}) or as a full snapshot,
+            and the cursor of the next page, or None as the cursor if there are no more funds.
+        Returns None if the funds couldn't be read.
+        """
+        try:
+            if scope == cls.ALL:
+                fund_ids = redis.get_fund_ids_page(cursor, page_size + 1)
+                next_cursor = fund_ids[page_size - 1] if len(fund_ids) > page_size else None
+                fund_ids = fund_ids[:page_size]
+                summaries = redis.get_fund_summaries(fund_ids) if not full else None
+            else:
+                fund_ids, summaries, next_cursor = cls._list_user_funds(redis, scope, user_email, cursor, page_size)
+            if full:
+                return [snapshot.to_json() for snapshot in IndexFundSnapshot.load_many(fund_ids, redis)], next_cursor
+            return [{'fund_id':       fund_id,
+                     'manager_email': manager_email,
+                     'num_investors': num_investors,
+                     'version':       version}
+                    for fund_id, (manager_email, num_investors, version) in zip(fund_ids, summaries)
+                    if manager_email is not None], next_cursor
+        except Exception as e:
+            print(f'ERROR! Something went wrong trying to list the {scope} funds of {user_email} '
+                  f'after "{cursor}" from redis: {traceback.format_exc()}')
+            return None
+
+    @classmethod
+    def _list_user_funds(cls,
+                         redis: RedisManager,
+                         scope: str,
+                         user_email: str,
+                         cursor: Optional[str],
+                         page_size: int) -> Tuple[List[str], List[Tuple[Optional[str], int, int]], Optional[str]]:
+        """
+        Returns the ids and summaries of up to page_size of the user's funds in the scope after the cursor,
+            and the cursor of the next page. The user's funds are checked in chunks, each in one round trip.
+        """
+        if scope not in [cls.MANAGED, cls.INVESTED]:
+            raise ValueError(f'Unknown fund scope "{scope}" (expected one of {cls.SCOPES})')
+        chunk_size = max(2 * page_size, 100)
+        fund_ids = []
+        summaries = []
+        while True:
+            chunk = redis.get_user_fund_ids_page(user_email, cursor, chunk_size)
+            for chunk_idx, (fund_id, summary) in enumerate(zip(chunk, redis.get_fund_summaries(chunk))):
+                manager_email = summary[0]
+                if manager_email is not None and (manager_email == user_email) == (scope == cls.MANAGED):
+                    fund_ids.append(fund_id)
+                    summaries.append(summary)
+                    if len(fund_ids) == page_size:
+                        more = chunk_idx + 1 < len(chunk) or \
+                            len(redis.get_user_fund_ids_page(user_email, fund_id, 1)) != 0
+                        return fund_ids, summaries, fund_id if more else None
+            if len(chunk) < chunk_size:
+                return fund_ids, summaries, None
+            cursor = chunk[-1]
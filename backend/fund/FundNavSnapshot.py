@@ -0,0 +1,73 @@
+import json
+from typing import Dict, Optional
+
+import numpy as np
+
+from backend.fund.ColumnarPortfolio import ColumnarPortfolio
+from backend.fund.FundPortfolio import FundPortfolio
+
+
+class FundNavSnapshot:
+    """
+    Wrapper for the value of a fund at one point in time, and the share of that value held in each token.
+    """
+
+    # The fund which was valued.
+    fund_id: str
+
+    # Unix time (in seconds) of the snapshot.
+    timestamp: float
+
+    # Net asset value of the fund.
+    nav: float
+
+    # Percent of the NAV held in each token.
+    allocations: Dict[str, float]
+
+    def __init__(self,
+                 fund_id: str,
+                 timestamp: float,
+                 nav: float,
+                 allocations: Dict[str, float]):
+        self.fund_id = fund_id
+        self.timestamp = timestamp
+        self.nav = nav
+        self.allocations = allocations
+
+    def __str__(self):
+        return json.dumps(self.to_json())
+
+    def to_json(self) -> Dict:
+        return {
+            'fund_id':     self.fund_id,
+            'timestamp':   self.timestamp,
+            'nav':         self.nav,
+            'allocations': self.allocations
+        }
+
+    @classmethod
+    def from_portfolio(cls,
+                       fund_id: str,
+                       portfolio: FundPortfolio,
+                       prices: Dict[str, float],
+                       timestamp: float) -> Optional['FundNavSnapshot']:
+        """
+        Values the fund as an index: a basket holding portfolio_pct / 100 units of each token.
+        Returns None if any token in the portfolio has no price (or the portfolio is empty),
+            rather than recording a misleading jump in value.
+        """
+        columnar = ColumnarPortfolio.from_portfolio(portfolio)
+        if columnar is None or len(columnar) == 0:
+            return None
+        token_prices = np.array([float(prices.get(token, np.nan)) for token in columnar.token_strs])
+        position_prices = token_prices[columnar.token_indexes]
+        if not np.isfinite(position_prices).all():
+            return None
+        position_values = np.clip(columnar.portfolio_pcts, 0, None) / 100 * position_prices
+        nav = float(position_values.sum())
+        token_values = np.bincount(columnar.token_indexes, weights=position_values, minlength=len(columnar.token_strs))
+        return FundNavSnapshot(fund_id=fund_id,
+                               timestamp=timestamp,
+                               nav=nav,
+                               allocations={token: 0 if nav == 0 else round(float(value) / nav * 100, 6)
+                                            for token, value in zip(columnar.token_strs, token_values.tolist())})
@@ -0,0 +1,142 @@
+import json
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.TokenAllocation import TokenAllocation
+from backend.util import clean_email
+
+
+class FundPatch:
+    """
+    Wrapper for changes to individual positions and investors of a fund, so that a fund can be edited
+        without resending (and rewriting) all of its data.
+    """
+
+    # Fields of a position which a patch may set.
+    TOKEN_FIELDS = ['portfolio_pct', 'buy_target', 'sell_target']
+
+    # Positions to add, or fields to change in existing positions, i.e. [{token: ERG, sell_target: 3}, ...].
+    # New positions need a buy_target and sell_target (and portfolio_pct defaults to 1).
+    set_tokens: List[Dict]
+
+    # Tokens whose positions are removed.
+    remove_tokens: List[str]
+
+    # Emails of the investors to add.
+    add_investor_emails: List[str]
+
+    # Emails of the investors to remove.
+    remove_investor_emails: List[str]
+
+    # Version of the fund which the patch was made against, to refuse it if the fund changed since
+    #   (or None to apply it to whatever the latest version is).
+    version: Optional[int]
+
+    def __init__(self,
+                 set_tokens: Optional[List[Dict]] = None,
+                 remove_tokens: Optional[List[str]] = None,
+                 add_investor_emails: Optional[List[str]] = None,
+                 remove_investor_emails: Optional[List[str]] = None,
+                 version: Optional[int] = None):
+        self.set_tokens = set_tokens or []
+        self.remove_tokens = remove_tokens or []
+        self.add_investor_emails = add_investor_emails or []
+        self.remove_investor_emails = remove_investor_emails or []
+        self.version = version
+
+    def __str__(self):
+        return json.dumps(self.to_json())
+
+    def __len__(self):
+        return len(self.set_tokens) + len(self.remove_tokens) \
+            + len(self.add_investor_emails) + len(self.remove_investor_emails)
+
+    def to_json(self) -> Dict:
+        return {
+            'set_tokens':             self.set_tokens,
+            'remove_tokens':          self.remove_tokens,
+            'add_investor_emails':    self.add_investor_emails,
+            'remove_investor_emails': self.remove_investor_emails,
+            'version':                self.version
+        }
+
+    def apply(self,
+              portfolio: FundPortfolio) -> Tuple[FundPortfolio, List[Dict], List[str]]:
+        """
+        Returns a patched copy of the portfolio, the json of each position that was added or changed,
+            and the tokens whose positions were removed.
+        Raises ValueError if a new position lacks a buy_target or sell_target.
+        """
+        remove_tokens = set(self.remove_tokens)
+        removed_tokens = sorted({str(token.token) for token in portfolio.tokens if str(token.token) in remove_tokens})
+        tokens = [TokenAllocation(token=token.token,
+                                  portfolio_pct=token.portfolio_pct,
+                                  buy_target=token.buy_target,
+                                  sell_target=token.sell_target)
+                  for token in portfolio.tokens if str(token.token) not in remove_tokens]
+        changed_tokens = []
+        for token_fields in self.set_tokens:
+            matching_tokens = [token for token in tokens if str(token.token) == token_fields['token']]
+            if len(matching_tokens) == 0:
+                if 'buy_target' not in token_fields or 'sell_target' not in token_fields:
+                    raise ValueError(f"New token {token_fields['token']} needs a 'buy_target' and 'sell_target'")
+                new_token = TokenAllocation(token=token_fields['token'],
+                                            portfolio_pct=float(token_fields.get('portfolio_pct', 1)),
+                                            buy_target=token_fields['buy_target'],
+                                            sell_target=token_fields['sell_target'])
+                tokens.append(new_token)
+                changed_tokens.append(new_token)
+                continue
+            for token in matching_tokens:
+                changed_fields = [field for field in self.TOKEN_FIELDS
+                                  if field in token_fields and getattr(token, field) != token_fields[field]]
+                for field in changed_fields:
+                    setattr(token, field, token_fields[field])
+                if len(changed_fields) != 0 and token not in changed_tokens:
+                    changed_tokens.append(token)
+        return FundPortfolio(tokens=tokens), [token.to_json() for token in changed_tokens], removed_tokens
+
+    @classmethod
+    def from_str(cls,
+                 str_data: str) -> Optional['FundPatch']:
+        """
+        Converts the string into a FundPatch wrapper,
+            or None if the data is invalid.
+        """
+        return cls.from_json(json.loads(str_data))
+
+    @classmethod
+    def from_json(cls,
+                  json_data: Dict) -> Optional['FundPatch']:
+        """
+        Converts the json object into a FundPatch wrapper,
+            or None if the data is invalid (i.e. a token or investor is both added and removed).
+        """
+        try:
+            set_tokens = []
+            for token_json in json_data.get('set_tokens', []):
+                token_fields = {'token': str(token_json.get('token', token_json.get('id', None)))}
+                assert token_fields['token'] != 'None'
+                for field in cls.TOKEN_FIELDS:
+                    if token_json.get(field, None) is not None:
+                        token_fields[field] = float(token_json[field])
+                set_tokens.append(token_fields)
+            remove_tokens = [str(token) for token in json_data.get('remove_tokens', [])]
+            add_investor_emails = list(dict.fromkeys(clean_email(email)
+                                                     for email in json_data.get('add_investor_emails', [])))
+            remove_investor_emails = list(dict.fromkeys(clean_email(email)
+                                                        for email in json_data.get('remove_investor_emails', [])))
+            version = json_data.get('version', None)
+            assert len({token_fields['token'] for token_fields in set_tokens}) == len(set_tokens)
+            assert len(set(remove_tokens).intersection(token_fields['token'] for token_fields in set_tokens)) == 0
+            assert len(set(add_investor_emails).intersection(remove_investor_emails)) == 0
+            return FundPatch(set_tokens=set_tokens,
+                             remove_tokens=remove_tokens,
+                             add_investor_emails=add_investor_emails,
+                             remove_investor_emails=remove_investor_emails,
+                             version=None if version is None else int(version))
+        except Exception as e:
+            print(f'ERROR! Something went wrong trying to load a fund patch '
+                  f'from json: {traceback.format_exc()}')
+            return None
@@ -2,6 +2,7 @@ import json
 import traceback
 from typing import Dict, List, Optional
 
+from backend.fund.PortfolioCodec import PortfolioCodec
 from backend.fund.TokenAllocation import TokenAllocation
 
 
@@ -10,12 +11,32 @@ class FundPortfolio:
     Wrapper for a list of asset positions.
     """
     
-    # List of asset positions which the fund desires.
-    tokens: List[TokenAllocation]
+    # List of asset positions which the fund desires (None until _encoded is decoded).
+    _tokens: Optional[List[TokenAllocation]]
+
+    # Binary-encoded positions, kept until the positions are first accessed.
+    _encoded: Optional[bytes]
 
     def __init__(self,
                  tokens: List[TokenAllocation]):
-        self.tokens = tokens
+        self._tokens = tokens
+        self._encoded = None
+
+    @property
+    def tokens(self) -> List[TokenAllocation]:
+        """
+        List of asset positions which the fund desires.
+        """
+        if self._tokens is None:
+            self._tokens = PortfolioCodec.decode(self._encoded)
+            self._encoded = None
+        return self._tokens
+
+    @tokens.setter
+    def tokens(self,
+               tokens: List[TokenAllocation]) -> None:
+        self._tokens = tokens
+        self._encoded = None
 
     def __str__(self):
         return json.dumps(self.to_json())
@@ -25,6 +46,36 @@ class FundPortfolio:
             'tokens': [token.to_json() for token in self.tokens],
         }
 
+    def token_pcts(self) -> Dict[str, float]:
+        """
+        Returns the portfolio's total portfolio_pct in each token.
+        """
+        token_pcts = {}
+        for token in self.tokens:
+            token_pcts[str(token.token)] = token_pcts.get(str(token.token), 0) + float(token.portfolio_pct)
+        return token_pcts
+
+    def to_bytes(self) -> bytes:
+        """
+        Returns the positions in PortfolioCodec's compact binary format.
+        """
+        return self._encoded if self._tokens is None else PortfolioCodec.encode(self._tokens)
+
+    @classmethod
+    def from_bytes(cls,
+                   bytes_data: bytes) -> Optional['FundPortfolio']:
+        """
+        Converts stored bytes (binary-encoded or JSON) into a FundPortfolio wrapper,
+            or None if the data is invalid.
+        Binary-encoded positions are only decoded when they are first accessed.
+        """
+        if not PortfolioCodec.is_binary(bytes_data):
+            return cls.from_str(bytes_data.decode('utf-8'))
+        portfolio = FundPortfolio(tokens=[])
+        portfolio._tokens = None
+        portfolio._encoded = bytes(bytes_data)
+        return portfolio
+
     @classmethod
     def from_str(cls,
                  str_data: str) -> Optional['FundPortfolio']:
@@ -0,0 +1,84 @@
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+from backend.redis.RedisManager import RedisManager
+
+
+class FundSearch:
+    """
+    Finds the funds holding every one of several tokens, each within a range of portfolio_pct,
+        using each token's index of funds sorted by portfolio_pct rather than scanning every portfolio.
+    The token with the fewest matching funds drives the search: its matches are read in pages, from highest to
+        lowest portfolio_pct, and checked against the other tokens' indexes. Results come in that order, and
+        the cursor ('token:offset') names that token and the number of its matches already read, so that later
+        pages keep the same driving token even if the tokens' match counts change in between.
+    """
+
+    @staticmethod
+    def parse_cursor(cursor: str,
+                     pct_ranges: List[Tuple[str, float, float]]) -> Tuple[str, int]:
+        """
+        Returns the driving token and offset of a cursor returned by search() for the same token ranges.
+        Raises ValueError if the cursor isn't one.
+        """
+        token, _, offset = cursor.rpartition(':')
+        if token not in {token for token, _, _ in pct_ranges} or not offset.isdigit():
+            raise ValueError(f'Invalid fund search cursor "{cursor}"')
+        return token, int(offset)
+
+    @classmethod
+    def search(cls,
+               redis: RedisManager,
+               pct_ranges: List[Tuple[str, float, float]],
+               cursor: Optional[str] = None,
+               page_size: int = 50,
+               max_scanned: int = 5000) -> Optional[Tuple[List[Dict], Optional[str]]]:
+        """
+        Returns up to page_size matching funds (each as its id and its portfolio_pct in every searched token)
+            and the cursor of the next page, or None as the cursor if there are no more matches.
+        A page may be cut short after checking max_scanned funds, so that sparse matches don't make a request
+            read a whole index; the returned cursor then continues where it stopped.
+        Returns None if the indexes couldn't be read.
+        """
+        try:
+            counts = redis.count_token_funds(pct_ranges)
+            if len(counts) == 0 or min(counts) == 0:
+                return [], None
+            if cursor is None:
+                driving_idx = counts.index(min(counts))
+                start = 0
+            else:
+                driving_token, start = cls.parse_cursor(cursor, pct_ranges)
+                driving_idx = [token for token, _, _ in pct_ranges].index(driving_token)
+            driving_token, driving_min_pct, driving_max_pct = pct_ranges[driving_idx]
+            other_ranges = [pct_range for idx, pct_range in enumerate(pct_ranges) if idx != driving_idx]
+
+            funds = []
+            offset = start
+            chunk_size = max(2 * page_size, 100)
+            while offset - start < max_scanned:
+                chunk = redis.get_token_funds(driving_token, driving_min_pct, driving_max_pct, offset, chunk_size)
+                other_pcts = redis.get_token_pcts([fund_id for fund_id, _ in chunk],
+                                                  [token for token, _, _ in other_ranges])
+                for chunk_idx, (fund_id, driving_pct) in enumerate(chunk):
+                    pcts = {driving_token: driving_pct}
+                    for (token, min_pct, max_pct), token_pcts in zip(other_ranges, other_pcts):
+                        pct = token_pcts[chunk_idx]
+                        if pct is None or not min_pct <= pct <= max_pct:
+                            break
+                        pcts[token] = pct
+                    else:
+                        funds.append({'fund_id': fund_id, 'pcts': pcts})
+                        if len(funds) == page_size:
+                            next_offset = offset + chunk_idx + 1
+                            if next_offset < counts[driving_idx]:
+                                return funds, f'{driving_token}:{next_offset}'
+                            return funds, None
+                offset += len(chunk)
+                if len(chunk) < chunk_size:
+                    return funds, None
+            return funds, f'{driving_token}:{offset}' if offset < counts[driving_idx] else None
+        except Exception as e:
+            print(f'ERROR! Something went wrong trying to search funds by {pct_ranges} '
+                  f'in redis: {traceback.format_exc()}')
+            return None
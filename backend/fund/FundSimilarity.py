@@ -0,0 +1,163 @@
+import json
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from decouple import config
+
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.redis.RedisManager import RedisManager
+
+
+class FundSimilarity:
+    """
+    Finds the funds whose portfolios are most alike, treating each portfolio as a sparse vector of its
+        portfolio_pct in each token.
+    Candidates are read from each token's fund index (which save_fund() keeps up to date), so only funds sharing
+        a token with a fund are ever scored, and a batch of funds is scored against all of its candidates at once,
+        as a product of the batch's (fund x token) matrix with the candidates' (token x fund) matrix.
+    Each fund's most similar funds are cached in Redis along with the vector version of every listed fund and of
+        every token the fund holds, and the cached list is ignored as soon as any of those funds changes portfolio,
+        or any fund holding one of those tokens is created or changes portfolio.
+    """
+
+    # Cosine of the angle between the two portfolio_pct vectors.
+    COSINE = 'cosine'
+
+    # Share of the portfolios' weights (each portfolio_pct divided by the portfolio's total) held in common.
+    OVERLAP = 'overlap'
+
+    # Every supported metric.
+    METRICS = [COSINE, OVERLAP]
+
+    # Number of similar funds computed and cached for each fund.
+    max_k: int = config('SIMILAR_FUNDS_MAX_K', default=50, cast=int)
+
+    # Seconds for which a fund's similar funds are cached.
+    ttl_sec: float = config('SIMILAR_FUNDS_CACHE_TTL_SEC', default=3600, cast=float)
+
+    @classmethod
+    def similar_funds(cls,
+                      fund_id: str,
+                      redis: RedisManager,
+                      metric: str = COSINE,
+                      k: int = 10,
+                      use_cache: bool = True) -> Optional[List[Dict]]:
+        """
+        Returns up to k (at most max_k) funds most similar to the fund by the metric, from most to least similar,
+            each as its id and similarity.
+        Returns None if the fund has no portfolio or the indexes couldn't be read.
+        """
+        try:
+            if use_cache:
+                cached_str = redis.get_similar_funds(fund_id, metric)
+                if cached_str is not None:
+                    cached = json.loads(cached_str)
+                    fund_ids = [cached_fund_id for cached_fund_id, _ in cached['versions']]
+                    tokens = [token for token, _ in cached.get('token_versions', [])]
+                    versions, token_versions = redis.get_similarity_versions(fund_ids, tokens)
+                    if 'token_versions' in cached and versions == [version for _, version in cached['versions']] \
+                            and token_versions == [version for _, version in cached['token_versions']]:
+                        return cached['funds'][:k]
+            portfolio = redis.get_fund_portfolio(fund_id)
+            if portfolio is None:
+                return None
+            return cls.cache_batch({fund_id: portfolio}, redis, metric)[fund_id][:k]
+        except Exception as e:
+            print(f'ERROR! Something went wrong trying to find the funds similar to "{fund_id}" '
+                  f'by {metric}: {traceback.format_exc()}')
+            return None
+
+    @classmethod
+    def cache_batch(cls,
+                    portfolios: Dict[str, FundPortfolio],
+                    redis: RedisManager,
+                    metric: str = COSINE) -> Dict[str, List[Dict]]:
+        """
+        Computes and caches the max_k funds most similar to each fund in the batch by the metric, and returns them.
+        """
+        token_pcts = {fund_id: portfolio.token_pcts() for fund_id, portfolio in portfolios.items()}
+        tokens = sorted({token for pcts in token_pcts.values() for token in pcts.keys()})
+        _, token_versions = redis.get_similarity_versions([], tokens)
+        token_versions = dict(zip(tokens, token_versions))
+        neighbours, fund_versions = cls.nearest(portfolios, redis, metric, cls.max_k)
+        similar_funds = {}
+        similar_jsons = {}
+        for fund_id, fund_neighbours in neighbours.items():
+            similar_funds[fund_id] = [{'fund_id': neighbour_id, 'similarity': similarity}
+                                      for neighbour_id, similarity in fund_neighbours]
+            versions = [[listed_fund_id, fund_versions.get(listed_fund_id, 0)]
+                        for listed_fund_id in [fund_id] + [neighbour_id for neighbour_id, _ in fund_neighbours]]
+            similar_jsons[fund_id] = json.dumps({'funds':          similar_funds[fund_id],
+                                                 'versions':       versions,
+                                                 'token_versions': [[token, token_versions[token]]
+                                                                    for token in sorted(token_pcts[fund_id])]})
+        redis.set_similar_funds(similar_jsons, metric, cls.ttl_sec)
+        return similar_funds
+
+    @classmethod
+    def nearest(cls,
+                portfolios: Dict[str, FundPortfolio],
+                redis: RedisManager,
+                metric: str,
+                k: int) -> Tuple[Dict[str, List[Tuple[str, float]]], Dict[str, int]]:
+        """
+        Returns the k (fund id, similarity) pairs most similar to each fund in the batch, from most to least
+            similar (and by fund id among equals), and the vector version of every fund that was scored.
+        """
+        if metric not in cls.METRICS:
+            raise ValueError(f'Unknown similarity metric "{metric}" (expected one of {cls.METRICS})')
+        query_ids = list(portfolios.keys())
+        query_pcts = [portfolio.token_pcts() for portfolio in portfolios.values()]
+        tokens = sorted({token for pcts in query_pcts for token in pcts.keys()})
+        token_funds = redis.get_token_fund_lists(tokens)
+
+        # Gather every candidate (each holding at least one of the batch's tokens) and its vector.
+        posting_ids = np.array([fund_id for funds in token_funds for fund_id, _ in funds], dtype=str)
+        posting_pcts = np.array([pct for funds in token_funds for _, pct in funds], dtype=float)
+        posting_starts = np.concatenate([[0], np.cumsum([len(funds) for funds in token_funds])]).astype(int)
+        candidate_ids, posting_candidates = np.unique(posting_ids, return_inverse=True)
+        norms, totals, versions = redis.get_fund_vectors(candidate_ids.tolist())
+        norms = np.array([np.nan if norm is None else norm for norm in norms], dtype=float)
+        totals = np.array([np.nan if total is None else total for total in totals], dtype=float)
+
+        # Multiply the batch's matrix with the candidates' matrix, one token's fund index at a time.
+        # The overlap is the same product with min() in place of multiplication, over weights summing to 1.
+        token_idxs = {token: token_idx for token_idx, token in enumerate(tokens)}
+        rows = []
+        columns = []
+        products = []
+        for row, pcts in enumerate(query_pcts):
+            query_total = sum(pcts.values())
+            for token, pct in pcts.items():
+                start, end = posting_starts[token_idxs[token]], posting_starts[token_idxs[token] + 1]
+                rows.append(np.full(end - start, row))
+                columns.append(posting_candidates[start:end])
+                if metric == cls.COSINE:
+                    products.append(pct * posting_pcts[start:end])
+                else:
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        products.append(np.minimum(pct / query_total,
+                                                   posting_pcts[start:end] / totals[columns[-1]]))
+        if len(rows) == 0:
+            return {fund_id: [] for fund_id in query_ids}, dict(zip(candidate_ids.tolist(), versions))
+        cells, cell_idxs = np.unique(np.concatenate(rows) * len(candidate_ids) + np.concatenate(columns),
+                                     return_inverse=True)
+        scores = np.bincount(cell_idxs, weights=np.concatenate(products))
+        cell_rows, cell_columns = np.divmod(cells, len(candidate_ids))
+        if metric == cls.COSINE:
+            query_norms = np.array([sum(pct * pct for pct in pcts.values()) ** 0.5 for pcts in query_pcts])
+            with np.errstate(invalid='ignore', divide='ignore'):
+                scores = scores / (query_norms[cell_rows] * norms[cell_columns])
+
+        # Keep each fund's k best candidates, other than itself.
+        kept = np.isfinite(scores) & (candidate_ids[cell_columns] != np.array(query_ids, dtype=str)[cell_rows])
+        cell_rows, cell_columns, scores = cell_rows[kept], cell_columns[kept], scores[kept]
+        order = np.lexsort((cell_columns, -scores, cell_rows))
+        row_starts = np.searchsorted(cell_rows[order], np.arange(len(query_ids) + 1))
+        neighbours = {}
+        for row, fund_id in enumerate(query_ids):
+            best = order[row_starts[row]:min(row_starts[row + 1], row_starts[row] + k)]
+            neighbours[fund_id] = [(str(candidate_ids[column]), float(score))
+                                   for column, score in zip(cell_columns[best], scores[best])]
+        return neighbours, dict(zip(candidate_ids.tolist(), versions))
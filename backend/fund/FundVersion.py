@@ -0,0 +1,138 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.TokenAllocation import TokenAllocation
+
+
+class FundVersion:
+    """
+    Wrapper for one entry of a fund's portfolio history: either a checkpoint holding every position of the
+        portfolio at that version, or a delta holding only the positions of the tokens which changed since the
+        previous version, and the tokens which were removed.
+    Entries are stored as compact strings: "<kind>|<version>|<timestamp>|<json>", where the json maps each
+        token to its positions as [portfolio_pct, buy_target, sell_target] lists.
+    """
+
+    # The entry holds the whole portfolio.
+    CHECKPOINT = 'c'
+
+    # The entry holds the changes since the previous version.
+    DELTA = 'd'
+
+    # CHECKPOINT or DELTA.
+    kind: str
+
+    # Version of the fund which the entry records.
+    version: int
+
+    # Unix time (in seconds) at which the version was written.
+    timestamp: float
+
+    # Positions of each token in the portfolio (CHECKPOINT), or of each token which changed (DELTA).
+    positions: Dict[str, List[List[float]]]
+
+    # Tokens which were removed since the previous version (always empty for a CHECKPOINT).
+    removed_tokens: List[str]
+
+    def __init__(self,
+                 kind: str,
+                 version: int,
+                 timestamp: float,
+                 positions: Dict[str, List[List[float]]],
+                 removed_tokens: Optional[List[str]] = None):
+        self.kind = kind
+        self.version = version
+        self.timestamp = timestamp
+        self.positions = positions
+        self.removed_tokens = removed_tokens or []
+
+    def to_entry(self) -> str:
+        data = {'p': self.positions}
+        if len(self.removed_tokens) != 0:
+            data['r'] = self.removed_tokens
+        return f"{self.kind}|{self.version}|{self.timestamp:.3f}|{json.dumps(data, separators=(',', ':'))}"
+
+    def apply(self,
+              positions: Dict[str, List[List[float]]]) -> Dict[str, List[List[float]]]:
+        """
+        Returns the positions of the portfolio at this version, given its positions at the previous version.
+        """
+        if self.kind == FundVersion.CHECKPOINT:
+            return dict(self.positions)
+        patched_positions = {token: token_positions for token, token_positions in positions.items()
+                             if token not in self.removed_tokens}
+        patched_positions.update(self.positions)
+        return patched_positions
+
+    @classmethod
+    def from_entry(cls,
+                   entry: str) -> 'FundVersion':
+        kind, version, timestamp, data = entry.split('|', 3)
+        data = json.loads(data)
+        return FundVersion(kind=kind,
+                           version=int(version),
+                           timestamp=float(timestamp),
+                           positions=data['p'],
+                           removed_tokens=data.get('r', []))
+
+    @classmethod
+    def checkpoint(cls,
+                   version: int,
+                   timestamp: float,
+                   portfolio: FundPortfolio) -> 'FundVersion':
+        return FundVersion(kind=cls.CHECKPOINT,
+                           version=version,
+                           timestamp=timestamp,
+                           positions=cls.to_positions(portfolio))
+
+    @classmethod
+    def delta(cls,
+              version: int,
+              timestamp: float,
+              previous_portfolio: FundPortfolio,
+              portfolio: FundPortfolio) -> Optional['FundVersion']:
+        """
+        Returns the delta from the previous portfolio to the portfolio, or None if the delta can't rebuild
+            the portfolio exactly (because the order of its tokens changed), so a checkpoint must be used instead.
+        """
+        previous_positions = cls.to_positions(previous_portfolio)
+        positions = cls.to_positions(portfolio)
+        changed_positions, removed_tokens = cls.diff(previous_positions, positions)
+        fund_version = FundVersion(kind=cls.DELTA,
+                                   version=version,
+                                   timestamp=timestamp,
+                                   positions=changed_positions,
+                                   removed_tokens=removed_tokens)
+        if list(fund_version.apply(previous_positions).keys()) != list(positions.keys()):
+            return None
+        return fund_version
+
+    @staticmethod
+    def diff(previous_positions: Dict[str, List[List[float]]],
+             positions: Dict[str, List[List[float]]]) -> Tuple[Dict[str, List[List[float]]], List[str]]:
+        """
+        Returns the positions of each token which was added or changed, and the tokens which were removed.
+        """
+        changed_positions = {token: token_positions for token, token_positions in positions.items()
+                             if previous_positions.get(token, None) != token_positions}
+        removed_tokens = [token for token in previous_positions.keys() if token not in positions]
+        return changed_positions, removed_tokens
+
+    @staticmethod
+    def to_positions(portfolio: FundPortfolio) -> Dict[str, List[List[float]]]:
+        positions = {}
+        for token in portfolio.tokens:
+            positions.setdefault(str(token.token), []).append([float(token.portfolio_pct),
+                                                               float(token.buy_target),
+                                                               float(token.sell_target)])
+        return positions
+
+    @staticmethod
+    def to_portfolio(positions: Dict[str, List[List[float]]]) -> FundPortfolio:
+        return FundPortfolio(tokens=[TokenAllocation(token=token,
+                                                     portfolio_pct=portfolio_pct,
+                                                     buy_target=buy_target,
+                                                     sell_target=sell_target)
+                                     for token, token_positions in positions.items()
+                                     for portfolio_pct, buy_target, sell_target in token_positions])
@@ -0,0 +1,70 @@
+import traceback
+from typing import Dict, Optional, Tuple
+
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.FundVersion import FundVersion
+from backend.redis.RedisManager import RedisManager
+
+
+class FundVersionHistory:
+    """
+    Rebuilds past versions of a fund's portfolio from its history: the nearest checkpoint at or before a version,
+        followed by the deltas up to it. Since a checkpoint is recorded every
+        RedisManager.fund_history_checkpoint_interval versions, rebuilding a version reads a bounded
+        number of entries, however long the history is.
+    """
+
+    @classmethod
+    def load(cls,
+             fund_id: str,
+             redis: RedisManager,
+             version: Optional[int] = None) -> Optional[Tuple[FundVersion, FundPortfolio]]:
+        """
+        Returns the entry recording the version (or the latest version, if it is None) and the portfolio at it,
+            or None if the version was never recorded or was compacted away.
+        """
+        try:
+            entries = redis.get_fund_version_entries(fund_id, version, 2 * redis.fund_history_checkpoint_interval)
+            chain = []
+            for entry in entries:
+                fund_version = FundVersion.from_entry(entry)
+                expected_version = version if len(chain) == 0 else chain[-1].version - 1
+                if expected_version is not None and fund_version.version != expected_version:
+                    return None
+                chain.append(fund_version)
+                if fund_version.kind == FundVersion.CHECKPOINT:
+                    break
+            if len(chain) == 0 or chain[-1].kind != FundVersion.CHECKPOINT:
+                return None
+            positions = {}
+            for fund_version in reversed(chain):
+                positions = fund_version.apply(positions)
+            return chain[0], FundVersion.to_portfolio(positions)
+        except Exception as e:
+            print(f'ERROR! Something went wrong trying to load version {version} of fund "{fund_id}" '
+                  f'from redis: {traceback.format_exc()}')
+            return None
+
+    @classmethod
+    def diff(cls,
+             fund_id: str,
+             redis: RedisManager,
+             from_version: int,
+             to_version: int) -> Optional[Dict]:
+        """
+        Returns the positions of each token which was added or changed between the two versions,
+            and the tokens which were removed, or None if either version can't be rebuilt.
+        """
+        from_loaded = cls.load(fund_id, redis, from_version)
+        to_loaded = cls.load(fund_id, redis, to_version)
+        if from_loaded is None or to_loaded is None:
+            return None
+        changed_positions, removed_tokens = FundVersion.diff(FundVersion.to_positions(from_loaded[1]),
+                                                             FundVersion.to_positions(to_loaded[1]))
+        return {
+            'fund_id':        fund_id,
+            'from_version':   from_version,
+            'to_version':     to_version,
+            'tokens':         FundVersion.to_portfolio(changed_positions).to_json()['tokens'],
+            'removed_tokens': removed_tokens
+        }
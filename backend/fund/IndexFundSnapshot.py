@@ -1,8 +1,10 @@
+import copy
 import json
 import traceback
 from typing import Dict, List, Optional
 
 from backend.fund.FundPortfolio import FundPortfolio
+from backend.redis.LocalCache import LocalCache
 from backend.redis.RedisManager import RedisManager
 from backend.util import clean_email
 
@@ -24,6 +26,9 @@ class IndexFundSnapshot:
     # Fund's portfolio.
     portfolio: FundPortfolio
 
+    # Snapshots recently loaded from Redis, by RedisManager.fund_key().
+    _cache: LocalCache = LocalCache('fund_snapshots')
+
     def __init__(self,
                  fund_id: str,
                  manager_email: str,
@@ -66,7 +71,8 @@ class IndexFundSnapshot:
             manager_email = json_data.get('manager_email', None)
             assert fund_id is not None and manager_email is not None
             manager_email = clean_email(manager_email)
-            portfolio = FundPortfolio.from_json(json_data.get('portfolio'), {})
+            portfolio = FundPortfolio.from_json(json_data.get('portfolio', {}))
+            assert portfolio is not None
             return IndexFundSnapshot(fund_id=fund_id,
                                      manager_email=manager_email,
                                      investor_emails=json_data.get('investor_emails', list()),
@@ -79,20 +85,63 @@ class IndexFundSnapshot:
     @classmethod
     def from_db(cls,
                 fund_id: str,
-                redis: RedisManager) -> Optional['IndexFundSnapshot']:
+                redis: RedisManager,
+                use_cache: bool = True) -> Optional['IndexFundSnapshot']:
         """
         Loads and returns the IndexFundSnapshot data associated with the id,
             or None if the user doesn't have any data stored in Redis.
+        Recently loaded snapshots are served from a local cache (as copies), unless use_cache is False.
         """
         try:
-            manager_email = redis.get_fund_manager_email(fund_id)
-            investor_emails = redis.get_fund_investor_emails(fund_id)
-            portfolio = redis.get_fund_portfolio(fund_id)
-            return IndexFundSnapshot(fund_id=fund_id,
-                                     manager_email=manager_email,
-                                     investor_emails=investor_emails,
-                                     portfolio=portfolio)
+            cache_key = RedisManager.fund_key(fund_id)
+            if use_cache:
+                cached_snapshot = cls._cache.get(cache_key)
+                if cached_snapshot is not LocalCache.MISSING:
+                    return copy.deepcopy(cached_snapshot)
+            generation = cls._cache.generation()
+            manager_email, investor_emails, portfolio = redis.get_fund(fund_id)
+            snapshot = IndexFundSnapshot(fund_id=fund_id,
+                                         manager_email=manager_email,
+                                         investor_emails=investor_emails,
+                                         portfolio=portfolio)
+            cls._cache.set(cache_key, copy.deepcopy(snapshot), generation)
+            return snapshot
         except Exception as e:
             print(f'ERROR! Something went wrong trying to load a fund snapshot '
                   f'from redis: {traceback.format_exc()}')
             return None
+
+    @classmethod
+    def load_many(cls,
+                  fund_ids: List[str],
+                  redis: RedisManager,
+                  use_cache: bool = True) -> List['IndexFundSnapshot']:
+        """
+        Loads the IndexFundSnapshots associated with the ids in a constant number of round trips,
+            skipping ids that don't have a fund stored in Redis.
+        Recently loaded snapshots are served from a local cache (as copies), unless use_cache is False.
+        """
+        try:
+            snapshots_by_id = {}
+            if use_cache:
+                for fund_id in fund_ids:
+                    cached_snapshot = cls._cache.get(RedisManager.fund_key(fund_id))
+                    if cached_snapshot is not LocalCache.MISSING:
+                        snapshots_by_id[fund_id] = copy.deepcopy(cached_snapshot)
+            generation = cls._cache.generation()
+            missing_fund_ids = [fund_id for fund_id in fund_ids if fund_id not in snapshots_by_id]
+            for fund_id, (manager_email, investor_emails, portfolio) in zip(missing_fund_ids,
+                                                                            redis.get_funds(missing_fund_ids)):
+                snapshot = IndexFundSnapshot(fund_id=fund_id,
+                                             manager_email=manager_email,
+                                             investor_emails=investor_emails,
+                                             portfolio=FundPortfolio(tokens=[]) if portfolio is None
+                                             else portfolio)
+                cls._cache.set(RedisManager.fund_key(fund_id), copy.deepcopy(snapshot), generation)
+                snapshots_by_id[fund_id] = snapshot
+            return [snapshots_by_id[fund_id] for fund_id in fund_ids
+                    if snapshots_by_id[fund_id].manager_email is not None]
+        except Exception as e:
+            print(f'ERROR! Something went wrong trying to load fund snapshots '
+                  f'from redis: {traceback.format_exc()}')
+            return []
@@ -0,0 +1,74 @@
+import json
+from typing import Dict
+
+
+class NavBucket:
+    """
+    Wrapper for the aggregate of a fund's NAV snapshots over one rollup bucket (i.e. one minute).
+    """
+
+    # Unix time (in seconds) at which the bucket starts.
+    start: float
+
+    # NAV of the first snapshot in the bucket.
+    open: float
+
+    # Highest NAV in the bucket.
+    high: float
+
+    # Lowest NAV in the bucket.
+    low: float
+
+    # NAV of the last snapshot in the bucket.
+    close: float
+
+    # Number of snapshots in the bucket.
+    count: int
+
+    # Average NAV over the bucket's snapshots.
+    mean: float
+
+    def __init__(self,
+                 start: float,
+                 open: float,
+                 high: float,
+                 low: float,
+                 close: float,
+                 count: int,
+                 mean: float):
+        self.start = start
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.count = count
+        self.mean = mean
+
+    def __str__(self):
+        return json.dumps(self.to_json())
+
+    def to_json(self) -> Dict:
+        return {
+            'start': self.start,
+            'open':  self.open,
+            'high':  self.high,
+            'low':   self.low,
+            'close': self.close,
+            'count': self.count,
+            'mean':  self.mean
+        }
+
+    @classmethod
+    def from_member(cls,
+                    member: str) -> 'NavBucket':
+        """
+        Converts a stored rollup member ("start,open,high,low,close,count,sum,first_ts,last_ts") into a NavBucket.
+        """
+        start_ms, open_nav, high, low, close, count, nav_sum = [float(value) for value in member.split(',')[:7]]
+        return NavBucket(start=start_ms / 1000,
+                         open=open_nav,
+                         high=high,
+                         low=low,
+                         close=close,
+                         count=int(count),
+                         mean=nav_sum / count)
@@ -0,0 +1,113 @@
+import struct
+from typing import List, Tuple
+
+from backend.fund.TokenAllocation import TokenAllocation
+
+
+class PortfolioCodec:
+    """
+    Compact, versioned binary encoding of a portfolio's token allocations.
+
+    Version 1 layout (little-endian):
+        + 1 byte header: the format version (JSON-encoded portfolios always start with '{' instead)
+        + uint32 number of allocations, uint32 number of distinct tokens
+        + string table: for each distinct token, a uint16 length followed by its UTF-8 bytes
+        + for each allocation, the uint32 index of its token in the string table
+        + zero padding up to a multiple of 8 bytes
+        + for each allocation, float64 portfolio_pct, buy_target and sell_target
+    """
+
+    # Header byte of the version 1 format.
+    VERSION_1 = b'\x01'
+
+    # Header byte of the current format.
+    CURRENT_VERSION = VERSION_1
+
+    # Number of float64 values stored per allocation.
+    VALUES_PER_TOKEN = 3
+
+    @classmethod
+    def is_binary(cls,
+                  data: bytes) -> bool:
+        """
+        Returns True if the data was encoded by this codec (rather than stored as JSON).
+        """
+        return data[:1] == cls.VERSION_1
+
+    @classmethod
+    def encode(cls,
+               tokens: List[TokenAllocation]) -> bytes:
+        """
+        Encodes the allocations into the current binary format.
+        """
+        token_indexes = {}
+        for token in tokens:
+            token_indexes.setdefault(str(token.token), len(token_indexes))
+        values = []
+        for token in tokens:
+            values.extend([float(token.portfolio_pct), float(token.buy_target), float(token.sell_target)])
+        return cls.encode_packed(token_strs=list(token_indexes.keys()),
+                                 num_allocations=len(tokens),
+                                 packed_token_indexes=struct.pack(f'<{len(tokens)}I',
+                                                                  *[token_indexes[str(token.token)]
+                                                                    for token in tokens]),
+                                 packed_values=struct.pack(f'<{len(values)}d', *values))
+
+    @classmethod
+    def encode_packed(cls,
+                      token_strs: List[str],
+                      num_allocations: int,
+                      packed_token_indexes: bytes,
+                      packed_values: bytes) -> bytes:
+        """
+        Encodes allocations whose token indexes (uint32) and values (float64) are already packed.
+        """
+        parts = [cls.CURRENT_VERSION, struct.pack('<II', num_allocations, len(token_strs))]
+        for token_str in token_strs:
+            token_bytes = token_str.encode('utf-8')
+            parts.append(struct.pack('<H', len(token_bytes)))
+            parts.append(token_bytes)
+        parts.append(packed_token_indexes)
+        header_len = sum(len(part) for part in parts)
+        parts.append(b'\x00' * (-header_len % 8))
+        parts.append(packed_values)
+        return b''.join(parts)
+
+    @classmethod
+    def decode_header(cls,
+                      data: bytes) -> Tuple[List[str], int, int, int]:
+        """
+        Decodes the string table of binary-encoded allocations.
+        Returns the distinct tokens, the number of allocations, the byte offset of the allocations'
+            uint32 token indexes, and the byte offset of their float64 values (8-byte aligned, so they
+            can be viewed without copying).
+        """
+        if not cls.is_binary(data):
+            raise ValueError(f'Unknown portfolio encoding: {data[:1]!r}')
+        num_allocations, num_tokens = struct.unpack_from('<II', data, 1)
+        offset = 9
+        token_strs = []
+        for _ in range(num_tokens):
+            (token_len,) = struct.unpack_from('<H', data, offset)
+            offset += 2
+            token_strs.append(data[offset:offset + token_len].decode('utf-8'))
+            offset += token_len
+        token_indexes_offset = offset
+        offset += 4 * num_allocations
+        offset += -offset % 8
+        return token_strs, num_allocations, token_indexes_offset, offset
+
+    @classmethod
+    def decode(cls,
+               data: bytes) -> List[TokenAllocation]:
+        """
+        Decodes binary-encoded allocations.
+        """
+        token_strs, num_allocations, token_indexes_offset, values_offset = cls.decode_header(data)
+        token_indexes = struct.unpack_from(f'<{num_allocations}I', data, token_indexes_offset)
+        values = struct.unpack_from(f'<{num_allocations * cls.VALUES_PER_TOKEN}d', data, values_offset)
+        return [TokenAllocation(token=token_strs[token_index],
+                                portfolio_pct=values[i * cls.VALUES_PER_TOKEN],
+                                buy_target=values[i * cls.VALUES_PER_TOKEN + 1],
+                                sell_target=values[i * cls.VALUES_PER_TOKEN + 2])
+                for i, token_index in enumerate(token_indexes)]
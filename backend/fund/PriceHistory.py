@@ -0,0 +1,118 @@
+import csv
+import os
+from typing import Dict, List
+
+import numpy as np
+
+
+class PriceHistory:
+    """
+    Prices of many tokens over time, as a time x token matrix, loaded from CSV or Parquet files.
+    Files are either wide (a 'timestamp' column, then one column of prices per token)
+        or long (one 'timestamp', 'token', 'price' row per price).
+    """
+
+    # Unix time (in seconds) of each row, in increasing order.
+    timestamps: np.ndarray
+
+    # Token of each column.
+    token_strs: List[str]
+
+    # Price of each token at each time; gaps are filled with the previous price, and NaN before the first one.
+    prices: np.ndarray
+
+    def __init__(self,
+                 timestamps: np.ndarray,
+                 token_strs: List[str],
+                 prices: np.ndarray):
+        self.timestamps = timestamps
+        self.token_strs = token_strs
+        self.prices = prices
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def token_prices(self,
+                     tokens: List[str]) -> np.ndarray:
+        """
+        Returns the time x token matrix of the tokens' prices, with NaN columns for tokens without any.
+        """
+        columns = {token: column for column, token in enumerate(self.token_strs)}
+        token_prices = np.full((len(self), len(tokens)), np.nan)
+        for token_idx, token in enumerate(tokens):
+            if token in columns:
+                token_prices[:, token_idx] = self.prices[:, columns[token]]
+        return token_prices
+
+    @classmethod
+    def from_file(cls,
+                  path: str) -> 'PriceHistory':
+        """
+        Loads a .csv or .parquet file (read with pandas and pyarrow).
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension == '.csv':
+            return cls.from_csv(path)
+        if extension == '.parquet':
+            return cls.from_parquet(path)
+        raise ValueError(f'Unsupported price history file (expected .csv or .parquet): "{path}"')
+
+    @classmethod
+    def from_csv(cls,
+                 path: str) -> 'PriceHistory':
+        with open(path, newline='') as csv_file:
+            reader = csv.reader(csv_file)
+            header = [column.strip() for column in next(reader)]
+            rows = [row for row in reader if len(row) != 0]
+        return cls.from_columns({column: [row[column_idx] for row in rows]
+                                 for column_idx, column in enumerate(header)})
+
+    @classmethod
+    def from_parquet(cls,
+                     path: str) -> 'PriceHistory':
+        try:
+            import pandas
+        except ImportError:
+            raise ValueError('Loading Parquet price histories requires pandas and pyarrow to be installed')
+        frame = pandas.read_parquet(path)
+        return cls.from_columns({str(column): frame[column].tolist() for column in frame.columns})
+
+    @classmethod
+    def from_columns(cls,
+                     columns: Dict[str, List]) -> 'PriceHistory':
+        """
+        Builds the history from the columns of a wide or long table (see the class docstring).
+        """
+        if 'timestamp' not in columns:
+            raise ValueError('Price history files need a "timestamp" column')
+        timestamps = np.array(columns['timestamp'], dtype=float)
+        if 'token' in columns and 'price' in columns:
+            token_strs = sorted(set(str(token) for token in columns['token']))
+            unique_timestamps, rows = np.unique(timestamps, return_inverse=True)
+            token_columns = {token: column for column, token in enumerate(token_strs)}
+            prices = np.full((len(unique_timestamps), len(token_strs)), np.nan)
+            prices[rows, [token_columns[str(token)] for token in columns['token']]] = \
+                np.array(columns['price'], dtype=float)
+            timestamps = unique_timestamps
+        else:
+            token_strs = [column for column in columns.keys() if column != 'timestamp']
+            prices = np.array([[np.nan if value in ('', None) else float(value) for value in columns[token]]
+                               for token in token_strs], dtype=float).T.reshape(len(timestamps), len(token_strs))
+            order = np.argsort(timestamps, kind='stable')
+            timestamps, prices = timestamps[order], prices[order]
+        return PriceHistory(timestamps=timestamps,
+                            token_strs=token_strs,
+                            prices=cls._forward_fill(prices))
+
+    @staticmethod
+    def _forward_fill(prices: np.ndarray) -> np.ndarray:
+        """
+        Replaces each missing (NaN or non-positive) price with the token's previous price.
+        """
+        with np.errstate(invalid='ignore'):
+            prices = np.where(prices > 0, prices, np.nan)
+        valid_rows = np.where(np.isfinite(prices), np.arange(len(prices))[:, None], -1)
+        last_valid_rows = np.maximum.accumulate(valid_rows, axis=0)
+        filled = np.take_along_axis(prices, np.clip(last_valid_rows, 0, None), axis=0)
+        filled[last_valid_rows < 0] = np.nan
+        return filled
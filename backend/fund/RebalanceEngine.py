@@ -0,0 +1,127 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.fund.ColumnarPortfolio import ColumnarPortfolio
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.RebalanceOrder import RebalanceOrder
+from backend.fund.RebalancePlan import RebalancePlan
+
+
+class RebalanceEngine:
+    """
+    Computes, for many funds at once, how far each holding has drifted from its portfolio's target weight
+        and the trades that bring it back.
+    Funds are processed in batches, each as one set of fund x token matrix operations, and batches are
+        spread across a process pool.
+    A buy is only placed at or below the token's buy_target, and a sell at or above its sell_target
+        (tokens held but absent from the portfolio can always be sold).
+    """
+
+    @classmethod
+    def rebalance(cls,
+                  portfolios: Dict[str, FundPortfolio],
+                  holdings: Dict[str, Dict[str, float]],
+                  prices: Dict[str, float],
+                  min_drift_pct: float = 0,
+                  batch_size: int = 1000,
+                  num_workers: Optional[int] = None) -> List[RebalancePlan]:
+        """
+        Returns the rebalance plan of each fund, given its portfolio, its holdings (token -> quantity)
+            and the price of each token.
+        Trades of tokens that drifted by less than min_drift_pct, or that have no price, are skipped.
+        Set num_workers to 1 to compute every batch in the current process.
+        """
+        batches = []
+        fund_ids = list(portfolios.keys())
+        for batch_start in range(0, len(fund_ids), batch_size):
+            batches.append([(fund_id, portfolios[fund_id].to_bytes(), holdings.get(fund_id, {}))
+                            for fund_id in fund_ids[batch_start:batch_start + batch_size]])
+        if len(batches) <= 1 or num_workers == 1:
+            return [plan for batch in batches for plan in cls.rebalance_batch(batch, prices, min_drift_pct)]
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            batch_plans = executor.map(cls.rebalance_batch,
+                                       batches,
+                                       [prices] * len(batches),
+                                       [min_drift_pct] * len(batches))
+            return [plan for plans in batch_plans for plan in plans]
+
+    @staticmethod
+    def rebalance_batch(batch: List[Tuple[str, bytes, Dict[str, float]]],
+                        prices: Dict[str, float],
+                        min_drift_pct: float) -> List[RebalancePlan]:
+        """
+        Returns the rebalance plans of a batch of (fund id, encoded portfolio, holdings) tuples,
+            computed in one vectorized pass.
+        """
+        if len(batch) == 0:
+            return []
+
+        # Lay out the batch as fund x token matrices.
+        portfolios = [ColumnarPortfolio.from_bytes(portfolio_bytes) or ColumnarPortfolio.from_json({})
+                      for _, portfolio_bytes, _ in batch]
+        token_columns = {}
+        for portfolio, (_, _, fund_holdings) in zip(portfolios, batch):
+            for token in portfolio.token_strs + list(fund_holdings.keys()):
+                token_columns.setdefault(token, len(token_columns))
+        num_funds, num_tokens = len(batch), len(token_columns)
+        target_weights = np.zeros((num_funds, num_tokens))
+        buy_targets = np.full((num_funds, num_tokens), np.nan)
+        sell_targets = np.full((num_funds, num_tokens), np.nan)
+        quantities = np.zeros((num_funds, num_tokens))
+        targeted = np.zeros((num_funds, num_tokens), dtype=bool)
+        for fund_idx, (portfolio, (_, _, fund_holdings)) in enumerate(zip(portfolios, batch)):
+            if len(portfolio) != 0:
+                portfolio_columns = np.array([token_columns[token] for token in portfolio.token_strs])
+                columns = portfolio_columns[portfolio.token_indexes]
+                np.add.at(target_weights[fund_idx], columns, np.clip(portfolio.portfolio_pcts, 0, None))
+                buy_targets[fund_idx, columns] = portfolio.buy_targets
+                sell_targets[fund_idx, columns] = portfolio.sell_targets
+                targeted[fund_idx, columns] = True
+            for token, quantity in fund_holdings.items():
+                quantities[fund_idx, token_columns[token]] = float(quantity)
+        token_strs = list(token_columns.keys())
+        price_vector = np.array([float(prices.get(token, np.nan)) for token in token_strs])
+        priced = np.isfinite(price_vector) & (price_vector > 0)
+
+        # Compare current weights with target weights, among priced tokens.
+        target_weights[:, ~priced] = 0
+        weight_sums = target_weights.sum(axis=1, keepdims=True)
+        target_weights = np.divide(target_weights, weight_sums,
+                                   out=np.zeros_like(target_weights), where=weight_sums > 0)
+        values = np.where(priced, quantities * np.where(priced, price_vector, 0), 0)
+        navs = values.sum(axis=1)
+        current_weights = np.divide(values, navs[:, None], out=np.zeros_like(values), where=navs[:, None] > 0)
+        drifts = current_weights - target_weights
+        trade_values = target_weights * navs[:, None] - values
+        trade_quantities = np.divide(trade_values, price_vector, out=np.zeros_like(trade_values),
+                                     where=priced)
+
+        # Only trade drifted tokens whose price is within their buy/sell targets.
+        with np.errstate(invalid='ignore'):
+            can_buy = price_vector <= buy_targets
+            can_sell = ~targeted | (price_vector >= sell_targets)
+        should_trade = (priced
+                        & (navs[:, None] > 0)
+                        & (np.abs(drifts) * 100 >= max(min_drift_pct, 1e-9))
+                        & (((trade_values > 0) & can_buy) | ((trade_values < 0) & can_sell)))
+
+        # Build each fund's plan.
+        plans = []
+        involved = targeted | (quantities != 0)
+        for fund_idx, (fund_id, _, _) in enumerate(batch):
+            orders = [RebalanceOrder(token=token_strs[token_idx],
+                                     side=RebalanceOrder.BUY if trade_values[fund_idx, token_idx] > 0
+                                     else RebalanceOrder.SELL,
+                                     quantity=float(abs(trade_quantities[fund_idx, token_idx])),
+                                     value=float(abs(trade_values[fund_idx, token_idx])),
+                                     drift_pct=float(drifts[fund_idx, token_idx] * 100))
+                      for token_idx in np.flatnonzero(should_trade[fund_idx]).tolist()]
+            drift_pcts = {token_strs[token_idx]: float(drifts[fund_idx, token_idx] * 100)
+                          for token_idx in np.flatnonzero(involved[fund_idx] & priced).tolist()}
+            plans.append(RebalancePlan(fund_id=fund_id,
+                                       nav=float(navs[fund_idx]),
+                                       drift_pcts=drift_pcts,
+                                       orders=orders))
+        return plans
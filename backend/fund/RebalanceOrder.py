@@ -0,0 +1,53 @@
+import json
+from typing import Dict
+
+
+class RebalanceOrder:
+    """
+    Wrapper for a trade that brings one of a fund's holdings back to its target weight.
+    """
+
+    # Order side for buying the token.
+    BUY = 'buy'
+
+    # Order side for selling the token.
+    SELL = 'sell'
+
+    # The token to trade.
+    token: str
+
+    # Either BUY or SELL.
+    side: str
+
+    # Amount of the token to trade.
+    quantity: float
+
+    # Value of the trade at the current price.
+    value: float
+
+    # Current minus target weight of the token within the fund, in percent.
+    drift_pct: float
+
+    def __init__(self,
+                 token: str,
+                 side: str,
+                 quantity: float,
+                 value: float,
+                 drift_pct: float):
+        self.token = token
+        self.side = side
+        self.quantity = quantity
+        self.value = value
+        self.drift_pct = drift_pct
+
+    def __str__(self):
+        return json.dumps(self.to_json())
+
+    def to_json(self) -> Dict:
+        return {
+            'token':     self.token,
+            'side':      self.side,
+            'quantity':  self.quantity,
+            'value':     self.value,
+            'drift_pct': self.drift_pct
+        }
@@ -0,0 +1,43 @@
+import json
+from typing import Dict, List
+
+from backend.fund.RebalanceOrder import RebalanceOrder
+
+
+class RebalancePlan:
+    """
+    Wrapper for the trades that bring a fund's holdings back to its portfolio's target weights.
+    """
+
+    # Fund's name/id.
+    fund_id: str
+
+    # Value of the fund's (priced) holdings.
+    nav: float
+
+    # Current minus target weight of each token the fund holds or targets, in percent.
+    drift_pcts: Dict[str, float]
+
+    # Trades to place, limited to those allowed by each token's buy/sell targets.
+    orders: List[RebalanceOrder]
+
+    def __init__(self,
+                 fund_id: str,
+                 nav: float,
+                 drift_pcts: Dict[str, float],
+                 orders: List[RebalanceOrder]):
+        self.fund_id = fund_id
+        self.nav = nav
+        self.drift_pcts = drift_pcts
+        self.orders = orders
+
+    def __str__(self):
+        return json.dumps(self.to_json())
+
+    def to_json(self) -> Dict:
+        return {
+            'fund_id':    self.fund_id,
+            'nav':        self.nav,
+            'drift_pcts': self.drift_pcts,
+            'orders':     [order.to_json() for order in self.orders]
+        }
@@ -0,0 +1,44 @@
+import json
+from typing import Dict
+
+
+class TokenAllocationView:
+    """
+    Read-only, TokenAllocation-like view of one position of a ColumnarPortfolio.
+    Holds no data of its own, so iterating a large portfolio doesn't allocate a dict per position.
+    """
+
+    __slots__ = ('_portfolio', '_index')
+
+    def __init__(self,
+                 portfolio,
+                 index: int):
+        self._portfolio = portfolio
+        self._index = index
+
+    def __str__(self):
+        return json.dumps(self.to_json())
+
+    @property
+    def token(self) -> str:
+        return self._portfolio.token_strs[int(self._portfolio.token_indexes[self._index])]
+
+    @property
+    def portfolio_pct(self) -> float:
+        return float(self._portfolio.portfolio_pcts[self._index])
+
+    @property
+    def buy_target(self) -> float:
+        return float(self._portfolio.buy_targets[self._index])
+
+    @property
+    def sell_target(self) -> float:
+        return float(self._portfolio.sell_targets[self._index])
+
+    def to_json(self) -> Dict:
+        return {
+            'token':         self.token,
+            'portfolio_pct': self.portfolio_pct,
+            'buy_target':    self.buy_target,
+            'sell_target':   self.sell_target
+        }
@@ -0,0 +1,78 @@
+from typing import Dict, List, Optional
+
+from backend.fund.TriggerEvent import TriggerEvent
+from backend.price.PriceFeed import PriceFeed
+from backend.price.PriceTick import PriceTick
+from backend.redis.RedisManager import RedisManager
+
+
+class TriggerEngine:
+    """
+    Consumes price ticks and emits a TriggerEvent, into the Redis trigger events stream, whenever a tick
+        crosses a fund's buy_target (on the way down) or sell_target (on the way up).
+    Crossed targets are found with range queries on per-token sorted indexes of every fund's targets,
+        which save_fund() keeps up to date, so each tick costs O(log n + k) rather than a scan of every fund.
+    """
+
+    # Manager used to query the indexes and write the events.
+    redis: RedisManager
+
+    # Last price seen for each token, which the next tick of the token is compared against.
+    last_prices: Dict[str, float]
+
+    def __init__(self,
+                 redis: RedisManager,
+                 last_prices: Optional[Dict[str, float]] = None):
+        self.redis = redis
+        self.last_prices = redis.get_trigger_last_prices() if last_prices is None else last_prices
+        self.num_ticks = 0
+        self.num_events = 0
+
+    def run(self,
+            feed: PriceFeed,
+            batch_size: int = 1) -> None:
+        """
+        Processes the feed's ticks until it ends.
+        """
+        for ticks in feed.tick_batches(batch_size):
+            self.process_ticks(ticks)
+
+    def process_ticks(self,
+                      ticks: List[PriceTick]) -> List[TriggerEvent]:
+        """
+        Returns (and writes to the stream) the events triggered by the ticks, in the order of the ticks.
+        The first tick of a token only records its price, since there is no move to compare it with.
+        Ticks whose price isn't finite and positive are skipped.
+        A batch costs two round trips: one for every index lookup, and one for every write.
+        """
+        moves = []
+        moved_ticks = []
+        last_prices = {}
+        for tick in ticks:
+            if not PriceTick.is_valid_price(tick.price):
+                print(f'WARNING: Skipping the invalid price {tick.price} of {tick.token}')
+                continue
+            previous_price = last_prices.get(tick.token, self.last_prices.get(tick.token, None))
+            if previous_price is not None and tick.price != previous_price:
+                moves.append((tick.token, previous_price, tick.price))
+                moved_ticks.append(tick)
+            last_prices[tick.token] = tick.price
+
+        events = []
+        for (token, previous_price, price), tick, crossed_targets in zip(moves,
+                                                                        moved_ticks,
+                                                                        self.redis.get_crossed_targets(moves)):
+            for fund_id, target in crossed_targets:
+                events.append(TriggerEvent(fund_id=fund_id,
+                                           token=token,
+                                           side=TriggerEvent.BUY if price < previous_price else TriggerEvent.SELL,
+                                           target=target,
+                                           price=price,
+                                           previous_price=previous_price,
+                                           timestamp=tick.timestamp))
+        if not self.redis.add_trigger_events([event.to_json() for event in events], last_prices):
+            raise RuntimeError(f'Could not write {len(events)} trigger events')
+        self.last_prices.update(last_prices)
+        self.num_ticks += len(ticks)
+        self.num_events += len(events)
+        return events
@@ -0,0 +1,65 @@
+import json
+from typing import Dict
+
+
+class TriggerEvent:
+    """
+    Wrapper for a price move which crossed one of a fund's buy or sell targets.
+    """
+
+    # Event side when the price fell to or below the buy_target.
+    BUY = 'buy'
+
+    # Event side when the price rose to or above the sell_target.
+    SELL = 'sell'
+
+    # The fund whose target was crossed.
+    fund_id: str
+
+    # The token whose price moved.
+    token: str
+
+    # Either BUY or SELL.
+    side: str
+
+    # The buy_target or sell_target which was crossed.
+    target: float
+
+    # The token's price after the move.
+    price: float
+
+    # The token's price before the move.
+    previous_price: float
+
+    # Unix time (in seconds) of the price tick.
+    timestamp: float
+
+    def __init__(self,
+                 fund_id: str,
+                 token: str,
+                 side: str,
+                 target: float,
+                 price: float,
+                 previous_price: float,
+                 timestamp: float):
+        self.fund_id = fund_id
+        self.token = token
+        self.side = side
+        self.target = target
+        self.price = price
+        self.previous_price = previous_price
+        self.timestamp = timestamp
+
+    def __str__(self):
+        return json.dumps(self.to_json())
+
+    def to_json(self) -> Dict:
+        return {
+            'fund_id':        self.fund_id,
+            'token':          self.token,
+            'side':           self.side,
+            'target':         self.target,
+            'price':          self.price,
+            'previous_price': self.previous_price,
+            'timestamp':      self.timestamp
+        }
@@ -0,0 +1,48 @@
+import time as pytime
+from typing import Iterator
+
+from backend.price.PriceFeed import PriceFeed
+from backend.price.PriceTick import PriceTick
+
+
+class FilePriceFeed(PriceFeed):
+    """
+    Price feed which replays (or follows) a file of ticks, one per line (see PriceTick.from_line()).
+    Stands in for a live feed locally and in replays of recorded prices.
+    """
+
+    # Path of the file of ticks.
+    path: str
+
+    # Whether to keep waiting for lines appended to the file, like `tail -f`, instead of ending at its end.
+    follow: bool
+
+    # Seconds between checks for new lines when following the file.
+    poll_interval_sec: float
+
+    def __init__(self,
+                 path: str,
+                 follow: bool = False,
+                 poll_interval_sec: float = 0.5):
+        self.path = path
+        self.follow = follow
+        self.poll_interval_sec = poll_interval_sec
+
+    def ticks(self) -> Iterator[PriceTick]:
+        with open(self.path) as ticks_file:
+            partial_line = ''
+            while True:
+                line = ticks_file.readline()
+                if len(line) == 0:
+                    if not self.follow:
+                        break
+                    pytime.sleep(self.poll_interval_sec)
+                    continue
+                if not line.endswith('\n') and self.follow:
+                    # The line is still being written.
+                    partial_line += line
+                    continue
+                tick = PriceTick.from_line(partial_line + line)
+                partial_line = ''
+                if tick is not None:
+                    yield tick
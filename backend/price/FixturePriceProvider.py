@@ -0,0 +1,45 @@
+import json
+import os
+import time as pytime
+from typing import Dict, List
+
+from backend.price.PriceProvider import PriceProvider
+
+
+class FixturePriceProvider(PriceProvider):
+    """
+    Price provider serving fixed prices, for local development and tests.
+    """
+
+    # Price of each token.
+    prices: Dict[str, float]
+
+    # Seconds each fetch takes, to imitate a remote provider.
+    delay_sec: float
+
+    def __init__(self,
+                 prices: Dict[str, float],
+                 delay_sec: float = 0):
+        self.prices = prices
+        self.delay_sec = delay_sec
+        self.num_fetches = 0
+
+    def fetch_prices(self,
+                     tokens: List[str]) -> Dict[str, float]:
+        self.num_fetches += 1
+        if self.delay_sec > 0:
+            pytime.sleep(self.delay_sec)
+        return {token: self.prices[token] for token in tokens if token in self.prices}
+
+    @classmethod
+    def from_file(cls,
+                  path: str) -> 'FixturePriceProvider':
+        """
+        Returns a provider serving the prices in a JSON file, i.e. {"BTC": 50000, "ERG": 2.5},
+            or no prices at all if there is no such file.
+        """
+        if len(path) == 0 or not os.path.exists(path):
+            print(f'WARNING: Price fixture file "{path}" not found, no prices will be served')
+            return FixturePriceProvider({})
+        with open(path) as prices_file:
+            return FixturePriceProvider({str(token): float(price) for token, price in json.load(prices_file).items()})
@@ -0,0 +1,31 @@
+from typing import Iterator, List
+
+from backend.price.PriceTick import PriceTick
+
+
+class PriceFeed:
+    """
+    Source of price ticks, consumed by the TriggerEngine.
+    Subclasses connect to a particular feed by implementing ticks().
+    """
+
+    def ticks(self) -> Iterator[PriceTick]:
+        """
+        Yields price ticks in the order they are received, until the feed ends.
+        """
+        raise NotImplementedError
+
+    def tick_batches(self,
+                     batch_size: int) -> Iterator[List[PriceTick]]:
+        """
+        Yields the ticks in batches of up to batch_size.
+        A batch is only yielded once it is full (or the feed ends), so live feeds should use a batch_size of 1.
+        """
+        batch = []
+        for tick in self.ticks():
+            batch.append(tick)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if len(batch) != 0:
+            yield batch
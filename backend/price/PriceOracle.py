@@ -0,0 +1,224 @@
+import math
+import os
+import threading
+import time as pytime
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set
+
+from decouple import config
+
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.price.FixturePriceProvider import FixturePriceProvider
+from backend.price.PriceProvider import PriceProvider
+from backend.price.PriceQuote import PriceQuote
+from backend.redis.LocalCache import LocalCache
+from backend.redis.RedisManager import RedisManager
+
+
+class PriceOracle:
+    """
+    Serves token prices from a two-level cache (in-process, then shared in Redis) in front of a PriceProvider.
+    + Many tokens are priced in one call, with one Redis round trip and at most one provider request.
+    + Stale prices are served immediately while they are refreshed in the background (stale-while-revalidate),
+        so only prices which were never fetched (or are too old to serve) wait on the provider.
+    + A refresh takes a per-token lock in Redis, so a single worker fetches each price while others
+        wait for (or keep serving) the cached one.
+    """
+
+    # Source of the prices.
+    provider: PriceProvider
+
+    # Manager holding the shared price cache and the refresh locks.
+    redis: RedisManager
+
+    # Seconds after which a price is refreshed (in the background) when it is next requested.
+    fresh_sec: float
+
+    # Seconds after which a price is too old to serve at all.
+    max_stale_sec: float
+
+    # Seconds a refresh may hold a token's lock before others may refresh it.
+    refresh_lock_sec: float
+
+    # Seconds to wait for another worker to fetch a price which isn't cached at all.
+    wait_sec: float
+
+    # Prices recently loaded from Redis or the provider, by token.
+    _cache: LocalCache = LocalCache('prices', ttl_sec=config('PRICE_LOCAL_TTL_SEC', default=2, cast=float))
+
+    # Oracle handed out by shared(), created with the configured provider.
+    _shared: Optional['PriceOracle'] = None
+
+    # Threads running background refreshes, re-created lazily in each forked (gunicorn worker) process.
+    _refresh_executor: Optional[ThreadPoolExecutor] = None
+
+    # Id of the process that created the refresh threads.
+    _refresh_pid: Optional[int] = None
+
+    # Tokens being refreshed in the background by this process.
+    _refreshing: Set[str] = set()
+
+    # Guards _refreshing and the creation of the refresh threads.
+    _refreshing_lock = threading.Lock()
+
+    def __init__(self,
+                 provider: PriceProvider,
+                 redis: RedisManager,
+                 fresh_sec: float = config('PRICE_FRESH_SEC', default=10, cast=float),
+                 max_stale_sec: float = config('PRICE_MAX_STALE_SEC', default=300, cast=float),
+                 refresh_lock_sec: float = config('PRICE_REFRESH_LOCK_SEC', default=5, cast=float),
+                 wait_sec: float = config('PRICE_WAIT_SEC', default=2, cast=float)):
+        self.provider = provider
+        self.redis = redis
+        self.fresh_sec = fresh_sec
+        self.max_stale_sec = max_stale_sec
+        self.refresh_lock_sec = refresh_lock_sec
+        self.wait_sec = wait_sec
+
+    @classmethod
+    def shared(cls) -> Optional['PriceOracle']:
+        """
+        Returns the oracle shared by this process, using the provider selected by the PRICE_PROVIDER setting,
+            or None if Redis can't be reached.
+        """
+        redis = RedisManager.shared()
+        if redis is None:
+            return None
+        if cls._shared is None:
+            provider_name = config('PRICE_PROVIDER', default='fixture', cast=str)
+            if provider_name != 'fixture':
+                raise ValueError(f'Unknown PRICE_PROVIDER: "{provider_name}"')
+            cls._shared = PriceOracle(FixturePriceProvider.from_file(config('PRICE_FIXTURE_FILE', default='')),
+                                      redis)
+        return cls._shared
+
+    def get_price(self,
+                  token: str) -> Optional[float]:
+        """
+        Returns the token's price, or None if it can't be priced.
+        """
+        return self.get_prices([token]).get(token, None)
+
+    def get_prices(self,
+                   tokens: Iterable[str]) -> Dict[str, float]:
+        """
+        Returns the price of each of the tokens, leaving out those which can't be priced.
+        """
+        return {token: quote.price for token, quote in self.get_quotes(tokens).items()}
+
+    def get_portfolio_prices(self,
+                             portfolio: FundPortfolio) -> Dict[str, float]:
+        """
+        Returns the price of every token in the portfolio, leaving out those which can't be priced.
+        """
+        return self.get_prices(str(token.token) for token in portfolio.tokens)
+
+    def get_quotes(self,
+                   tokens: Iterable[str]) -> Dict[str, PriceQuote]:
+        """
+        Returns the quote of each of the tokens, leaving out those which can't be priced.
+        """
+        tokens = list(dict.fromkeys(tokens))
+        now = pytime.time()
+
+        # Look in the local cache, then in the shared cache.
+        quotes = {}
+        uncached_tokens = []
+        for token in tokens:
+            quote = self._cache.get(token)
+            if quote is LocalCache.MISSING:
+                uncached_tokens.append(token)
+            else:
+                quotes[token] = quote
+        if len(uncached_tokens) != 0:
+            for token, quote_str in zip(uncached_tokens, self.redis.get_price_quotes(uncached_tokens)):
+                quote = None if quote_str is None else PriceQuote.from_str(quote_str)
+                if quote is not None:
+                    quotes[token] = quote
+                    self._cache.set(token, quote)
+
+        # Serve stale prices while they are refreshed, and only wait for prices which can't be served.
+        quotes = {token: quote for token, quote in quotes.items() if quote.age_sec(now) < self.max_stale_sec}
+        stale_tokens = [token for token, quote in quotes.items() if quote.age_sec(now) >= self.fresh_sec]
+        if len(stale_tokens) != 0:
+            self._refresh_in_background(stale_tokens)
+        missing_tokens = [token for token in tokens if token not in quotes]
+        if len(missing_tokens) != 0:
+            quotes.update(self._refresh(missing_tokens, wait=True))
+        return {token: quote for token, quote in quotes.items() if not math.isnan(quote.price)}
+
+    def _refresh(self,
+                 tokens: List[str],
+                 wait: bool) -> Dict[str, PriceQuote]:
+        """
+        Fetches the prices of the tokens whose lock is free, and caches them.
+        If wait is True, also waits (up to wait_sec) for the prices being fetched by others.
+        Returns the quotes which were fetched or waited for.
+        """
+        lock_token = uuid.uuid4().hex
+        lock_keys = [RedisManager.token_price_lock_key(token) for token in tokens]
+        acquired = self.redis.acquire_locks(lock_keys, lock_token, self.refresh_lock_sec)
+        locked_tokens = [token for token, is_acquired in zip(tokens, acquired) if is_acquired]
+        quotes = {}
+        if len(locked_tokens) != 0:
+            try:
+                fetched_at = pytime.time()
+                prices = self.provider.fetch_prices(locked_tokens)
+                # Tokens which can't be priced are cached too (as NaN), so that nobody waits on them.
+                quotes = {token: PriceQuote(token=token,
+                                            price=float(prices.get(token, math.nan)),
+                                            fetched_at=fetched_at)
+                          for token in locked_tokens}
+                self.redis.set_price_quotes({token: str(quote) for token, quote in quotes.items()},
+                                            ttl_sec=self.max_stale_sec)
+                for token, quote in quotes.items():
+                    self._cache.set(token, quote)
+            except Exception as e:
+                print(f'Error fetching the prices of {len(locked_tokens)} tokens: {traceback.format_exc()}')
+            finally:
+                self.redis.release_locks([RedisManager.token_price_lock_key(token) for token in locked_tokens],
+                                         lock_token)
+
+        # Wait for the tokens refreshed by others.
+        waiting_tokens = [token for token, is_acquired in zip(tokens, acquired) if not is_acquired]
+        deadline = pytime.monotonic() + self.wait_sec
+        while wait and len(waiting_tokens) != 0 and pytime.monotonic() < deadline:
+            pytime.sleep(0.05)
+            for token, quote_str in zip(waiting_tokens, self.redis.get_price_quotes(waiting_tokens)):
+                quote = None if quote_str is None else PriceQuote.from_str(quote_str)
+                if quote is not None:
+                    quotes[token] = quote
+                    self._cache.set(token, quote)
+            waiting_tokens = [token for token in waiting_tokens if token not in quotes]
+        return quotes
+
+    def _refresh_in_background(self,
+                               tokens: List[str]) -> None:
+        """
+        Refreshes the tokens' prices on a background thread, unless this process is already refreshing them.
+        """
+        with PriceOracle._refreshing_lock:
+            if PriceOracle._refresh_pid != os.getpid():
+                PriceOracle._refresh_executor = ThreadPoolExecutor(
+                    max_workers=config('PRICE_REFRESH_THREADS', default=2, cast=int),
+                    thread_name_prefix='price-refresh')
+                PriceOracle._refresh_pid = os.getpid()
+                PriceOracle._refreshing = set()
+            tokens = [token for token in tokens if token not in PriceOracle._refreshing]
+            if len(tokens) == 0:
+                return
+            PriceOracle._refreshing.update(tokens)
+            PriceOracle._refresh_executor.submit(self._refresh_in_foreground, tokens)
+
+    def _refresh_in_foreground(self,
+                               tokens: List[str]) -> None:
+        """
+        Refreshes the tokens' prices, then lets them be refreshed in the background again.
+        """
+        try:
+            self._refresh(tokens, wait=False)
+        finally:
+            with PriceOracle._refreshing_lock:
+                PriceOracle._refreshing.difference_update(tokens)
@@ -0,0 +1,16 @@
+from typing import Dict, List
+
+
+class PriceProvider:
+    """
+    Source of token prices, queried by the PriceOracle whenever its cached prices are missing or stale.
+    Subclasses connect to a particular source (an exchange, an aggregator, a fixture) by implementing fetch_prices().
+    """
+
+    def fetch_prices(self,
+                     tokens: List[str]) -> Dict[str, float]:
+        """
+        Returns the current price of each of the tokens, in a single request to the source where possible.
+        Tokens which the source can't price are left out.
+        """
+        raise NotImplementedError
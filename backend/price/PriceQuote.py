@@ -0,0 +1,73 @@
+import json
+import traceback
+from typing import Dict, Optional
+
+
+class PriceQuote:
+    """
+    Wrapper for a token's price, as fetched from a price provider.
+    """
+
+    # The token which was priced.
+    token: str
+
+    # The token's price.
+    price: float
+
+    # Unix time (in seconds) at which the price was fetched.
+    fetched_at: float
+
+    def __init__(self,
+                 token: str,
+                 price: float,
+                 fetched_at: float):
+        self.token = token
+        self.price = price
+        self.fetched_at = fetched_at
+
+    def __str__(self):
+        return json.dumps(self.to_json())
+
+    def age_sec(self,
+                now: float) -> float:
+        """
+        Returns how many seconds before now the price was fetched.
+        """
+        return now - self.fetched_at
+
+    def to_json(self) -> Dict:
+        return {
+            'token':      self.token,
+            'price':      self.price,
+            'fetched_at': self.fetched_at
+        }
+
+    @classmethod
+    def from_str(cls,
+                 str_data: str) -> Optional['PriceQuote']:
+        """
+        Converts the string into a PriceQuote wrapper,
+            or None if the data is invalid.
+        """
+        try:
+            return cls.from_json(json.loads(str_data))
+        except Exception as e:
+            print(f'ERROR! Something went wrong trying to load a price quote '
+                  f'from "{str_data}": {traceback.format_exc()}')
+            return None
+
+    @classmethod
+    def from_json(cls,
+                  json_data: Dict) -> Optional['PriceQuote']:
+        """
+        Converts the json object into a PriceQuote wrapper,
+            or None if the data is invalid.
+        """
+        try:
+            return PriceQuote(token=str(json_data['token']),
+                              price=float(json_data['price']),
+                              fetched_at=float(json_data['fetched_at']))
+        except Exception as e:
+            print(f'ERROR! Something went wrong trying to load price quote data '
+                  f'from json: {traceback.format_exc()}')
+            return None
@@ -0,0 +1,91 @@
+import json
+import math
+import time as pytime
+import traceback
+from typing import Dict, Optional
+
+
+class PriceTick:
+    """
+    Wrapper for one price update of a token, as received from a price feed.
+    """
+
+    # The token whose price changed.
+    token: str
+
+    # The token's new price.
+    price: float
+
+    # Unix time (in seconds) at which the price was observed.
+    timestamp: float
+
+    def __init__(self,
+                 token: str,
+                 price: float,
+                 timestamp: float):
+        self.token = token
+        self.price = price
+        self.timestamp = timestamp
+
+    def __str__(self):
+        return json.dumps(self.to_json())
+
+    def to_json(self) -> Dict:
+        return {
+            'token':     self.token,
+            'price':     self.price,
+            'timestamp': self.timestamp
+        }
+
+    @classmethod
+    def from_line(cls,
+                  line: str) -> Optional['PriceTick']:
+        """
+        Converts a line of a feed into a PriceTick wrapper, or None if the line is blank or invalid.
+        Lines are either JSON objects ({"token": "BTC", "price": 50000, "timestamp": 1600000000})
+            or comma-separated token,price[,timestamp] values. A missing timestamp defaults to now.
+        Prices must be finite and positive.
+        """
+        line = line.strip()
+        if len(line) == 0 or line.startswith('#'):
+            return None
+        if line.startswith('{'):
+            return cls.from_json(json.loads(line))
+        try:
+            fields = [field.strip() for field in line.split(',')]
+            price = float(fields[1])
+            timestamp = float(fields[2]) if len(fields) > 2 else pytime.time()
+            assert cls.is_valid_price(price) and math.isfinite(timestamp)
+            return PriceTick(token=fields[0],
+                             price=price,
+                             timestamp=timestamp)
+        except Exception as e:
+            print(f'ERROR! Something went wrong trying to load a price tick '
+                  f'from "{line}": {traceback.format_exc()}')
+            return None
+
+    @classmethod
+    def from_json(cls,
+                  json_data: Dict) -> Optional['PriceTick']:
+        """
+        Converts the json object into a PriceTick wrapper,
+            or None if the data is invalid (including a price which isn't finite and positive).
+        """
+        try:
+            price = float(json_data['price'])
+            timestamp = float(json_data.get('timestamp', pytime.time()))
+            assert cls.is_valid_price(price) and math.isfinite(timestamp)
+            return PriceTick(token=str(json_data['token']),
+                             price=price,
+                             timestamp=timestamp)
+        except Exception as e:
+            print(f'ERROR! Something went wrong trying to load price tick data '
+                  f'from json: {traceback.format_exc()}')
+            return None
+
+    @staticmethod
+    def is_valid_price(price: float) -> bool:
+        """
+        Returns True if the price is finite and positive, so that it can bound a range query on targets.
+        """
+        return math.isfinite(price) and price > 0
@@ -0,0 +1,52 @@
+import socket
+import time as pytime
+from typing import Iterator
+
+from backend.price.PriceFeed import PriceFeed
+from backend.price.PriceTick import PriceTick
+
+
+class SocketPriceFeed(PriceFeed):
+    """
+    Price feed which reads newline-delimited ticks (see PriceTick.from_line()) from a TCP socket,
+        i.e. one served locally with `nc -lk 9000 < ticks.csv`.
+    Reconnects whenever the connection drops.
+    """
+
+    # Host serving the ticks.
+    host: str
+
+    # Port serving the ticks.
+    port: int
+
+    # Seconds to wait before reconnecting after the connection drops.
+    reconnect_delay_sec: float
+
+    # Whether to stop, rather than reconnect, once the server closes the connection.
+    stop_on_close: bool
+
+    def __init__(self,
+                 host: str,
+                 port: int,
+                 reconnect_delay_sec: float = 1,
+                 stop_on_close: bool = False):
+        self.host = host
+        self.port = port
+        self.reconnect_delay_sec = reconnect_delay_sec
+        self.stop_on_close = stop_on_close
+
+    def ticks(self) -> Iterator[PriceTick]:
+        while True:
+            try:
+                with socket.create_connection((self.host, self.port)) as connection:
+                    with connection.makefile('r', encoding='utf-8') as lines:
+                        for line in lines:
+                            tick = PriceTick.from_line(line)
+                            if tick is not None:
+                                yield tick
+                if self.stop_on_close:
+                    return
+                print(f'WARNING: Price feed {self.host}:{self.port} closed the connection, reconnecting')
+            except OSError as e:
+                print(f'WARNING: Lost price feed {self.host}:{self.port}, reconnecting: {e}')
+            pytime.sleep(self.reconnect_delay_sec)
@@ -0,0 +1,56 @@
+from typing import Dict, Optional
+
+
+class FundWriteResult:
+    """
+    Outcome of an attempt to write a fund's data to Redis.
+    """
+
+    # Whether the fund's data was written.
+    saved: bool
+
+    # Email of the manager who already owns the fund, if the write was refused because of it.
+    conflicting_manager_email: Optional[str]
+
+    # Version of the fund after the write (or its current version, if the write was refused as stale).
+    version: Optional[int]
+
+    # Whether the write was refused because the fund changed since the version it was based on.
+    is_stale: bool
+
+    # Whether the write was refused because the fund doesn't exist.
+    is_missing: bool
+
+    # The fields which the write changed, for writes that only change part of a fund.
+    changes: Optional[Dict]
+
+    def __init__(self,
+                 saved: bool,
+                 conflicting_manager_email: Optional[str] = None,
+                 version: Optional[int] = None,
+                 is_stale: bool = False,
+                 is_missing: bool = False,
+                 changes: Optional[Dict] = None):
+        self.saved = saved
+        self.conflicting_manager_email = conflicting_manager_email
+        self.version = version
+        self.is_stale = is_stale
+        self.is_missing = is_missing
+        self.changes = changes
+
+    @property
+    def is_conflict(self) -> bool:
+        """
+        Returns True if the write was refused because another manager owns the fund.
+        """
+        return not self.saved and self.conflicting_manager_email is not None
+
+    def to_json(self) -> Dict:
+        return {
+            'saved':                     self.saved,
+            'conflicting_manager_email': self.conflicting_manager_email,
+            'version':                   self.version,
+            'is_stale':                  self.is_stale,
+            'is_missing':                self.is_missing,
+            'changes':                   self.changes
+        }
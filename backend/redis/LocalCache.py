@@ -0,0 +1,179 @@
+import threading
+import time as pytime
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from decouple import config
+
+
+class LocalCache:
+    """
+    Size- and TTL-bounded LRU cache, local to the current process.
+    Entries are invalidated across processes by RedisManager, which publishes the keys of whatever
+        it writes and forwards the keys it receives to invalidate_everywhere().
+    Each invalidation advances the cache's generation. Callers record generation() before reading a value from
+        Redis and pass it to set(), which then doesn't cache the value if its key was invalidated during the read.
+    """
+
+    # Returned by get() when a key is not cached (None is a valid cached value).
+    MISSING = object()
+
+    # Every cache created in this process, so that invalidations reach all of them.
+    _registry: List['LocalCache'] = []
+
+    # Name under which the cache's stats are reported.
+    name: str
+
+    # Maximum number of entries kept before the least recently used ones are evicted.
+    max_entries: int
+
+    # Seconds after which an entry expires.
+    ttl_sec: float
+
+    # Cached (expiry time, value) pairs, ordered from least to most recently used.
+    _entries: 'OrderedDict[str, Tuple[float, Any]]'
+
+    # Number of invalidations (or clears) so far.
+    _generation: int
+
+    # Generation of the latest invalidation of each recently invalidated key, from oldest to newest.
+    _invalidated_generations: 'OrderedDict[str, int]'
+
+    # Latest generation at which keys were invalidated without being tracked in _invalidated_generations.
+    _untracked_generation: int
+
+    def __init__(self,
+                 name: str,
+                 max_entries: int = config('LOCAL_CACHE_MAX_ENTRIES', default=10000, cast=int),
+                 ttl_sec: float = config('LOCAL_CACHE_TTL_SEC', default=30, cast=float)):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._invalidated_generations = OrderedDict()
+        self._untracked_generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_sets = 0
+        LocalCache._registry.append(self)
+
+    def get(self,
+            key: str) -> Any:
+        """
+        Returns the cached value, or LocalCache.MISSING if it isn't cached or has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                self.misses += 1
+                return LocalCache.MISSING
+            expires_at, value = entry
+            if expires_at <= pytime.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return LocalCache.MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self) -> int:
+        """
+        Returns the cache's current generation, to be passed to set() once the value has been read.
+        """
+        with self._lock:
+            return self._generation
+
+    def set(self,
+            key: str,
+            value: Any,
+            generation: Optional[int] = None) -> None:
+        """
+        Caches the value, evicting the least recently used entries if the cache is full.
+        If the generation at which the value started being read is given, the value isn't cached if the key
+            was (or may have been) invalidated since.
+        """
+        with self._lock:
+            if generation is not None and (self._untracked_generation > generation
+                                           or self._invalidated_generations.get(key, 0) > generation):
+                self.stale_sets += 1
+                return
+            self._entries[key] = (pytime.monotonic() + self.ttl_sec, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self,
+                   keys: Iterable[str]) -> None:
+        """
+        Removes the keys from the cache.
+        """
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+                self._invalidated_generations[key] = self._generation
+                self._invalidated_generations.move_to_end(key)
+            while len(self._invalidated_generations) > self.max_entries:
+                _, self._untracked_generation = self._invalidated_generations.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Removes every entry from the cache.
+        """
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._generation += 1
+            self._invalidated_generations.clear()
+            self._untracked_generation = self._generation
+
+    def stats(self) -> Dict:
+        """
+        Returns the cache's counters, for tuning its size and TTL.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'entries':       len(self._entries),
+            'max_entries':   self.max_entries,
+            'ttl_sec':       self.ttl_sec,
+            'hits':          self.hits,
+            'misses':        self.misses,
+            'hit_rate':      0 if lookups == 0 else self.hits / lookups,
+            'evictions':     self.evictions,
+            'expirations':   self.expirations,
+            'invalidations': self.invalidations,
+            'stale_sets':    self.stale_sets
+        }
+
+    @classmethod
+    def invalidate_everywhere(cls,
+                              keys: Iterable[str]) -> None:
+        """
+        Removes the keys from every cache in this process.
+        """
+        keys = list(keys)
+        for cache in cls._registry:
+            cache.invalidate(keys)
+
+    @classmethod
+    def clear_everywhere(cls) -> None:
+        """
+        Removes every entry from every cache in this process.
+        """
+        for cache in cls._registry:
+            cache.clear()
+
+    @classmethod
+    def all_stats(cls) -> Dict:
+        """
+        Returns the counters of every cache in this process, by cache name.
+        """
+        return {cache.name: cache.stats() for cache in cls._registry}
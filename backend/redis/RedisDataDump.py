@@ -0,0 +1,229 @@
+import io
+import json
+import time as pytime
+from typing import Dict, IO, Iterator, List, Optional
+
+from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.IndexFundSnapshot import IndexFundSnapshot
+from backend.redis.RedisManager import RedisManager
+from backend.user.FundUser import FundUser
+
+
+class RedisDataDump:
+    """
+    Exports every user (FundUser) and fund (IndexFundSnapshot) stored in Redis to a file of JSON lines,
+        and imports them back, so that data can be backed up or copied between environments.
+    Each line holds one record: {"type": "user" or "fund", "data": <the user's or fund's json>}.
+        Users come first, and their fund ids are only informative: importing the funds rebuilds them.
+    Files ending in .gz are compressed with gzip, and files ending in .zst with Zstandard (which requires the
+        optional zstandard package). Both directions stream the records in batches, and records which can't be
+        imported are reported as they are found, so memory stays flat regardless of the size of the data.
+    """
+
+    # Record holding a FundUser.
+    USER = 'user'
+
+    # Record holding an IndexFundSnapshot.
+    FUND = 'fund'
+
+    @classmethod
+    def export(cls,
+               path: str,
+               redis: RedisManager,
+               batch_size: int = 1000,
+               include_users: bool = True,
+               include_funds: bool = True) -> Dict:
+        """
+        Writes the users and funds to the file, and returns the number of each written and the throughput.
+        Users and funds are streamed with HSCAN (or SCAN in the entity key layout), each batch loaded in one round trip.
+        """
+        stats = cls._new_stats()
+        with cls.open(path, 'w') as dump_file:
+            if include_users:
+                for user_emails in redis.scan_user_emails(batch_size):
+                    for user_email, (user_name, fund_ids) in zip(user_emails, redis.get_user_profiles(user_emails)):
+                        if user_name is not None:
+                            user = FundUser(email=user_email,
+                                            name=user_name,
+                                            funds=sorted(fund_ids))
+                            cls._write(dump_file, cls.USER, user.to_json(), stats)
+                    cls._print_progress('exported', stats)
+            if include_funds:
+                for fund_ids in redis.scan_fund_ids(batch_size):
+                    for fund_id, (manager_email, investor_emails, portfolio) in zip(fund_ids,
+                                                                                    redis.get_funds(fund_ids)):
+                        if manager_email is not None:
+                            snapshot = IndexFundSnapshot(fund_id=fund_id,
+                                                         manager_email=manager_email,
+                                                         investor_emails=sorted(investor_emails),
+                                                         portfolio=FundPortfolio(tokens=[]) if portfolio is None
+                                                         else portfolio)
+                            cls._write(dump_file, cls.FUND, snapshot.to_json(), stats)
+                    cls._print_progress('exported', stats)
+        return cls._finish_stats(stats)
+
+    @classmethod
+    def load(cls,
+             path: str,
+             redis: RedisManager,
+             batch_size: int = 1000,
+             errors_file: Optional[IO[str]] = None) -> Dict:
+        """
+        Saves the users and funds in the file to Redis, and returns the number of each saved, the number of
+            records which couldn't be saved, and the throughput.
+        Each record which couldn't be saved is printed as it is found, and written to the errors file (if any)
+            as a JSON line holding its line number and the reason.
+        Each batch of users and of funds is written in a constant number of round trips. Funds are saved like
+            save_fund() does, so a fund already managed by another user is skipped.
+        """
+        stats = cls._new_stats()
+        stats['failed'] = 0
+        user_names = {}
+        funds = []
+        fund_lines = []
+        with cls.open(path, 'r') as dump_file:
+            for line_number, record in cls._read(dump_file, stats):
+                if not isinstance(record, dict):
+                    cls._fail(line_number, 'Invalid JSON record', stats, errors_file)
+                    continue
+                record_type = record.get('type', None)
+                if record_type == cls.USER:
+                    user = FundUser.from_json(record.get('data', {}))
+                    if user is None:
+                        cls._fail(line_number, 'Invalid user', stats, errors_file)
+                        continue
+                    user_names[user.email] = user.name
+                    if len(user_names) >= batch_size:
+                        cls._save_users(user_names, redis, stats)
+                        user_names = {}
+                elif record_type == cls.FUND:
+                    snapshot = IndexFundSnapshot.from_json(record.get('data', {}))
+                    if snapshot is None:
+                        cls._fail(line_number, 'Invalid fund', stats, errors_file)
+                        continue
+                    funds.append((snapshot.fund_id, snapshot.manager_email, snapshot.investor_emails,
+                                  snapshot.portfolio))
+                    fund_lines.append(line_number)
+                    if len(funds) >= batch_size:
+                        cls._save_funds(funds, fund_lines, redis, stats, errors_file)
+                        funds = []
+                        fund_lines = []
+                else:
+                    cls._fail(line_number, f'Unknown record type "{record_type}"', stats, errors_file)
+            cls._save_users(user_names, redis, stats)
+            cls._save_funds(funds, fund_lines, redis, stats, errors_file)
+        return cls._finish_stats(stats)
+
+    @staticmethod
+    def open(path: str,
+             mode: str) -> IO[str]:
+        """
+        Opens the file for reading ('r') or writing ('w') text, compressed according to its extension.
+        """
+        if path.endswith('.gz'):
+            import gzip
+            return gzip.open(path, mode + 't', encoding='utf-8')
+        if path.endswith('.zst'):
+            try:
+                import zstandard
+            except ImportError:
+                raise ValueError('Reading and writing .zst files requires the zstandard package to be installed')
+            raw_file = open(path, mode + 'b')
+            if mode == 'w':
+                stream = zstandard.ZstdCompressor().stream_writer(raw_file)
+            else:
+                stream = zstandard.ZstdDecompressor().stream_reader(raw_file)
+            return io.TextIOWrapper(stream, encoding='utf-8')
+        return open(path, mode, encoding='utf-8')
+
+    @classmethod
+    def _save_users(cls,
+                    user_names: Dict[str, str],
+                    redis: RedisManager,
+                    stats: Dict) -> None:
+        if len(user_names) == 0:
+            return
+        if not redis.save_new_users(user_names):
+            raise ValueError(f'Could not save {len(user_names)} users in redis')
+        stats[cls.USER] += len(user_names)
+        cls._print_progress('imported', stats)
+
+    @classmethod
+    def _save_funds(cls,
+                    funds: List,
+                    fund_lines: List[int],
+                    redis: RedisManager,
+                    stats: Dict,
+                    errors_file: Optional[IO[str]]) -> None:
+        if len(funds) == 0:
+            return
+        for (fund_id, _, _, _), line_number, write_result in zip(funds, fund_lines, redis.save_funds(funds)):
+            if write_result.saved:
+                stats[cls.FUND] += 1
+            elif write_result.is_conflict:
+                cls._fail(line_number,
+                          f'Fund "{fund_id}" is already managed by {write_result.conflicting_manager_email}',
+                          stats, errors_file)
+            else:
+                raise ValueError(f'Could not save fund "{fund_id}" in redis')
+        cls._print_progress('imported', stats)
+
+    @staticmethod
+    def _fail(line_number: int,
+              error: str,
+              stats: Dict,
+              errors_file: Optional[IO[str]]) -> None:
+        """
+        Reports a record which couldn't be imported.
+        """
+        print(f'Line {line_number}: {error}')
+        if errors_file is not None:
+            errors_file.write(json.dumps({'line': line_number, 'error': error}) + '\n')
+        stats['failed'] += 1
+
+    @classmethod
+    def _write(cls,
+               dump_file: IO[str],
+               record_type: str,
+               data: Dict,
+               stats: Dict) -> None:
+        line = json.dumps({'type': record_type, 'data': data}, separators=(',', ':')) + '\n'
+        dump_file.write(line)
+        stats[record_type] += 1
+        stats['bytes'] += len(line)
+
+    @staticmethod
+    def _read(dump_file: IO[str],
+              stats: Dict) -> Iterator:
+        """
+        Yields the line number and record of each non-blank line.
+        """
+        for line_number, line in enumerate(dump_file, start=1):
+            stats['bytes'] += len(line)
+            if len(line.strip()) != 0:
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    yield line_number, None
+
+    @classmethod
+    def _new_stats(cls) -> Dict:
+        return {cls.USER: 0, cls.FUND: 0, 'bytes': 0, 'start_time': pytime.monotonic()}
+
+    @classmethod
+    def _finish_stats(cls,
+                      stats: Dict) -> Dict:
+        elapsed_sec = pytime.monotonic() - stats.pop('start_time')
+        stats['elapsed_sec'] = elapsed_sec
+        stats['records_per_sec'] = (stats[cls.USER] + stats[cls.FUND]) / max(elapsed_sec, 1e-9)
+        stats['mb_per_sec'] = stats['bytes'] / 1e6 / max(elapsed_sec, 1e-9)
+        return stats
+
+    @classmethod
+    def _print_progress(cls,
+                        action: str,
+                        stats: Dict) -> None:
+        elapsed_sec = pytime.monotonic() - stats['start_time']
+        num_records = stats[cls.USER] + stats[cls.FUND]
+        print(f'...{action} {stats[cls.USER]} users and {stats[cls.FUND]} funds '
+              f'({num_records / max(elapsed_sec, 1e-9):.0f} records/s)')
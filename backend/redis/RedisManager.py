@@ -1,11 +1,326 @@
+import copy
+import json
+import os
+import random
+import threading
 import time as pytime
 import traceback
-from typing import List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 from decouple import config
-from redis import BusyLoadingError, Redis
+from redis import BlockingConnectionPool, BusyLoadingError, Redis
+from redis.cluster import RedisCluster
+from redis.sentinel import Sentinel
+from redis.client import Pipeline
+from redis.commands.core import Script
 
+from backend.fund.FundNavSnapshot import FundNavSnapshot
+from backend.fund.FundPatch import FundPatch
 from backend.fund.FundPortfolio import FundPortfolio
+from backend.fund.FundVersion import FundVersion
+from backend.fund.NavBucket import NavBucket
+from backend.redis.FundWriteResult import FundWriteResult
+from backend.redis.LocalCache import LocalCache
+
+# Every field of every user/fund is stored in a global hash per field (i.e. 'fund_portfolio').
+KEY_LAYOUT_LEGACY = 'legacy'
+
+# Every user/fund is stored in its own hash, with a hash tag that keeps its keys in one cluster slot.
+KEY_LAYOUT_ENTITY = 'entity'
+
+# Global hash holding each user field in the legacy key layout.
+LEGACY_USER_HASHES = {
+    'name':          'user_name',
+    'token_version': 'user_token_version',
+}
+
+# Global hash holding each fund field in the legacy key layout.
+LEGACY_FUND_HASHES = {
+    'manager_email': 'fund_manager_email',
+    'portfolio':     'fund_portfolio',
+    'version':       'fund_version',
+}
+
+# Portfolios are stored in PortfolioCodec's compact binary format.
+PORTFOLIO_ENCODING_BINARY = 'binary'
+
+# Portfolios are stored as JSON strings.
+PORTFOLIO_ENCODING_JSON = 'json'
+
+# Pub/sub channel on which the keys of written users/funds are published, to invalidate local caches.
+CACHE_INVALIDATION_CHANNEL = 'cache_invalidation'
+
+# Replaces a hash field's value, only if it still holds the expected value.
+#   KEYS: hash
+#   ARGV: field, expected value, new value
+# Returns 1 if the value was replaced, or 0 if the field changed in the meantime.
+COMPARE_AND_SET_FIELD_SCRIPT = """
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+return 1
+"""
+
+# Claims a fund for its manager and writes all of its fields atomically, bumping the fund's version.
+# Refuses the write if the fund is already managed by someone else.
+#   KEYS: hashes holding the fund's manager email, portfolio and version, the fund's investor emails set
+#   ARGV: manager email field, portfolio field, version field, manager email, portfolio, investor emails...
+# Returns {1, '', <previous investor emails>, <previous portfolio>, <new version>} if written,
+#   or {0, <existing manager email>, {}, '', 0} if refused.
+SAVE_FUND_SCRIPT = """
+local existing_manager = redis.call('HGET', KEYS[1], ARGV[1])
+if existing_manager and existing_manager ~= '' and existing_manager ~= ARGV[4] then
+    return {0, existing_manager, {}, '', 0}
+end
+local previous_investors = redis.call('SMEMBERS', KEYS[4])
+local previous_portfolio = redis.call('HGET', KEYS[2], ARGV[2]) or ''
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[4])
+redis.call('HSET', KEYS[2], ARGV[2], ARGV[5])
+redis.call('DEL', KEYS[4])
+for i = 6, #ARGV, 1000 do
+    redis.call('SADD', KEYS[4], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+local version = redis.call('HINCRBY', KEYS[3], ARGV[3], 1)
+return {1, '', previous_investors, previous_portfolio, version}
+"""
+
+# Replaces a fund's portfolio, bumping the fund's version.
+#   KEYS: hashes holding the fund's portfolio and version
+#   ARGV: portfolio field, version field, new portfolio
+# Returns {<previous portfolio, or '' if there was none>, <new version>}.
+SET_PORTFOLIO_SCRIPT = """
+local previous = redis.call('HGET', KEYS[1], ARGV[1]) or ''
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+return {previous, redis.call('HINCRBY', KEYS[2], ARGV[2], 1)}
+"""
+
+# Applies a patch to a fund, only if the fund is still at the version the patch was computed against.
+# The portfolio is patched by the caller (it may be binary-encoded), while investors are added and removed here.
+#   KEYS: hashes holding the fund's manager email, portfolio and version, the fund's investor emails set
+#   ARGV: manager email field, portfolio field, version field, required manager email ('' for any),
+#         expected version, patched portfolio ('' to leave it as it is), number of investors to add,
+#         investor emails to add..., investor emails to remove...
+# Returns {1, <new version>, <manager email>, <added investors>, <removed investors>} if applied,
+#   {0, 0, '', {}, {}} if the fund doesn't exist, {0, 0, <manager email>, {}, {}} if it's managed by someone else,
+#   or {2, <current version>, <manager email>, {}, {}} if it changed since the expected version.
+PATCH_FUND_SCRIPT = """
+local manager = redis.call('HGET', KEYS[1], ARGV[1])
+if not manager or manager == '' then
+    return {0, 0, '', {}, {}}
+end
+if ARGV[4] ~= '' and manager ~= ARGV[4] then
+    return {0, 0, manager, {}, {}}
+end
+local version = tonumber(redis.call('HGET', KEYS[3], ARGV[3]) or '0')
+if version ~= tonumber(ARGV[5]) then
+    return {2, version, manager, {}, {}}
+end
+if ARGV[6] ~= '' then
+    redis.call('HSET', KEYS[2], ARGV[2], ARGV[6])
+end
+local added = {}
+local removed = {}
+local num_added = tonumber(ARGV[7])
+for i = 8, 7 + num_added do
+    if ARGV[i] ~= manager and redis.call('SADD', KEYS[4], ARGV[i]) == 1 then
+        added[#added + 1] = ARGV[i]
+    end
+end
+for i = 8 + num_added, #ARGV do
+    if redis.call('SREM', KEYS[4], ARGV[i]) == 1 then
+        removed[#removed + 1] = ARGV[i]
+    end
+end
+if ARGV[6] ~= '' or #added > 0 or #removed > 0 then
+    version = redis.call('HINCRBY', KEYS[3], ARGV[3], 1)
+end
+return {1, version, manager, added, removed}
+"""
+
+# Deletes a lock, only if it is still held by the caller.
+#   KEYS: lock
+#   ARGV: the caller's lock token
+# Returns 1 if the lock was released, or 0 if it expired or was taken by someone else.
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+return redis.call('DEL', KEYS[1])
+"""
+
+# Appends a version to a fund's portfolio history: a delta against the previous version, or a checkpoint of the
+#   whole portfolio every checkpoint interval versions (and whenever the previous version is missing, so that every
+#   delta has a base). Each checkpoint also compacts the versions older than the ones kept in full: their deltas
+#   are dropped, and their checkpoints are thinned out, doubling the spacing between the kept ones each time
+#   their age doubles (always keeping the newest, which the oldest deltas kept in full build on).
+#   KEYS: the fund's history
+#   ARGV: version, delta entry, checkpoint entry, checkpoint interval, number of versions kept in full
+# Each entry is a member "<kind>|<version>|..." scored by its version, where kind 'c' marks checkpoints.
+# Returns the number of entries compacted away.
+RECORD_FUND_VERSION_SCRIPT = """
+local version = tonumber(ARGV[1])
+local interval = tonumber(ARGV[4])
+local full_versions = tonumber(ARGV[5])
+local last = redis.call('ZREVRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if #last == 0 or tonumber(last[2]) ~= version - 1 or version % interval == 0 then
+    redis.call('ZADD', KEYS[1], version, ARGV[3])
+else
+    redis.call('ZADD', KEYS[1], version, ARGV[2])
+end
+if version % interval ~= 0 then
+    return 0
+end
+local old = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', '(' .. (version - full_versions), 'WITHSCORES')
+local newest_checkpoint = 0
+for i = 1, #old, 2 do
+    if string.sub(old[i], 1, 1) == 'c' then
+        newest_checkpoint = i
+    end
+end
+local num_removed = 0
+for i = 1, #old, 2 do
+    local keep = false
+    if string.sub(old[i], 1, 1) == 'c' then
+        local old_version = tonumber(old[i + 1])
+        local spacing = interval
+        local age = version - old_version
+        while age >= 2 * full_versions do
+            age = age / 2
+            spacing = spacing * 2
+        end
+        keep = i == newest_checkpoint or old_version % spacing == 0
+    end
+    if not keep then
+        redis.call('ZREM', KEYS[1], old[i])
+        num_removed = num_removed + 1
+    end
+end
+return num_removed
+"""
+
+# Indexes a fund under one of its tokens (or removes it from the token's indexes), unless a newer version of the
+#   fund was already indexed under the token, so that the index updates of successive saves can land in any order.
+#   KEYS: the token's fund index, buy target index and sell target index, and its hash of indexed fund versions
+#   ARGV: fund id, fund version, portfolio_pct ('' to remove the fund), buy target, sell target
+# Returns 1 if the indexes were updated, or 0 if a newer version of the fund was already indexed.
+UPDATE_TOKEN_INDEXES_SCRIPT = """
+if tonumber(redis.call('HGET', KEYS[4], ARGV[1]) or '-1') > tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('HSET', KEYS[4], ARGV[1], ARGV[2])
+if ARGV[3] == '' then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    redis.call('ZREM', KEYS[3], ARGV[1])
+else
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+    redis.call('ZADD', KEYS[2], ARGV[4], ARGV[1])
+    redis.call('ZADD', KEYS[3], ARGV[5], ARGV[1])
+end
+return 1
+"""
+
+# Stores the Euclidean norm and the total of a fund's portfolio_pct vector (over its tokens), for similarity searches,
+#   along with the version of the fund they were computed from, unless they were already stored for a newer version.
+# The version also tells cached similarity results whether any of the funds they list has changed since.
+#   KEYS: the fund's hash
+#   ARGV: fund version, norm, total
+# Returns 1 if the vector was stored, or 0 if a newer version's was already stored.
+UPDATE_FUND_VECTOR_SCRIPT = """
+if tonumber(redis.call('HGET', KEYS[1], 'vector_version') or '-1') > tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'vector_version', ARGV[1], 'vector_norm', ARGV[2], 'vector_total', ARGV[3])
+return 1
+"""
+
+# Converts a user's fund ids from a set (as they were first stored) into a sorted set of members scored 0,
+#   which can be paged in order of id with ZRANGEBYLEX.
+#   KEYS: the user's fund ids
+# Returns the number of fund ids converted, or -1 if the key isn't a set.
+CONVERT_USER_FUND_IDS_SCRIPT = """
+if redis.call('TYPE', KEYS[1]).ok ~= 'set' then
+    return -1
+end
+local fund_ids = redis.call('SMEMBERS', KEYS[1])
+redis.call('DEL', KEYS[1])
+for i = 1, #fund_ids, 1000 do
+    local members = {}
+    for j = i, math.min(i + 999, #fund_ids) do
+        members[#members + 1] = 0
+        members[#members + 1] = fund_ids[j]
+    end
+    redis.call('ZADD', KEYS[1], unpack(members))
+end
+return #fund_ids
+"""
+
+# Resolutions at which fund NAVs are rolled up, and the seconds covered by each bucket.
+NAV_RESOLUTIONS = {
+    '1m': 60,
+    '1h': 3600,
+    '1d': 86400,
+}
+
+# Appends a NAV snapshot to a fund's stream (timestamped by its stream id), and folds it into each rollup
+#   (open/high/low/close/count/sum of the bucket it falls in). Trims everything older than its retention.
+#   KEYS: the fund's NAV stream, then one sorted set of buckets per resolution
+#   ARGV: nav, allocations (JSON), stream retention ms, then bucket ms and retention ms per resolution
+# Each bucket is a member "start,open,high,low,close,count,sum,first_ts,last_ts" scored by its start (ms).
+# Returns the snapshot's stream id.
+ADD_NAV_SNAPSHOT_SCRIPT = """
+local id = redis.call('XADD', KEYS[1], '*', 'nav', ARGV[1], 'allocations', ARGV[2])
+local ts = tonumber(string.match(id, '^(%d+)'))
+local nav = tonumber(ARGV[1])
+redis.call('XTRIM', KEYS[1], 'MINID', '~', ts - tonumber(ARGV[3]))
+for i = 2, #KEYS do
+    local bucket_ms = tonumber(ARGV[2 + (i - 1) * 2])
+    local retention_ms = tonumber(ARGV[3 + (i - 1) * 2])
+    local start = ts - (ts % bucket_ms)
+    local bucket = {start, nav, nav, nav, nav, 1, nav, ts, ts}
+    local existing = redis.call('ZRANGEBYSCORE', KEYS[i], start, start)
+    if #existing > 0 then
+        local old = {}
+        for value in string.gmatch(existing[1], '[^,]+') do
+            old[#old + 1] = tonumber(value)
+        end
+        bucket[2] = old[2]
+        bucket[3] = math.max(old[3], nav)
+        bucket[4] = math.min(old[4], nav)
+        bucket[6] = old[6] + 1
+        bucket[7] = old[7] + nav
+        bucket[8] = old[8]
+        redis.call('ZREM', KEYS[i], existing[1])
+    end
+    redis.call('ZADD', KEYS[i], start, table.concat(bucket, ','))
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', '(' .. (start - retention_ms))
+end
+return id
+"""
+
+# Stream to which the trigger engine appends an event whenever a price crosses a fund's buy/sell target.
+TRIGGER_EVENTS_STREAM = 'trigger_events'
+
+# Hash of the last price seen by the trigger engine for each token, so that it can resume after a restart.
+TRIGGER_LAST_PRICES_HASH = 'trigger_last_prices'
+
+# Hash of the number of funds holding each token.
+# The braces are a hash tag, keeping both exposure hashes in one cluster slot so they can be replaced together.
+TOKEN_FUND_COUNTS_HASH = '{token_exposures}:fund_counts'
+
+# Hash of the sum of every fund's portfolio_pct in each token.
+TOKEN_PCT_SUMS_HASH = '{token_exposures}:pct_sums'
+
+# Global hashes which held every fund's vector norm, total and version and every token's vector version, before
+#    they moved to each fund's and token's own keys (so that they shard across a cluster), deleted by
+#    rebuild_token_indexes().
+LEGACY_FUND_VECTOR_HASHES = ['{fund_vectors}:norms', '{fund_vectors}:totals', '{fund_vectors}:versions',
+                             '{fund_vectors}:token_versions']
+
+# Sorted set of every fund's id, all with the same score so that they are ordered by id, for listing funds a page
+#    at a time from any id onwards.
+FUND_IDS_INDEX = 'fund_ids'
 
 
 class RedisManager:
@@ -14,18 +329,171 @@ class RedisManager:
     """
     client: Redis
 
-    def connect(self) -> bool:
+    # Server-side script behind save_fund().
+    save_fund_script: Script
+
+    # Server-side script behind reencode_portfolios().
+    compare_and_set_field_script: Script
+
+    # Server-side script behind set_fund_portfolio().
+    set_portfolio_script: Script
+
+    # Server-side script behind patch_fund().
+    patch_fund_script: Script
+
+    # Server-side script recording every version of a fund's portfolio.
+    record_fund_version_script: Script
+
+    # Server-side script keeping each token's fund and buy/sell target indexes in line with the funds' portfolios.
+    update_token_indexes_script: Script
+
+    # Server-side script storing each fund's portfolio_pct vector norm and total.
+    update_fund_vector_script: Script
+
+    # Server-side script behind convert_user_fund_ids().
+    convert_user_fund_ids_script: Script
+
+    # Server-side script behind release_locks().
+    release_lock_script: Script
+
+    # Server-side script behind add_nav_snapshots().
+    add_nav_snapshot_script: Script
+
+    # Whether get_* methods may read from replicas (if any are configured).
+    use_replicas: bool = True
+
+    # Client (and its connection pool) shared by every RedisManager in this process.
+    # Re-created lazily in each forked (gunicorn worker) process.
+    _client: Optional[Union[Redis, RedisCluster]] = None
+
+    # Id of the process that created the shared client.
+    _client_pid: Optional[int] = None
+
+    # Manager bound to the shared client, handed out by shared().
+    _shared: Optional['RedisManager'] = None
+
+    # Guards client creation when several threads connect at once.
+    _client_lock = threading.Lock()
+
+    # Whether the database was confirmed to be loaded and accepting commands.
+    _ready: bool = False
+
+    # Clients of the read replicas, created along with the shared client.
+    _replicas: List[Redis] = []
+
+    # Time at which each replica was last checked, and whether it was caught up with the primary then.
+    _replica_freshness: Dict[int, Tuple[float, bool]] = {}
+
+    # Bytes of the replication stream a replica may lag behind the primary before reads fall back to the primary.
+    replica_max_lag_bytes: int = config('REDIS_REPLICA_MAX_LAG_BYTES', default=0, cast=int)
+
+    # Seconds a replica may take to receive a write, for which the writer's reads are pinned to the primary
+    #   (or until replicas are next checked, if that is longer).
+    replica_max_lag_sec: float = config('REDIS_REPLICA_MAX_LAG_SEC', default=1, cast=float)
+
+    # Seconds between checks of each replica's lag.
+    replica_check_interval_sec: float = config('REDIS_REPLICA_CHECK_INTERVAL_SEC', default=5, cast=float)
+
+    # Format in which portfolios are written: PORTFOLIO_ENCODING_BINARY or PORTFOLIO_ENCODING_JSON.
+    # Both formats can always be read.
+    portfolio_encoding: str = config('REDIS_PORTFOLIO_ENCODING', default=PORTFOLIO_ENCODING_BINARY, cast=str)
+
+    # Number of replicas a write waits for (with WAIT) before returning, so every worker can read it.
+    write_wait_replicas: int = config('REDIS_WRITE_WAIT_REPLICAS', default=0, cast=int)
+
+    # Milliseconds a write waits for replicas before giving up on them.
+    write_wait_timeout_ms: int = config('REDIS_WRITE_WAIT_TIMEOUT_MS', default=100, cast=int)
+
+    # Approximate number of events kept in the trigger events stream.
+    trigger_events_max_len: int = config('REDIS_TRIGGER_EVENTS_MAX_LEN', default=100000, cast=int)
+
+    # Seconds for which raw NAV snapshots are kept.
+    nav_snapshot_retention_sec: float = config('NAV_SNAPSHOT_RETENTION_SEC', default=2 * 86400, cast=float)
+
+    # Seconds for which the NAV rollup buckets of each resolution are kept.
+    nav_rollup_retention_sec: Dict[str, float] = {
+        '1m': config('NAV_1M_RETENTION_SEC', default=7 * 86400, cast=float),
+        '1h': config('NAV_1H_RETENTION_SEC', default=90 * 86400, cast=float),
+        '1d': config('NAV_1D_RETENTION_SEC', default=5 * 365 * 86400, cast=float),
+    }
+
+    # Number of versions between full checkpoints in each fund's portfolio history.
+    fund_history_checkpoint_interval: int = config('FUND_HISTORY_CHECKPOINT_INTERVAL', default=20, cast=int)
+
+    # Number of most recent versions of each fund's portfolio which can all be fetched; older versions are
+    #   compacted into fewer and fewer checkpoints.
+    fund_history_full_versions: int = config('FUND_HISTORY_FULL_VERSIONS', default=200, cast=int)
+
+    # Whether the shared client talks to a Redis Cluster.
+    is_cluster: bool = config('REDIS_CLUSTER', default=False, cast=bool)
+
+    # How keys are laid out: KEY_LAYOUT_LEGACY keeps each field of every user/fund in one global hash,
+    # KEY_LAYOUT_ENTITY keeps each user's/fund's fields in its own hash so the data can shard across a cluster.
+    key_layout: str = config('REDIS_KEY_LAYOUT', default=KEY_LAYOUT_ENTITY if is_cluster else KEY_LAYOUT_LEGACY,
+                             cast=str)
+
+    @classmethod
+    def _get_client(cls) -> Union[Redis, RedisCluster]:
         """
-        Returns false if there was a problem initializing the connection.
+        Returns the client for the current process, creating it if needed.
+        """
+        pid = os.getpid()
+        if cls._client is None or cls._client_pid != pid:
+            with cls._client_lock:
+                if cls._client is None or cls._client_pid != pid:
+                    connection_kwargs = {
+                        'host':                   config('REDIS_IP', cast=str),
+                        'port':                   config('REDIS_PORT', cast=int),
+                        'max_connections':        config('REDIS_MAX_CONNECTIONS', default=50, cast=int),
+                        'socket_timeout':         config('REDIS_SOCKET_TIMEOUT', default=5, cast=float),
+                        'socket_connect_timeout': config('REDIS_SOCKET_CONNECT_TIMEOUT', default=2, cast=float),
+                        'socket_keepalive':       True,
+                        'health_check_interval':  config('REDIS_HEALTH_CHECK_INTERVAL', default=30, cast=int),
+                    }
+                    pool_timeout = config('REDIS_POOL_TIMEOUT', default=5, cast=float)
+                    sentinels = cls._parse_endpoints(config('REDIS_SENTINELS', default='', cast=str))
+                    replicas = cls._parse_endpoints(config('REDIS_REPLICAS', default='', cast=str))
+                    cls._replicas = []
+                    cls._replica_freshness = {}
+                    if cls.is_cluster:
+                        if cls.key_layout != KEY_LAYOUT_ENTITY:
+                            raise ValueError(f'REDIS_CLUSTER requires REDIS_KEY_LAYOUT={KEY_LAYOUT_ENTITY}')
+                        cls._client = RedisCluster(**connection_kwargs)
+                    elif len(sentinels) != 0:
+                        # ...discover the primary and replicas through Redis Sentinel.
+                        del connection_kwargs['host'], connection_kwargs['port']
+                        sentinel = Sentinel(sentinels,
+                                            socket_timeout=connection_kwargs['socket_timeout'],
+                                            socket_connect_timeout=connection_kwargs['socket_connect_timeout'])
+                        sentinel_master = config('REDIS_SENTINEL_MASTER', default='mymaster', cast=str)
+                        cls._client = sentinel.master_for(sentinel_master, **connection_kwargs)
+                        cls._replicas = [sentinel.slave_for(sentinel_master, **connection_kwargs)]
+                    else:
+                        cls._client = Redis(connection_pool=BlockingConnectionPool(timeout=pool_timeout,
+                                                                                   **connection_kwargs))
+                        for host, port in replicas:
+                            replica_kwargs = dict(connection_kwargs, host=host, port=port)
+                            cls._replicas.append(Redis(connection_pool=BlockingConnectionPool(timeout=pool_timeout,
+                                                                                              **replica_kwargs)))
+                    cls._client_pid = pid
+                    cls._shared = None
+                    cls._start_invalidation_listener()
+        return cls._client
+
+    @classmethod
+    def wait_until_ready(cls,
+                         timeout_sec: float = 60) -> bool:
+        """
+        Blocks until Redis has finished loading its data from disk.
+        Returns False if Redis is unreachable or still loading after the timeout.
         """
         try:
-            self.client = Redis(host=config('REDIS_IP', cast=str),
-                                port=config('REDIS_PORT', cast=int))
+            client = cls._get_client()
             db_loaded = False
             load_start_time = pytime.monotonic()
-            while not db_loaded and pytime.monotonic() - load_start_time < 60:
+            while not db_loaded and pytime.monotonic() - load_start_time < timeout_sec:
                 try:
-                    self.client.ping()
+                    client.ping()
                     db_loaded = True
                 except BusyLoadingError as ex:
                     pytime.sleep(0.5)
@@ -37,8 +505,53 @@ class RedisManager:
             traceback.print_exc()
             print('ERROR: Could not initialize connection to Redis database. Fatal connection error')
             return False
+        cls._ready = True
         return True
 
+    @classmethod
+    def shared(cls,
+               requester_email: Optional[str] = None) -> Optional['RedisManager']:
+        """
+        Returns the connected manager of the current process,
+            or None if Redis could not be reached.
+        If the requester just wrote to Redis (through any process), the returned manager reads from the primary
+            only, so the requester sees its own writes.
+        """
+        manager = cls._shared
+        if manager is None or cls._client_pid != os.getpid():
+            manager = RedisManager()
+            if not manager.connect():
+                return None
+            cls._shared = manager
+        if requester_email is not None and len(cls._replicas) != 0 and manager._is_pinned_to_primary(requester_email):
+            primary_manager = copy.copy(manager)
+            primary_manager.use_replicas = False
+            return primary_manager
+        return manager
+
+    def connect(self) -> bool:
+        """
+        Binds this manager to the process-wide client.
+        Returns false if there was a problem initializing the connection.
+        """
+        try:
+            self.client = self._get_client()
+            self.save_fund_script = self.client.register_script(SAVE_FUND_SCRIPT)
+            self.compare_and_set_field_script = self.client.register_script(COMPARE_AND_SET_FIELD_SCRIPT)
+            self.set_portfolio_script = self.client.register_script(SET_PORTFOLIO_SCRIPT)
+            self.patch_fund_script = self.client.register_script(PATCH_FUND_SCRIPT)
+            self.record_fund_version_script = self.client.register_script(RECORD_FUND_VERSION_SCRIPT)
+            self.update_token_indexes_script = self.client.register_script(UPDATE_TOKEN_INDEXES_SCRIPT)
+            self.update_fund_vector_script = self.client.register_script(UPDATE_FUND_VECTOR_SCRIPT)
+            self.convert_user_fund_ids_script = self.client.register_script(CONVERT_USER_FUND_IDS_SCRIPT)
+            self.release_lock_script = self.client.register_script(RELEASE_LOCK_SCRIPT)
+            self.add_nav_snapshot_script = self.client.register_script(ADD_NAV_SNAPSHOT_SCRIPT)
+        except Exception as e:
+            traceback.print_exc()
+            print('ERROR: Could not initialize connection to Redis database. Fatal connection error')
+            return False
+        return RedisManager._ready or RedisManager.wait_until_ready()
+
     def save_new_user(self,
                       user_email: str,
                       user_name: str) -> None:
@@ -46,22 +559,68 @@ class RedisManager:
         Saves the new user's email with his name in the Redis database.
         """
         try:
-            self.client.hset('user_name', user_email, user_name if len(user_name) != 0 else user_email)
+            pipe = self._pipeline(transaction=False)
+            pipe.hset(*self._user_field(user_email, 'name'), user_name if len(user_name) != 0 else user_email)
+            self._execute_and_invalidate(pipe, [self.user_key(user_email)])
         except Exception as e:
             print(f'Error saving new user in Redis: {traceback.format_exc()}')
 
+    def save_new_users(self,
+                       user_names: Dict[str, str]) -> bool:
+        """
+        Saves the name of each new user (by email) in a single round trip: one HSET per hash holding names,
+            so a single HSET in the legacy key layout.
+        Returns True if every name was written successfully.
+        """
+        if len(user_names) == 0:
+            return True
+        try:
+            names_by_key = {}
+            for user_email, user_name in user_names.items():
+                key, field = self._user_field(user_email, 'name')
+                names_by_key.setdefault(key, {})[field] = user_name if len(user_name) != 0 else user_email
+            pipe = self._pipeline(transaction=False)
+            for key, names in names_by_key.items():
+                pipe.hset(key, mapping=names)
+            self._execute_and_invalidate(pipe, [self.user_key(user_email) for user_email in user_names.keys()])
+            return True
+        except Exception as e:
+            print(f'Error saving {len(user_names)} new users in Redis: {traceback.format_exc()}')
+            return False
+
     def get_user_name(self,
                       user_email: str) -> Optional[str]:
         """
         Returns the user's name, or None if no such user exists.
         """
         try:
-            user_name = self.client.hget('user_name', user_email)
-            return None if user_name is None or len(user_name) == 0 else user_name.decode('utf-8')
+            return self._decode_str(self._reader().hget(*self._user_field(user_email, 'name')))
         except Exception as e:
             print(f'Error getting user name for "{user_email}" from Redis: {traceback.format_exc()}')
             return None
 
+    def get_user_names(self,
+                       user_emails: List[str]) -> Optional[List[Optional[str]]]:
+        """
+        Returns the name of each user (None for users that don't exist), in the same order as the emails,
+            in a single round trip: one HMGET in the legacy key layout, one HGET per user otherwise.
+        Returns None if the names couldn't be read.
+        """
+        if len(user_emails) == 0:
+            return []
+        try:
+            if self.key_layout == KEY_LAYOUT_LEGACY:
+                user_names = self._reader().hmget(LEGACY_USER_HASHES['name'], user_emails)
+            else:
+                pipe = self._reader().pipeline(transaction=False)
+                for user_email in user_emails:
+                    pipe.hget(*self._user_field(user_email, 'name'))
+                user_names = pipe.execute()
+            return [self._decode_str(user_name) for user_name in user_names]
+        except Exception as e:
+            print(f'Error getting {len(user_emails)} user names from Redis: {traceback.format_exc()}')
+            return None
+
     def get_user_fund_ids(self,
                           user_email: str) -> List[str]:
         """
@@ -69,12 +628,24 @@ class RedisManager:
             or None if no such user exists.
         """
         try:
-            user_fund_ids_str = self.client.hget('user_fund_ids', user_email)
-            return user_fund_ids_str.decode('utf-8').split(',')
+            return self._decode_set(self._reader().zrange(self.user_fund_ids_key(user_email), 0, -1))
         except Exception as e:
             print(f'Error getting user fund ids for "{user_email}" from Redis: {traceback.format_exc()}')
             return []
 
+    def get_user_fund_ids_page(self,
+                               user_email: str,
+                               after_fund_id: Optional[str],
+                               count: int) -> List[str]:
+        """
+        Returns the ids of up to count of the user's funds, in order of id, starting after after_fund_id (or from
+            the first fund, if it is None).
+        """
+        fund_ids = self._reader().zrangebylex(self.user_fund_ids_key(user_email),
+                                              '-' if after_fund_id is None else f'({after_fund_id}', '+',
+                                              start=0, num=count)
+        return [fund_id.decode('utf-8') for fund_id in fund_ids]
+
     def set_user_fund_ids(self,
                           user_email: str,
                           fund_ids: List[str]) -> bool:
@@ -82,7 +653,12 @@ class RedisManager:
         Returns True if the funds list was updated successfully.
         """
         try:
-            self.client.hset('user_fund_ids', user_email, ','.join(fund_ids))
+            key = self.user_fund_ids_key(user_email)
+            pipe = self._pipeline(transaction=True)
+            pipe.delete(key)
+            if len(fund_ids) != 0:
+                pipe.zadd(key, {fund_id: 0 for fund_id in fund_ids})
+            self._execute_and_invalidate(pipe, [self.user_key(user_email)])
             return True
         except Exception as e:
             print(f'Error setting user fund ids for "{user_email}" from Redis: {traceback.format_exc()}')
@@ -94,8 +670,7 @@ class RedisManager:
         Returns the email of the fund's manager, or None.
         """
         try:
-            fund_manager_email = self.client.hget('fund_manager_email', fund_id)
-            return None if fund_manager_email is None or len(fund_manager_email) == 0 else str(fund_manager_email.decode('utf-8'))
+            return self._decode_str(self._reader().hget(*self._fund_field(fund_id, 'manager_email')))
         except Exception as e:
             print(f'Error getting fund manager for "{fund_id}" from Redis: {traceback.format_exc()}')
             return None
@@ -107,7 +682,9 @@ class RedisManager:
         Returns True if the fund's manager was updated successfully.
         """
         try:
-            self.client.hset('fund_manager_email', fund_id, manager_email)
+            pipe = self._pipeline(transaction=False)
+            pipe.hset(*self._fund_field(fund_id, 'manager_email'), manager_email)
+            self._execute_and_invalidate(pipe, [self.fund_key(fund_id)])
             return True
         except Exception as e:
             print(f'Error setting fund manager for "{fund_id}" from Redis: {traceback.format_exc()}')
@@ -119,8 +696,7 @@ class RedisManager:
         Returns the emails of the fund's investors, or an empty list.
         """
         try:
-            fund_investors_str = self.client.hget('fund_investor_emails', fund_id)
-            return str(fund_investors_str.decode('utf-8')).split(',')
+            return self._decode_set(self._reader().smembers(self.fund_investor_emails_key(fund_id)))
         except Exception as e:
             print(f'Error getting fund investors for "{fund_id}" from Redis: {traceback.format_exc()}')
             return []
@@ -129,26 +705,77 @@ class RedisManager:
                           fund_id: str,
                           investor_emails: List[str]) -> bool:
         """
-        Returns True if the fund's investors list was updated successfully.
+        Returns True if the fund's investors list (and each investor's fund ids) was updated successfully.
         """
         try:
-            self.client.hset('fund_investor_emails', fund_id, ','.join([email.replace(',', '') for email in
-                                                                        investor_emails]))
+            key = self.fund_investor_emails_key(fund_id)
+            previous_investor_emails = self._decode_set(self.client.smembers(key))
+            pipe = self._pipeline(transaction=True)
+            pipe.delete(key)
+            if len(investor_emails) != 0:
+                pipe.sadd(key, *investor_emails)
+            self._update_investor_fund_ids(pipe, fund_id, previous_investor_emails, investor_emails)
+            self._execute_and_invalidate(pipe, [self.fund_key(fund_id)] +
+                                         [self.user_key(email) for email in
+                                          set(previous_investor_emails).union(investor_emails)])
             return True
         except Exception as e:
             print(f'Error setting fund investors list for "{fund_id}" from Redis: {traceback.format_exc()}')
             return False
 
+    def add_fund_investor(self,
+                          fund_id: str,
+                          investor_email: str) -> bool:
+        """
+        Returns True if the investor was added to the fund successfully.
+        """
+        try:
+            pipe = self._pipeline(transaction=True)
+            pipe.sadd(self.fund_investor_emails_key(fund_id), investor_email)
+            pipe.zadd(self.user_fund_ids_key(investor_email), {fund_id: 0})
+            self._execute_and_invalidate(pipe, [self.fund_key(fund_id), self.user_key(investor_email)])
+            return True
+        except Exception as e:
+            print(f'Error adding investor "{investor_email}" to fund "{fund_id}" in Redis: {traceback.format_exc()}')
+            return False
+
+    def remove_fund_investor(self,
+                             fund_id: str,
+                             investor_email: str) -> bool:
+        """
+        Returns True if the investor was removed from the fund successfully.
+        """
+        try:
+            pipe = self._pipeline(transaction=True)
+            pipe.srem(self.fund_investor_emails_key(fund_id), investor_email)
+            pipe.zrem(self.user_fund_ids_key(investor_email), fund_id)
+            self._execute_and_invalidate(pipe, [self.fund_key(fund_id), self.user_key(investor_email)])
+            return True
+        except Exception as e:
+            print(f'Error removing investor "{investor_email}" from fund "{fund_id}" in Redis: '
+                  f'{traceback.format_exc()}')
+            return False
+
+    def is_fund_investor(self,
+                         fund_id: str,
+                         investor_email: str) -> bool:
+        """
+        Returns True if the email belongs to one of the fund's investors.
+        """
+        try:
+            return bool(self._reader().sismember(self.fund_investor_emails_key(fund_id), investor_email))
+        except Exception as e:
+            print(f'Error checking investor "{investor_email}" of fund "{fund_id}" in Redis: '
+                  f'{traceback.format_exc()}')
+            return False
+
     def get_fund_portfolio(self,
                                  fund_id: str) -> Optional[FundPortfolio]:
         """
         Returns a FundPortfolio wrapper for the fund's holdings, or None.
         """
         try:
-            fund_portfolio_str = self.client.hget('fund_portfolio', fund_id)
-            if fund_portfolio_str is None or len(fund_portfolio_str) == 0:
-                return None
-            return FundPortfolio.from_str(fund_portfolio_str.decode('utf-8'))
+            return self._decode_portfolio(self._reader().hget(*self._fund_field(fund_id, 'portfolio')))
         except Exception as e:
             print(f'Error getting fund portfolio for "{fund_id}" from Redis: {traceback.format_exc()}')
             return None
@@ -160,8 +787,1306 @@ class RedisManager:
         Returns True if the fund's portfolio was updated successfully.
         """
         try:
-            self.client.hset('fund_portfolio', fund_id, str(portfolio))
-            return True
+            portfolio_key, portfolio_field = self._fund_field(fund_id, 'portfolio')
+            version_key, version_field = self._fund_field(fund_id, 'version')
+            previous_portfolio, version = self.set_portfolio_script(keys=[portfolio_key, version_key],
+                                                                    args=[portfolio_field, version_field,
+                                                                          self._encode_portfolio(portfolio)])
         except Exception as e:
             print(f'Error setting fund portfolio for "{fund_id}" from Redis: {traceback.format_exc()}')
-            return False
\ No newline at end of file
+            return False
+        try:
+            previous_portfolio = self._decode_portfolio(previous_portfolio)
+            pipe = self._pipeline(transaction=False)
+            self._update_portfolio_indexes(pipe, fund_id, version, previous_portfolio, portfolio)
+            self._record_fund_version(pipe, fund_id, version, previous_portfolio, portfolio)
+            self._execute_and_invalidate(pipe, [self.fund_key(fund_id)])
+        except Exception as e:
+            self._on_derived_writes_error(f'fund "{fund_id}"', [self.fund_key(fund_id)])
+        return True
+
+    def reencode_portfolios(self,
+                            fund_ids: List[str]) -> int:
+        """
+        Rewrites the funds' portfolios that aren't stored in the configured portfolio encoding.
+        Portfolios modified while they are being re-encoded are left as they are.
+        Returns the number of portfolios that were rewritten.
+        """
+        pipe = self._pipeline(transaction=False)
+        for fund_id in fund_ids:
+            pipe.hget(*self._fund_field(fund_id, 'portfolio'))
+        stored_portfolios = pipe.execute()
+        num_reencoded = 0
+        for fund_id, stored_portfolio in zip(fund_ids, stored_portfolios):
+            portfolio = self._decode_portfolio(stored_portfolio)
+            if portfolio is None:
+                continue
+            reencoded_portfolio = self._encode_portfolio(portfolio)
+            if isinstance(reencoded_portfolio, str):
+                reencoded_portfolio = reencoded_portfolio.encode('utf-8')
+            if reencoded_portfolio == stored_portfolio:
+                continue
+            portfolio_key, portfolio_field = self._fund_field(fund_id, 'portfolio')
+            num_reencoded += self.compare_and_set_field_script(keys=[portfolio_key],
+                                                               args=[portfolio_field,
+                                                                     stored_portfolio,
+                                                                     reencoded_portfolio])
+        return num_reencoded
+
+    def save_fund(self,
+                  fund_id: str,
+                  manager_email: str,
+                  investor_emails: List[str],
+                  portfolio: FundPortfolio) -> FundWriteResult:
+        """
+        Atomically claims the fund for the manager and writes all of its data in one round trip.
+        Nothing is written if the fund is already managed by another user.
+        """
+        return self.save_funds([(fund_id, manager_email, investor_emails, portfolio)])[0]
+
+    def save_funds(self,
+                   funds: List[Tuple[str, str, List[str], FundPortfolio]]) -> List[FundWriteResult]:
+        """
+        Saves each (fund id, manager email, investor emails, portfolio) like save_fund(), in the same order,
+            in two round trips for the whole batch: one writing the funds (each atomically), and one updating
+            the indexes derived from the funds which were written. In a cluster, each fund is written in its
+            own round trip, since scripts can't be pipelined there.
+        """
+        if len(funds) == 0:
+            return []
+        try:
+            # In a cluster, each script runs at once and returns its result (see _script_client()).
+            pipe = self._pipeline(transaction=False)
+            saves = []
+            for fund_id, manager_email, investor_emails, portfolio in funds:
+                manager_email_key, manager_email_field = self._fund_field(fund_id, 'manager_email')
+                portfolio_key, portfolio_field = self._fund_field(fund_id, 'portfolio')
+                version_key, version_field = self._fund_field(fund_id, 'version')
+                saves.append(self.save_fund_script(keys=[manager_email_key, portfolio_key, version_key,
+                                                         self.fund_investor_emails_key(fund_id)],
+                                                   args=[manager_email_field, portfolio_field, version_field,
+                                                         manager_email, self._encode_portfolio(portfolio)]
+                                                   + investor_emails,
+                                                   client=self._script_client(pipe)))
+            if not self.is_cluster:
+                saves = pipe.execute()
+        except Exception as e:
+            print(f'Error saving {len(funds)} funds in Redis: {traceback.format_exc()}')
+            return [FundWriteResult(saved=False) for _ in funds]
+        results = [FundWriteResult(saved=True, version=version) if saved == 1 else
+                   FundWriteResult(saved=False, conflicting_manager_email=self._decode_str(existing_manager))
+                   for saved, existing_manager, _, _, version in saves]
+
+        # Update the reverse (user -> funds) index, which lives under each user's own key,
+        # and the per-token indexes, which live under each token's own key.
+        # The funds are written by now, so a failure here is reported without failing their writes.
+        entity_keys = []
+        writer_emails = set()
+        try:
+            pipe = self._pipeline(transaction=False)
+            for (fund_id, manager_email, investor_emails, portfolio), save in zip(funds, saves):
+                saved, _, previous_investor_emails, previous_portfolio, version = save
+                if saved != 1:
+                    continue
+                previous_investor_emails = self._decode_set(previous_investor_emails)
+                member_emails = [manager_email] + investor_emails
+                entity_keys.append(self.fund_key(fund_id))
+                entity_keys.extend(self.user_key(email) for email in
+                                   set(previous_investor_emails).union(member_emails))
+                writer_emails.add(manager_email)
+                previous_portfolio = self._decode_portfolio(previous_portfolio)
+                self._update_investor_fund_ids(pipe, fund_id, previous_investor_emails, member_emails)
+                self._update_portfolio_indexes(pipe, fund_id, version, previous_portfolio, portfolio)
+                self._record_fund_version(pipe, fund_id, version, previous_portfolio, portfolio)
+                pipe.zadd(FUND_IDS_INDEX, {fund_id: 0})
+            if len(entity_keys) != 0:
+                self._execute_and_invalidate(pipe, entity_keys)
+        except Exception as e:
+            self._on_derived_writes_error(f'{sum(result.saved for result in results)} saved funds', entity_keys)
+        if len(writer_emails) != 0:
+            self._after_write(*writer_emails)
+        return results
+
+    def patch_fund(self,
+                   fund_id: str,
+                   patch: FundPatch,
+                   manager_email: Optional[str] = None,
+                   max_attempts: int = 5) -> FundWriteResult:
+        """
+        Applies the patch to the fund atomically, without rewriting the parts of the fund it leaves unchanged.
+        The portfolio is read, patched and written back only if no other write happened in between: a patch
+            with an expected version is refused (as stale) if the fund is at any other version, and a patch without
+            one is re-applied to the latest portfolio, up to max_attempts times.
+        Nothing is written unless the fund is managed by manager_email (or by anyone, if it is None).
+        Raises ValueError if the patch doesn't apply to the fund's portfolio.
+        """
+        manager_email_key, manager_email_field = self._fund_field(fund_id, 'manager_email')
+        portfolio_key, portfolio_field = self._fund_field(fund_id, 'portfolio')
+        version_key, version_field = self._fund_field(fund_id, 'version')
+        try:
+            for _ in range(max_attempts):
+                # Read the portfolio and version atomically, since the version vouches for the portfolio.
+                if portfolio_key == version_key:
+                    stored_portfolio, version = self.client.hmget(portfolio_key, [portfolio_field, version_field])
+                else:
+                    pipe = self._pipeline(transaction=True)
+                    pipe.hget(portfolio_key, portfolio_field)
+                    pipe.hget(version_key, version_field)
+                    stored_portfolio, version = pipe.execute()
+                version = 0 if version is None else int(version)
+                if patch.version is not None and patch.version != version:
+                    return FundWriteResult(saved=False,
+                                           version=version,
+                                           is_stale=True)
+                previous_portfolio = self._decode_portfolio(stored_portfolio) or FundPortfolio(tokens=[])
+                portfolio, changed_tokens, removed_tokens = patch.apply(previous_portfolio)
+                changes_portfolio = len(changed_tokens) != 0 or len(removed_tokens) != 0
+                applied, version, existing_manager, added_emails, removed_emails = self.patch_fund_script(
+                    keys=[manager_email_key, portfolio_key, version_key, self.fund_investor_emails_key(fund_id)],
+                    args=[manager_email_field, portfolio_field, version_field, manager_email or '', version,
+                          self._encode_portfolio(portfolio) if changes_portfolio else '',
+                          len(patch.add_investor_emails)]
+                    + patch.add_investor_emails + patch.remove_investor_emails)
+                if applied == 0:
+                    return FundWriteResult(saved=False,
+                                           conflicting_manager_email=self._decode_str(existing_manager) or None,
+                                           is_missing=len(existing_manager) == 0)
+                if applied == 2:
+                    if patch.version is not None:
+                        return FundWriteResult(saved=False,
+                                               version=version,
+                                               is_stale=True)
+                    continue
+
+                # Update the indexes derived from the parts of the fund that changed.
+                # The patch is written by now, so a failure here is reported without failing the patch.
+                added_emails = [self._decode_str(email) for email in added_emails]
+                removed_emails = [self._decode_str(email) for email in removed_emails]
+                entity_keys = [self.fund_key(fund_id)] + [self.user_key(email) for email in
+                                                          added_emails + removed_emails]
+                try:
+                    pipe = self._pipeline(transaction=False)
+                    self._update_investor_fund_ids(pipe, fund_id, removed_emails, added_emails)
+                    if changes_portfolio:
+                        self._update_portfolio_indexes(pipe, fund_id, version, previous_portfolio, portfolio)
+                    self._record_fund_version(pipe, fund_id, version, previous_portfolio,
+                                              portfolio if changes_portfolio else previous_portfolio)
+                    self._execute_and_invalidate(pipe, entity_keys)
+                except Exception as e:
+                    self._on_derived_writes_error(f'fund "{fund_id}"', entity_keys)
+                self._after_write(self._decode_str(existing_manager))
+                return FundWriteResult(saved=True,
+                                       version=version,
+                                       changes={'tokens':                  changed_tokens,
+                                                'removed_tokens':          removed_tokens,
+                                                'added_investor_emails':   added_emails,
+                                                'removed_investor_emails': removed_emails})
+            return FundWriteResult(saved=False,
+                                   is_stale=True)
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f'Error patching fund "{fund_id}" in Redis: {traceback.format_exc()}')
+            return FundWriteResult(saved=False)
+
+    def get_token_version(self,
+                          user_email: str) -> Optional[int]:
+        """
+        Returns the version which the user's access tokens must carry (0 until their tokens are first revoked),
+            or None if it couldn't be read.
+        Always read from the primary, since a stale version would accept revoked tokens.
+        """
+        try:
+            token_version = self.client.hget(*self._user_field(user_email, 'token_version'))
+            return 0 if token_version is None else int(token_version)
+        except Exception as e:
+            print(f'Error getting token version of "{user_email}" from Redis: {traceback.format_exc()}')
+            return None
+
+    def revoke_user_tokens(self,
+                           user_email: str) -> Optional[int]:
+        """
+        Bumps the user's token version, so that every access token issued to the user until now is refused,
+            and returns the new version (or None if it couldn't be written).
+        """
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hincrby(*self._user_field(user_email, 'token_version'), 1)
+            return self._execute_and_invalidate(pipe, [self.user_key(user_email)])[0]
+        except Exception as e:
+            print(f'Error revoking tokens of "{user_email}" in Redis: {traceback.format_exc()}')
+            return None
+
+    def get_user_profile(self,
+                         user_email: str) -> Tuple[Optional[str], List[str]]:
+        """
+        Returns the user's name and fund ids, loaded in a single round trip.
+        The name is None if no such user exists.
+        """
+        try:
+            pipe = self._reader().pipeline(transaction=False)
+            pipe.hget(*self._user_field(user_email, 'name'))
+            pipe.zrange(self.user_fund_ids_key(user_email), 0, -1)
+            user_name, user_fund_ids = pipe.execute()
+            return self._decode_str(user_name), self._decode_set(user_fund_ids)
+        except Exception as e:
+            print(f'Error getting user profile for "{user_email}" from Redis: {traceback.format_exc()}')
+            return None, []
+
+    def get_user_profiles(self,
+                          user_emails: List[str]) -> List[Tuple[Optional[str], List[str]]]:
+        """
+        Returns the name and fund ids of each user, in the same order as the emails, in a single round trip.
+        The name is None for users that don't exist.
+        """
+        if len(user_emails) == 0:
+            return []
+        try:
+            pipe = self._reader().pipeline(transaction=False)
+            for user_email in user_emails:
+                pipe.hget(*self._user_field(user_email, 'name'))
+                pipe.zrange(self.user_fund_ids_key(user_email), 0, -1)
+            results = pipe.execute()
+            return [(self._decode_str(user_name), self._decode_set(user_fund_ids))
+                    for user_name, user_fund_ids in zip(results[0::2], results[1::2])]
+        except Exception as e:
+            print(f'Error getting {len(user_emails)} user profiles from Redis: {traceback.format_exc()}')
+            return [(None, []) for _ in user_emails]
+
+    def get_fund(self,
+                 fund_id: str) -> Tuple[Optional[str], List[str], Optional[FundPortfolio]]:
+        """
+        Returns the fund's manager email, investor emails and portfolio, loaded in a single round trip.
+        The manager email is None if no such fund exists.
+        """
+        funds = self.get_funds([fund_id])
+        return funds[0] if len(funds) != 0 else (None, [], None)
+
+    def get_funds(self,
+                  fund_ids: List[str],
+                  batch_size: int = 500) -> List[Tuple[Optional[str], List[str], Optional[FundPortfolio]]]:
+        """
+        Returns the manager email, investor emails and portfolio of each fund, in the same order as the ids.
+        Every fund is loaded in the same round trip: the legacy key layout uses one HMGET per global hash
+            for each batch of ids, while the entity key layout uses one HMGET per fund.
+        """
+        if len(fund_ids) == 0:
+            return []
+        try:
+            pipe = self._reader().pipeline(transaction=False)
+            manager_emails = []
+            portfolio_strs = []
+            if self.key_layout == KEY_LAYOUT_LEGACY:
+                for batch_start in range(0, len(fund_ids), batch_size):
+                    batch = fund_ids[batch_start:batch_start + batch_size]
+                    pipe.hmget(LEGACY_FUND_HASHES['manager_email'], batch)
+                    pipe.hmget(LEGACY_FUND_HASHES['portfolio'], batch)
+                for fund_id in fund_ids:
+                    pipe.smembers(self.fund_investor_emails_key(fund_id))
+                results = pipe.execute()
+                num_batches = len(results) - len(fund_ids)
+                for batch_idx in range(0, num_batches, 2):
+                    manager_emails.extend(results[batch_idx])
+                    portfolio_strs.extend(results[batch_idx + 1])
+                investor_emails_sets = results[num_batches:]
+            else:
+                for fund_id in fund_ids:
+                    pipe.hmget(self.fund_key(fund_id), ['manager_email', 'portfolio'])
+                    pipe.smembers(self.fund_investor_emails_key(fund_id))
+                results = pipe.execute()
+                for manager_email, portfolio_str in results[0::2]:
+                    manager_emails.append(manager_email)
+                    portfolio_strs.append(portfolio_str)
+                investor_emails_sets = results[1::2]
+            return [(self._decode_str(manager_email),
+                     self._decode_set(investor_emails),
+                     self._decode_portfolio(portfolio_str))
+                    for manager_email, investor_emails, portfolio_str in zip(manager_emails,
+                                                                             investor_emails_sets,
+                                                                             portfolio_strs)]
+        except Exception as e:
+            print(f'Error getting {len(fund_ids)} funds from Redis: {traceback.format_exc()}')
+            return [(None, [], None) for _ in fund_ids]
+
+    def get_fund_ids_page(self,
+                          after_fund_id: Optional[str],
+                          count: int) -> List[str]:
+        """
+        Returns the ids of up to count funds, in order of id, starting after after_fund_id (or from the first
+            fund, if it is None).
+        """
+        fund_ids = self._reader().zrangebylex(FUND_IDS_INDEX, '-' if after_fund_id is None else f'({after_fund_id}',
+                                              '+', start=0, num=count)
+        return [fund_id.decode('utf-8') for fund_id in fund_ids]
+
+    def get_fund_summaries(self,
+                           fund_ids: List[str]) -> List[Tuple[Optional[str], int, int]]:
+        """
+        Returns the manager email, number of investors and version of each fund, in the same order as the ids,
+            in a single round trip, without loading the funds' portfolios.
+        The manager email is None if no such fund exists.
+        """
+        if len(fund_ids) == 0:
+            return []
+        pipe = self._reader().pipeline(transaction=False)
+        if self.key_layout == KEY_LAYOUT_LEGACY:
+            pipe.hmget(LEGACY_FUND_HASHES['manager_email'], fund_ids)
+            pipe.hmget(LEGACY_FUND_HASHES['version'], fund_ids)
+        else:
+            for fund_id in fund_ids:
+                pipe.hmget(self.fund_key(fund_id), ['manager_email', 'version'])
+        for fund_id in fund_ids:
+            pipe.scard(self.fund_investor_emails_key(fund_id))
+        results = pipe.execute()
+        if self.key_layout == KEY_LAYOUT_LEGACY:
+            manager_emails, versions = results[0], results[1]
+            num_investors = results[2:]
+        else:
+            manager_emails = [manager_email for manager_email, _ in results[:len(fund_ids)]]
+            versions = [version for _, version in results[:len(fund_ids)]]
+            num_investors = results[len(fund_ids):]
+        return [(self._decode_str(manager_email), int(fund_num_investors), 0 if version is None else int(version))
+                for manager_email, fund_num_investors, version in zip(manager_emails, num_investors, versions)]
+
+    def rebuild_fund_ids_index(self,
+                               batch_size: int = 1000) -> int:
+        """
+        Adds every stored fund to the index of fund ids, and returns the number of funds indexed.
+        save_fund() keeps the index up to date, so this is only needed to create it for existing data.
+        """
+        num_indexed = 0
+        for fund_ids in self.scan_fund_ids(batch_size):
+            if len(fund_ids) != 0:
+                self.client.zadd(FUND_IDS_INDEX, {fund_id: 0 for fund_id in fund_ids})
+                num_indexed += len(fund_ids)
+        return num_indexed
+
+    def convert_user_fund_ids(self,
+                              batch_size: int = 1000) -> int:
+        """
+        Converts every user's fund ids still stored as a set into a sorted set, and returns the number of users
+            converted. Fund ids are written to sorted sets since they could be paged, so this is only needed to
+            convert existing data, right after deploying.
+        """
+        num_converted = 0
+        for keys in self._scan_keys(self.user_fund_ids_key('*'), batch_size, key_type='set'):
+            for key in keys:
+                if self.convert_user_fund_ids_script(keys=[key]) >= 0:
+                    num_converted += 1
+        return num_converted
+
+    def scan_fund_ids(self,
+                      batch_size: int = 1000) -> Iterator[List[str]]:
+        """
+        Yields the ids of every stored fund in batches of roughly batch_size.
+        """
+        if self.key_layout == KEY_LAYOUT_LEGACY:
+            for batch in self.scan_hash(LEGACY_FUND_HASHES['manager_email'], batch_size):
+                yield [fund_id.decode('utf-8') for fund_id in batch.keys()]
+        else:
+            for batch in self._scan_keys(self.fund_key('*'), batch_size):
+                yield [key[len('fund:{'):-len('}')] for key in batch]
+
+    def scan_user_emails(self,
+                         batch_size: int = 1000) -> Iterator[List[str]]:
+        """
+        Yields the emails of every stored user in batches of roughly batch_size.
+        """
+        if self.key_layout == KEY_LAYOUT_LEGACY:
+            for batch in self.scan_hash(LEGACY_USER_HASHES['name'], batch_size):
+                yield [user_email.decode('utf-8') for user_email in batch.keys()]
+        else:
+            for batch in self._scan_keys(self.user_key('*'), batch_size):
+                yield [key[len('user:{'):-len('}')] for key in batch]
+
+    def _scan_keys(self,
+                   pattern: str,
+                   batch_size: int,
+                   key_type: str = 'hash') -> Iterator[List[str]]:
+        """
+        Yields the keys of the type matching the pattern (on every node of a cluster) in batches of batch_size.
+        """
+        batch = []
+        for key in self.client.scan_iter(match=pattern, count=batch_size, _type=key_type):
+            batch.append(key.decode('utf-8'))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if len(batch) != 0:
+            yield batch
+
+    def scan_hash(self,
+                  name: str,
+                  batch_size: int = 1000) -> Iterator[Dict[bytes, bytes]]:
+        """
+        Yields the fields of a hash in batches of roughly batch_size, using HSCAN
+            so that memory stays flat regardless of the size of the hash.
+        """
+        cursor = None
+        while cursor != 0:
+            cursor, batch = self.client.hscan(name, cursor or 0, count=batch_size)
+            if len(batch) != 0:
+                yield batch
+
+    def get_crossed_targets(self,
+                            price_moves: List[Tuple[str, float, float]]) -> List[List[Tuple[str, float]]]:
+        """
+        Returns, for each (token, previous price, price) move, the (fund id, target) pairs whose target it crossed:
+            the buy targets in [price, previous price) if the price fell,
+            or the sell targets in (previous price, price] if it rose.
+        Each lookup is a range query on the token's sorted index, O(log n + k), and all of them share one round trip.
+        Raises if Redis can't be reached, so that no crossing is silently missed.
+        """
+        if len(price_moves) == 0:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for token, previous_price, price in price_moves:
+            if price < previous_price:
+                pipe.zrangebyscore(self.token_buy_targets_key(token), price, f'({previous_price}', withscores=True)
+            else:
+                pipe.zrangebyscore(self.token_sell_targets_key(token), f'({previous_price}', price, withscores=True)
+        return [[(fund_id.decode('utf-8'), target) for fund_id, target in crossed]
+                for crossed in pipe.execute()]
+
+    def add_trigger_events(self,
+                           events: List[Dict],
+                           last_prices: Dict[str, float]) -> bool:
+        """
+        Appends the (flat, json-like) events to the trigger events stream, and records the last price of each token.
+        Returns True if everything was written successfully.
+        """
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for event in events:
+                pipe.xadd(TRIGGER_EVENTS_STREAM, event, maxlen=self.trigger_events_max_len, approximate=True)
+            if len(last_prices) != 0:
+                pipe.hset(TRIGGER_LAST_PRICES_HASH, mapping=last_prices)
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f'Error adding {len(events)} trigger events to Redis: {traceback.format_exc()}')
+            return False
+
+    def get_trigger_last_prices(self) -> Dict[str, float]:
+        """
+        Returns the last price recorded by the trigger engine for each token.
+        """
+        try:
+            return {token.decode('utf-8'): float(price)
+                    for token, price in self.client.hgetall(TRIGGER_LAST_PRICES_HASH).items()}
+        except Exception as e:
+            print(f'Error getting trigger last prices from Redis: {traceback.format_exc()}')
+            return {}
+
+    def rebuild_token_indexes(self,
+                              batch_size: int = 1000) -> int:
+        """
+        Rebuilds every token's fund index and buy/sell target indexes, and every fund's vector norm and total,
+            from the stored portfolios, and returns the number of funds indexed.
+        save_fund() keeps the indexes up to date incrementally, so this is only needed to create them for
+            existing data, or to repair them. Run it while funds aren't being saved.
+        """
+        for pattern, key_type in [(self.token_funds_key('*'), 'zset'),
+                                  (self.token_buy_targets_key('*'), 'zset'),
+                                  (self.token_sell_targets_key('*'), 'zset'),
+                                  (self.token_fund_versions_key('*'), 'hash')]:
+            for keys in self._scan_keys(pattern, batch_size, key_type=key_type):
+                pipe = self.client.pipeline(transaction=False)
+                for key in keys:
+                    pipe.delete(key)
+                pipe.execute()
+        for legacy_hash in LEGACY_FUND_VECTOR_HASHES:
+            self.client.delete(legacy_hash)
+        num_indexed = 0
+        for fund_ids in self.scan_fund_ids(batch_size):
+            pipe = self.client.pipeline(transaction=False)
+            for fund_id, (manager_email, _, portfolio), (_, _, version) in zip(fund_ids,
+                                                                              self.get_funds(fund_ids),
+                                                                              self.get_fund_summaries(fund_ids)):
+                if manager_email is not None and portfolio is not None:
+                    self._update_token_indexes(pipe, fund_id, version, None, portfolio)
+                    self._update_fund_vector(pipe, fund_id, version, None, portfolio)
+                    num_indexed += 1
+            pipe.execute()
+        return num_indexed
+
+    def count_token_funds(self,
+                          pct_ranges: List[Tuple[str, float, float]]) -> List[int]:
+        """
+        Returns, for each (token, min pct, max pct) range, the number of funds holding between min and max
+            portfolio_pct of the token, in a single round trip.
+        """
+        pipe = self._reader().pipeline(transaction=False)
+        for token, min_pct, max_pct in pct_ranges:
+            pipe.zcount(self.token_funds_key(token), min_pct, max_pct)
+        return [int(count) for count in pipe.execute()]
+
+    def get_token_funds(self,
+                        token: str,
+                        min_pct: float,
+                        max_pct: float,
+                        offset: int,
+                        count: int) -> List[Tuple[str, float]]:
+        """
+        Returns up to count (fund id, portfolio_pct) pairs of the funds holding between min_pct and max_pct of
+            the token, from highest to lowest portfolio_pct, skipping the first offset funds.
+        """
+        funds = self._reader().zrevrangebyscore(self.token_funds_key(token), max_pct, min_pct,
+                                                start=offset, num=count, withscores=True)
+        return [(fund_id.decode('utf-8'), pct) for fund_id, pct in funds]
+
+    def get_token_pcts(self,
+                       fund_ids: List[str],
+                       tokens: List[str]) -> List[List[Optional[float]]]:
+        """
+        Returns, for each token, each fund's portfolio_pct in it (or None if the fund doesn't hold it),
+            in a single round trip.
+        """
+        if len(fund_ids) == 0:
+            return [[] for _ in tokens]
+        pipe = self._reader().pipeline(transaction=False)
+        for token in tokens:
+            pipe.zmscore(self.token_funds_key(token), fund_ids)
+        return pipe.execute()
+
+    def get_token_fund_lists(self,
+                             tokens: List[str]) -> List[List[Tuple[str, float]]]:
+        """
+        Returns, for each token, every (fund id, portfolio_pct) pair of the funds holding it, in a single round trip.
+        """
+        if len(tokens) == 0:
+            return []
+        pipe = self._reader().pipeline(transaction=False)
+        for token in tokens:
+            pipe.zrange(self.token_funds_key(token), 0, -1, withscores=True)
+        return [[(fund_id.decode('utf-8'), pct) for fund_id, pct in funds] for funds in pipe.execute()]
+
+    def get_fund_vectors(self,
+                         fund_ids: List[str]) -> Tuple[List[Optional[float]], List[Optional[float]], List[int]]:
+        """
+        Returns the norm, total and version of each fund's portfolio_pct vector (None, None and 0 for funds
+            without a portfolio), in a single round trip.
+        """
+        if len(fund_ids) == 0:
+            return [], [], []
+        pipe = self._reader().pipeline(transaction=False)
+        for fund_id in fund_ids:
+            pipe.hmget(self.fund_key(fund_id), ['vector_norm', 'vector_total', 'vector_version'])
+        vectors = pipe.execute()
+        return ([None if norm is None else float(norm) for norm, _, _ in vectors],
+                [None if total is None else float(total) for _, total, _ in vectors],
+                [0 if version is None else int(version) for _, _, version in vectors])
+
+    def get_similarity_versions(self,
+                                fund_ids: List[str],
+                                tokens: List[str]) -> Tuple[List[int], List[int]]:
+        """
+        Returns the vector version of each fund and of each token (0 for those never changed),
+            in a single round trip.
+        """
+        if len(fund_ids) == 0 and len(tokens) == 0:
+            return [], []
+        pipe = self._reader().pipeline(transaction=False)
+        for fund_id in fund_ids:
+            pipe.hget(self.fund_key(fund_id), 'vector_version')
+        for token in tokens:
+            pipe.get(self.token_vector_version_key(token))
+        versions = [0 if version is None else int(version) for version in pipe.execute()]
+        return versions[:len(fund_ids)], versions[len(fund_ids):]
+
+    def get_fund_version_entries(self,
+                                 fund_id: str,
+                                 max_version: Optional[int],
+                                 count: int) -> List[str]:
+        """
+        Returns up to count entries of the fund's portfolio history (see FundVersion), from the one recording
+            max_version (or the latest version, if it is None) backwards.
+        """
+        entries = self._reader().zrevrangebyscore(self.fund_versions_key(fund_id),
+                                                  '+inf' if max_version is None else max_version, '-inf',
+                                                  start=0, num=count)
+        return [entry.decode('utf-8') for entry in entries]
+
+    def get_similar_funds(self,
+                          fund_id: str,
+                          metric: str) -> Optional[str]:
+        """
+        Returns the cached funds most similar to the fund by the metric (a JSON string),
+            or None if they aren't cached.
+        """
+        try:
+            return self._decode_str(self._reader().get(self.fund_similar_key(fund_id, metric)))
+        except Exception as e:
+            print(f'Error getting similar funds of "{fund_id}" from Redis: {traceback.format_exc()}')
+            return None
+
+    def set_similar_funds(self,
+                          similar_jsons: Dict[str, str],
+                          metric: str,
+                          ttl_sec: float) -> bool:
+        """
+        Caches the funds most similar to each fund by the metric (a JSON string per fund id) for ttl_sec,
+            in a single round trip.
+        Returns True if every fund's similar funds were written successfully.
+        """
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for fund_id, similar_json in similar_jsons.items():
+                pipe.set(self.fund_similar_key(fund_id, metric), similar_json, px=max(1, int(ttl_sec * 1000)))
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f'Error setting similar funds in Redis: {traceback.format_exc()}')
+            return False
+
+    def get_price_quotes(self,
+                         tokens: List[str]) -> List[Optional[str]]:
+        """
+        Returns the cached price quote (a JSON string) of each token, or None for tokens without one,
+            loaded in a single round trip.
+        """
+        if len(tokens) == 0:
+            return []
+        try:
+            pipe = self._reader().pipeline(transaction=False)
+            for token in tokens:
+                pipe.get(self.token_price_key(token))
+            return [self._decode_str(quote) for quote in pipe.execute()]
+        except Exception as e:
+            print(f'Error getting {len(tokens)} price quotes from Redis: {traceback.format_exc()}')
+            return [None for _ in tokens]
+
+    def set_price_quotes(self,
+                         quotes: Dict[str, str],
+                         ttl_sec: float) -> bool:
+        """
+        Caches the price quote (a JSON string) of each token for ttl_sec, in a single round trip.
+        Returns True if the quotes were written successfully.
+        """
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for token, quote in quotes.items():
+                pipe.set(self.token_price_key(token), quote, px=max(1, int(ttl_sec * 1000)))
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f'Error setting {len(quotes)} price quotes in Redis: {traceback.format_exc()}')
+            return False
+
+    def acquire_locks(self,
+                      keys: List[str],
+                      lock_token: str,
+                      ttl_sec: float) -> List[bool]:
+        """
+        Tries to take each lock (which expires after ttl_sec) for the caller identified by lock_token,
+            in a single round trip.
+        Returns whether each lock was taken: False if someone else holds it (or Redis can't be reached).
+        """
+        if len(keys) == 0:
+            return []
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key in keys:
+                pipe.set(key, lock_token, nx=True, px=max(1, int(ttl_sec * 1000)))
+            return [bool(acquired) for acquired in pipe.execute()]
+        except Exception as e:
+            print(f'Error acquiring {len(keys)} locks in Redis: {traceback.format_exc()}')
+            return [False for _ in keys]
+
+    def release_locks(self,
+                      keys: List[str],
+                      lock_token: str) -> None:
+        """
+        Releases the locks which are still held by the caller identified by lock_token.
+        """
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key in keys:
+                self.release_lock_script(keys=[key], args=[lock_token], client=self._script_client(pipe))
+            pipe.execute()
+        except Exception as e:
+            print(f'Error releasing {len(keys)} locks in Redis: {traceback.format_exc()}')
+
+    def add_nav_snapshots(self,
+                          snapshots: List[FundNavSnapshot]) -> bool:
+        """
+        Appends the snapshots to their funds' NAV streams (timestamped by Redis, so their timestamps are ignored)
+            and folds them into every rollup resolution, in a single round trip.
+        Returns True if every snapshot was written successfully.
+        """
+        if len(snapshots) == 0:
+            return True
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for snapshot in snapshots:
+                rollup_args = []
+                for resolution, bucket_sec in NAV_RESOLUTIONS.items():
+                    rollup_args += [int(bucket_sec * 1000), int(self.nav_rollup_retention_sec[resolution] * 1000)]
+                self.add_nav_snapshot_script(
+                    keys=[self.fund_nav_key(snapshot.fund_id)] +
+                         [self.fund_nav_rollup_key(snapshot.fund_id, resolution) for resolution in NAV_RESOLUTIONS],
+                    args=[repr(float(snapshot.nav)),
+                          json.dumps(snapshot.allocations, separators=(',', ':')),
+                          int(self.nav_snapshot_retention_sec * 1000)] + rollup_args,
+                    client=self._script_client(pipe))
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f'Error adding {len(snapshots)} NAV snapshots to Redis: {traceback.format_exc()}')
+            return False
+
+    def get_nav_snapshots(self,
+                          fund_id: str,
+                          start_sec: float,
+                          end_sec: float) -> List[FundNavSnapshot]:
+        """
+        Returns the fund's raw NAV snapshots between the unix times start_sec and end_sec, oldest first.
+        """
+        try:
+            entries = self._reader().xrange(self.fund_nav_key(fund_id),
+                                            min=int(start_sec * 1000),
+                                            max=int(end_sec * 1000))
+            return [FundNavSnapshot(fund_id=fund_id,
+                                    timestamp=int(entry_id.split(b'-')[0]) / 1000,
+                                    nav=float(fields[b'nav']),
+                                    allocations=json.loads(fields[b'allocations']))
+                    for entry_id, fields in entries]
+        except Exception as e:
+            print(f'Error getting NAV snapshots for "{fund_id}" from Redis: {traceback.format_exc()}')
+            return []
+
+    def get_nav_buckets(self,
+                        fund_id: str,
+                        resolution: str,
+                        start_sec: float,
+                        end_sec: float) -> List[NavBucket]:
+        """
+        Returns the fund's NAV rollup buckets of the resolution (a NAV_RESOLUTIONS key) which start between
+            the unix times start_sec and end_sec, oldest first.
+        """
+        try:
+            members = self._reader().zrangebyscore(self.fund_nav_rollup_key(fund_id, resolution),
+                                                   int(start_sec * 1000),
+                                                   int(end_sec * 1000))
+            return [NavBucket.from_member(member.decode('utf-8')) for member in members]
+        except Exception as e:
+            print(f'Error getting {resolution} NAV buckets for "{fund_id}" from Redis: {traceback.format_exc()}')
+            return []
+
+    def set_job(self,
+                job_id: str,
+                job_json: str,
+                ttl_sec: float) -> bool:
+        """
+        Stores the state (a JSON string) of an asynchronous job for ttl_sec.
+        Returns True if the state was written successfully.
+        """
+        try:
+            self.client.set(self.job_key(job_id), job_json, px=max(1, int(ttl_sec * 1000)))
+            return True
+        except Exception as e:
+            print(f'Error setting job "{job_id}" in Redis: {traceback.format_exc()}')
+            return False
+
+    def get_job(self,
+                job_id: str) -> Optional[str]:
+        """
+        Returns the state (a JSON string) of an asynchronous job, or None if there is no such job (or it expired).
+        """
+        try:
+            return self._decode_str(self.client.get(self.job_key(job_id)))
+        except Exception as e:
+            print(f'Error getting job "{job_id}" from Redis: {traceback.format_exc()}')
+            return None
+
+    def get_token_exposures(self) -> Dict[str, Tuple[int, float]]:
+        """
+        Returns the number of funds holding each token, and the sum of their portfolio_pct in it,
+            loaded in a single round trip.
+        """
+        try:
+            pipe = self._reader().pipeline(transaction=False)
+            pipe.hgetall(TOKEN_FUND_COUNTS_HASH)
+            pipe.hgetall(TOKEN_PCT_SUMS_HASH)
+            fund_counts, pct_sums = pipe.execute()
+            return {token.decode('utf-8'): (int(fund_count), float(pct_sums.get(token, 0)))
+                    for token, fund_count in fund_counts.items() if int(fund_count) > 0}
+        except Exception as e:
+            print(f'Error getting token exposures from Redis: {traceback.format_exc()}')
+            return {}
+
+    def recompute_token_exposures(self,
+                                  batch_size: int = 1000) -> int:
+        """
+        Recomputes every token's exposure from the stored portfolios, streamed in batches, and replaces the
+            exposures with the result at once. Returns the number of funds counted.
+        save_fund() and set_fund_portfolio() keep the exposures up to date incrementally, so this is only needed
+            to create them for existing data, or to repair them. Run it while funds aren't being saved.
+        """
+        fund_counts = {}
+        pct_sums = {}
+        num_funds = 0
+        for fund_ids in self.scan_fund_ids(batch_size):
+            for manager_email, _, portfolio in self.get_funds(fund_ids):
+                if manager_email is None or portfolio is None:
+                    continue
+                for token, pct in portfolio.token_pcts().items():
+                    fund_counts[token] = fund_counts.get(token, 0) + 1
+                    pct_sums[token] = pct_sums.get(token, 0) + pct
+                num_funds += 1
+        pipe = self._pipeline(transaction=True)
+        pipe.delete(TOKEN_FUND_COUNTS_HASH, TOKEN_PCT_SUMS_HASH)
+        if len(fund_counts) != 0:
+            pipe.hset(TOKEN_FUND_COUNTS_HASH, mapping=fund_counts)
+            pipe.hset(TOKEN_PCT_SUMS_HASH, mapping=pct_sums)
+        pipe.execute()
+        return num_funds
+
+    def _update_portfolio_indexes(self,
+                                  pipe: Pipeline,
+                                  fund_id: str,
+                                  version: int,
+                                  previous_portfolio: Optional[FundPortfolio],
+                                  portfolio: FundPortfolio) -> None:
+        """
+        Queues the updates that keep every index and aggregate derived from portfolios in line with a change
+            in the fund's portfolio, which made it the given version of the fund.
+        """
+        self._update_token_indexes(pipe, fund_id, version, previous_portfolio, portfolio)
+        self._update_token_exposures(pipe, previous_portfolio, portfolio)
+        self._update_fund_vector(pipe, fund_id, version, previous_portfolio, portfolio)
+
+    def _update_token_indexes(self,
+                              pipe: Pipeline,
+                              fund_id: str,
+                              version: int,
+                              previous_portfolio: Optional[FundPortfolio],
+                              portfolio: FundPortfolio) -> None:
+        """
+        Queues the updates that index the version of the fund under each token it holds (by portfolio_pct and
+            buy/sell target), and remove it from the tokens it no longer holds.
+        Each token's indexes are replaced by the version's entries rather than patched, and only if no newer
+            version was indexed under the token, so that updates of successive saves can land in any order.
+        """
+        previous_tokens = set() if previous_portfolio is None else set(previous_portfolio.token_pcts().keys())
+        pcts = portfolio.token_pcts()
+        targets = {str(token.token): (float(token.buy_target), float(token.sell_target)) for token in portfolio.tokens}
+        for token in sorted(previous_tokens.union(pcts.keys())):
+            buy_target, sell_target = targets.get(token, ('', ''))
+            self.update_token_indexes_script(keys=[self.token_funds_key(token),
+                                                   self.token_buy_targets_key(token),
+                                                   self.token_sell_targets_key(token),
+                                                   self.token_fund_versions_key(token)],
+                                             args=[fund_id, version, pcts.get(token, ''), buy_target, sell_target],
+                                             client=self._script_client(pipe))
+
+    def _update_token_exposures(self,
+                                pipe: Pipeline,
+                                previous_portfolio: Optional[FundPortfolio],
+                                portfolio: FundPortfolio) -> None:
+        """
+        Queues the increments that move each token's exposure from the previous portfolio to the new one.
+        """
+        previous_pcts = {} if previous_portfolio is None else previous_portfolio.token_pcts()
+        pcts = portfolio.token_pcts()
+        for token in set(previous_pcts.keys()).union(pcts.keys()):
+            fund_count_change = int(token in pcts) - int(token in previous_pcts)
+            pct_change = pcts.get(token, 0) - previous_pcts.get(token, 0)
+            if fund_count_change != 0:
+                pipe.hincrby(TOKEN_FUND_COUNTS_HASH, token, fund_count_change)
+            if pct_change != 0:
+                pipe.hincrbyfloat(TOKEN_PCT_SUMS_HASH, token, pct_change)
+
+    def _record_fund_version(self,
+                             pipe: Pipeline,
+                             fund_id: str,
+                             version: int,
+                             previous_portfolio: Optional[FundPortfolio],
+                             portfolio: FundPortfolio) -> None:
+        """
+        Queues the recording of the fund's new version in its portfolio history.
+        """
+        now = pytime.time()
+        checkpoint = FundVersion.checkpoint(version, now, portfolio)
+        delta = None if previous_portfolio is None else FundVersion.delta(version, now, previous_portfolio, portfolio)
+        self.record_fund_version_script(keys=[self.fund_versions_key(fund_id)],
+                                        args=[version,
+                                              (checkpoint if delta is None else delta).to_entry(),
+                                              checkpoint.to_entry(),
+                                              self.fund_history_checkpoint_interval,
+                                              self.fund_history_full_versions],
+                                        client=self._script_client(pipe))
+
+    def _update_fund_vector(self,
+                            pipe: Pipeline,
+                            fund_id: str,
+                            version: int,
+                            previous_portfolio: Optional[FundPortfolio],
+                            portfolio: FundPortfolio) -> None:
+        """
+        Queues the updates that store the norm and total of the fund's portfolio_pct vector (on the fund's hash,
+            with the fund's version), and bump the vector version of every token it holds or held.
+        """
+        token_pcts = portfolio.token_pcts()
+        pcts = token_pcts.values()
+        self.update_fund_vector_script(keys=[self.fund_key(fund_id)],
+                                       args=[version, sum(pct * pct for pct in pcts) ** 0.5, sum(pcts)],
+                                       client=self._script_client(pipe))
+        previous_tokens = set() if previous_portfolio is None else set(previous_portfolio.token_pcts().keys())
+        for token in sorted(previous_tokens.union(token_pcts.keys())):
+            pipe.incr(self.token_vector_version_key(token))
+
+    def _update_investor_fund_ids(self,
+                                  pipe: Pipeline,
+                                  fund_id: str,
+                                  previous_member_emails: List[str],
+                                  member_emails: List[str]) -> None:
+        """
+        Queues the updates that keep each user's fund ids in line with a change in the fund's members.
+        """
+        for email in set(previous_member_emails).difference(member_emails):
+            pipe.zrem(self.user_fund_ids_key(email), fund_id)
+        for email in set(member_emails):
+            pipe.zadd(self.user_fund_ids_key(email), {fund_id: 0})
+
+    def _execute_and_invalidate(self,
+                                pipe: Pipeline,
+                                entity_keys: List[str]) -> List:
+        """
+        Executes the pipeline of writes, then drops the written users/funds (by user_key()/fund_key())
+            from the local caches of every process, through the cache invalidation channel.
+        Returns the results of the queued writes.
+        """
+        pipe.publish(CACHE_INVALIDATION_CHANNEL, '\n'.join(entity_keys))
+        results = pipe.execute()
+        LocalCache.invalidate_everywhere(entity_keys)
+        return results[:-1]
+
+    def _on_derived_writes_error(self,
+                                 description: str,
+                                 entity_keys: List[str]) -> None:
+        """
+        Reports that the indexes and history derived from a committed write couldn't all be updated,
+            and still drops the written users/funds from the local caches of every process.
+        The write itself stands, and the indexes can be repaired with rebuild_token_indexes(),
+            recompute_token_exposures() and rebuild_fund_ids_index().
+        """
+        print(f'Error updating the indexes derived from {description} in Redis: {traceback.format_exc()}')
+        try:
+            self.client.publish(CACHE_INVALIDATION_CHANNEL, '\n'.join(entity_keys))
+        except Exception as e:
+            print(f'Error publishing the invalidation of {len(entity_keys)} keys: {traceback.format_exc()}')
+        LocalCache.invalidate_everywhere(entity_keys)
+
+    @classmethod
+    def _start_invalidation_listener(cls) -> None:
+        """
+        Starts the thread which forwards invalidations published by any process to this process's caches.
+        """
+        listener = threading.Thread(target=cls._listen_for_invalidations,
+                                    args=(cls._client,),
+                                    name='redis-cache-invalidation',
+                                    daemon=True)
+        listener.start()
+
+    @classmethod
+    def _listen_for_invalidations(cls,
+                                  client: Union[Redis, RedisCluster]) -> None:
+        """
+        Forwards invalidations to the local caches until the client is replaced (i.e. after a fork).
+        Clears the caches whenever the subscription is (re)established, since messages may have been missed.
+        """
+        while cls._client is client and cls._client_pid == os.getpid():
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+                LocalCache.clear_everywhere()
+                while cls._client is client:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None and message['type'] == 'message':
+                        LocalCache.invalidate_everywhere(message['data'].decode('utf-8').split('\n'))
+            except Exception as e:
+                print(f'WARNING: Lost the Redis cache invalidation channel, clearing local caches: {e}')
+                LocalCache.clear_everywhere()
+                pytime.sleep(1)
+
+    def _reader(self) -> Redis:
+        """
+        Returns the client to read from: a replica that is caught up with the primary, or else the primary.
+        """
+        if not self.use_replicas or len(self._replicas) == 0:
+            return self.client
+        fresh_replicas = [replica for replica in self._replicas if self._is_replica_fresh(replica)]
+        return self.client if len(fresh_replicas) == 0 else random.choice(fresh_replicas)
+
+    @classmethod
+    def _is_replica_fresh(cls,
+                          replica: Redis) -> bool:
+        """
+        Returns True if the replica was recently seen connected to the primary, and at most replica_max_lag_bytes
+            of the replication stream behind it.
+        The primary's offset is read first, so a replica which is caught up has reached it by the time its own
+            offset is read.
+        """
+        now = pytime.monotonic()
+        checked_at, is_fresh = cls._replica_freshness.get(id(replica), (None, False))
+        if checked_at is not None and now - checked_at < cls.replica_check_interval_sec:
+            return is_fresh
+        try:
+            primary_offset = int(cls._client.info('replication')['master_repl_offset'])
+            replication = replica.info('replication')
+            replica_offset = int(replication.get('slave_repl_offset', -1))
+            is_fresh = (replication.get('master_link_status') == 'up'
+                        and not replication.get('master_sync_in_progress', 0)
+                        and replica_offset >= 0
+                        and primary_offset - replica_offset <= cls.replica_max_lag_bytes)
+        except Exception as e:
+            print(f'WARNING: Could not check Redis replica lag, reading from the primary: {e}')
+            is_fresh = False
+        cls._replica_freshness[id(replica)] = (now, is_fresh)
+        return is_fresh
+
+    def _after_write(self,
+                     *writer_emails: str) -> None:
+        """
+        Gives the writers read-your-writes consistency: optionally waits for replicas to receive the write,
+            and pins the writers' reads to the primary (in every process, through a short-lived key on the primary)
+            until replicas have caught up.
+        """
+        if len(self._replicas) == 0:
+            return
+        try:
+            if self.write_wait_replicas > 0:
+                self.client.wait(self.write_wait_replicas, self.write_wait_timeout_ms)
+            pin_ms = max(1, int(max(self.replica_max_lag_sec, self.replica_check_interval_sec) * 1000))
+            pipe = self.client.pipeline(transaction=False)
+            for writer_email in writer_emails:
+                pipe.set(self.user_primary_pin_key(writer_email), 1, px=pin_ms)
+            pipe.execute()
+        except Exception as e:
+            print(f'WARNING: Could not pin the reads of {len(writer_emails)} writers to the Redis primary: {e}')
+
+    def _is_pinned_to_primary(self,
+                              user_email: str) -> bool:
+        """
+        Returns True if the user's reads must go to the primary, because the user just wrote something
+            (or the pin couldn't be checked).
+        """
+        try:
+            return bool(self.client.exists(self.user_primary_pin_key(user_email)))
+        except Exception as e:
+            print(f'WARNING: Could not check whether "{user_email}" is pinned to the Redis primary: {e}')
+            return True
+
+    @staticmethod
+    def _parse_endpoints(endpoints: str) -> List[Tuple[str, int]]:
+        """
+        Parses a comma-separated list of host:port endpoints.
+        """
+        parsed = []
+        for endpoint in endpoints.split(','):
+            if len(endpoint.strip()) != 0:
+                host, port = endpoint.strip().rsplit(':', 1)
+                parsed.append((host, int(port)))
+        return parsed
+
+    def _pipeline(self,
+                  transaction: bool) -> Pipeline:
+        """
+        Returns a pipeline, which can only be transactional outside of a cluster
+            (where its keys may live on different nodes).
+        """
+        return self.client.pipeline(transaction=transaction and not self.is_cluster)
+
+    def _script_client(self,
+                       pipe: Pipeline) -> Union[Pipeline, Redis, RedisCluster]:
+        """
+        Returns the client on which to run a server-side script belonging to the pipeline: the pipeline itself,
+            except in a cluster, whose pipelines can't load a script onto nodes that haven't cached it.
+        There, the script runs at once on the cluster client (which loads it onto every primary if a node
+            doesn't know it), so its result is returned by the call rather than by the pipeline.
+        """
+        return self.client if self.is_cluster else pipe
+
+    def _user_field(self,
+                    user_email: str,
+                    field: str) -> Tuple[str, str]:
+        """
+        Returns the hash key and hash field which hold the field of the user in the current key layout.
+        """
+        if self.key_layout == KEY_LAYOUT_LEGACY:
+            return LEGACY_USER_HASHES[field], user_email
+        return self.user_key(user_email), field
+
+    def _fund_field(self,
+                    fund_id: str,
+                    field: str) -> Tuple[str, str]:
+        """
+        Returns the hash key and hash field which hold the field of the fund in the current key layout.
+        """
+        if self.key_layout == KEY_LAYOUT_LEGACY:
+            return LEGACY_FUND_HASHES[field], fund_id
+        return self.fund_key(fund_id), field
+
+    @staticmethod
+    def user_key(user_email: str) -> str:
+        """
+        Returns the key of the hash of the user's fields in the entity key layout.
+        The braces are a hash tag: every key of a user is stored in the same cluster slot.
+        """
+        return f'user:{{{user_email}}}'
+
+    @staticmethod
+    def fund_key(fund_id: str) -> str:
+        """
+        Returns the key of the hash of the fund's fields in the entity key layout.
+        The braces are a hash tag: every key of a fund is stored in the same cluster slot.
+        """
+        return f'fund:{{{fund_id}}}'
+
+    @staticmethod
+    def user_fund_ids_key(user_email: str) -> str:
+        """
+        Returns the key of the sorted set (with every score 0, so it is ordered by id) of funds in which the user
+            participates or manages.
+        """
+        return f'{RedisManager.user_key(user_email)}:fund_ids'
+
+    @staticmethod
+    def user_primary_pin_key(user_email: str) -> str:
+        """
+        Returns the key which, while it exists, sends the user's reads to the primary.
+        """
+        return f'{RedisManager.user_key(user_email)}:primary_pin'
+
+    @staticmethod
+    def fund_investor_emails_key(fund_id: str) -> str:
+        """
+        Returns the key of the set of the fund's investor emails.
+        """
+        return f'{RedisManager.fund_key(fund_id)}:investor_emails'
+
+    @staticmethod
+    def fund_nav_key(fund_id: str) -> str:
+        """
+        Returns the key of the stream of the fund's raw NAV snapshots.
+        """
+        return f'{RedisManager.fund_key(fund_id)}:nav'
+
+    @staticmethod
+    def fund_nav_rollup_key(fund_id: str,
+                            resolution: str) -> str:
+        """
+        Returns the key of the sorted set of the fund's NAV rollup buckets at the resolution (i.e. '1h').
+        """
+        return f'{RedisManager.fund_nav_key(fund_id)}:{resolution}'
+
+    @staticmethod
+    def fund_versions_key(fund_id: str) -> str:
+        """
+        Returns the key of the sorted set of the fund's portfolio history entries, scored by version.
+        """
+        return f'{RedisManager.fund_key(fund_id)}:versions'
+
+    @staticmethod
+    def fund_similar_key(fund_id: str,
+                         metric: str) -> str:
+        """
+        Returns the key of the cached funds most similar to the fund by the metric (i.e. 'cosine').
+        """
+        return f'{RedisManager.fund_key(fund_id)}:similar:{metric}'
+
+    @staticmethod
+    def job_key(job_id: str) -> str:
+        """
+        Returns the key of the state of an asynchronous job.
+        """
+        return f'job:{{{job_id}}}'
+
+    @staticmethod
+    def token_key(token: str) -> str:
+        """
+        Returns the prefix of the keys indexing funds by one of the tokens in their portfolio.
+        The braces are a hash tag: every index of a token is stored in the same cluster slot.
+        """
+        return f'token:{{{token}}}'
+
+    @staticmethod
+    def token_funds_key(token: str) -> str:
+        """
+        Returns the key of the sorted set of the funds holding the token, scored by their portfolio_pct in it.
+        """
+        return f'{RedisManager.token_key(token)}:funds'
+
+    @staticmethod
+    def token_buy_targets_key(token: str) -> str:
+        """
+        Returns the key of the sorted set of the funds holding the token, scored by their buy_target.
+        """
+        return f'{RedisManager.token_key(token)}:buy_targets'
+
+    @staticmethod
+    def token_sell_targets_key(token: str) -> str:
+        """
+        Returns the key of the sorted set of the funds holding the token, scored by their sell_target.
+        """
+        return f'{RedisManager.token_key(token)}:sell_targets'
+
+    @staticmethod
+    def token_fund_versions_key(token: str) -> str:
+        """
+        Returns the key of the hash of the version of each fund last indexed under the token (including the funds
+            since removed from its indexes).
+        """
+        return f'{RedisManager.token_key(token)}:fund_versions'
+
+    @staticmethod
+    def token_vector_version_key(token: str) -> str:
+        """
+        Returns the key of the number of times the vector of any fund holding the token has changed, so that cached
+            similarity results can tell whether a fund sharing a token with the fund they are for has been created
+            or changed since.
+        """
+        return f'{RedisManager.token_key(token)}:vector_version'
+
+    @staticmethod
+    def token_price_key(token: str) -> str:
+        """
+        Returns the key of the token's cached price quote.
+        """
+        return f'{RedisManager.token_key(token)}:price'
+
+    @staticmethod
+    def token_price_lock_key(token: str) -> str:
+        """
+        Returns the key of the lock held while the token's price is being refreshed.
+        """
+        return f'{RedisManager.token_key(token)}:price_lock'
+
+    @staticmethod
+    def _decode_set(values: Optional[Iterable[bytes]]) -> List[str]:
+        """
+        Decodes the members of a stored set, in sorted order.
+        """
+        return [] if values is None else sorted(value.decode('utf-8') for value in values)
+
+    @staticmethod
+    def _decode_str(value: Optional[bytes]) -> Optional[str]:
+        """
+        Decodes a stored string, or returns None if it is missing or empty.
+        """
+        return None if value is None or len(value) == 0 else value.decode('utf-8')
+
+    def _encode_portfolio(self,
+                          portfolio: FundPortfolio) -> Union[bytes, str]:
+        """
+        Encodes a portfolio for storage, in the configured portfolio encoding.
+        """
+        return portfolio.to_bytes() if self.portfolio_encoding == PORTFOLIO_ENCODING_BINARY else str(portfolio)
+
+    @staticmethod
+    def _decode_portfolio(value: Optional[bytes]) -> Optional[FundPortfolio]:
+        """
+        Decodes a stored portfolio, or returns None if it is missing.
+        """
+        return None if value is None or len(value) == 0 else FundPortfolio.from_bytes(value)
@@ -0,0 +1,162 @@
+import multiprocessing
+import os
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from decouple import config
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+
+from backend.redis.RedisManager import RedisManager
+from backend.util import clean_email
+
+
+class BulkUserRegistration:
+    """
+    Registers a batch of new users at once, validating every row like the new user endpoint does.
+    Passwords are hashed (a deliberately slow PBKDF2) across a long-lived pool of spawned processes (so requests
+        neither fork the API worker nor start processes of their own), users are inserted with bulk_create
+        in chunks, and names are written to Redis in a single round trip.
+    Rows are reported one by one, so that a bad row doesn't fail the rest of the batch.
+    """
+
+    # Number of processes hashing passwords.
+    num_workers: int = config('BULK_REGISTRATION_WORKERS', default=os.cpu_count() or 1, cast=int)
+
+    # Number of users inserted per bulk_create.
+    chunk_size: int = config('BULK_REGISTRATION_CHUNK_SIZE', default=500, cast=int)
+
+    # Most users registered per request to the bulk new users endpoint, which hashes them while the request waits;
+    #   larger imports go through the bulkregisterusers command.
+    max_request_rows: int = config('BULK_REGISTRATION_MAX_ROWS', default=100, cast=int)
+
+    # Processes hashing passwords, re-created lazily in each forked (gunicorn worker) process.
+    _executor: Optional[ProcessPoolExecutor] = None
+
+    # Id of the process that created the hashing processes.
+    _executor_pid: Optional[int] = None
+
+    # Number of hashing processes.
+    _executor_workers: int = 0
+
+    # Guards the creation of the hashing processes.
+    _executor_lock = threading.Lock()
+
+    @classmethod
+    def register(cls,
+                 rows: List[Dict],
+                 redis: RedisManager,
+                 num_workers: Optional[int] = None,
+                 chunk_size: Optional[int] = None) -> List[Dict]:
+        """
+        Registers each row ({email_address, name, password}) as a new user, and returns one result per row,
+            in the same order: {row, email_address, created, error}.
+        """
+        num_workers = num_workers or cls.num_workers
+        chunk_size = chunk_size or cls.chunk_size
+        results = [{'row': row_idx, 'email_address': None, 'created': False, 'error': None}
+                   for row_idx in range(len(rows))]
+
+        # Validate every row, and check emails against the batch and the existing users.
+        valid_rows = {}
+        for row_idx, row in enumerate(rows):
+            email_address, error = cls.validate(row)
+            results[row_idx]['email_address'] = email_address
+            if error is None and email_address in valid_rows:
+                error = f'Duplicate of row {valid_rows[email_address]}'
+            if error is not None:
+                results[row_idx]['error'] = error
+                continue
+            valid_rows[email_address] = row_idx
+        emails = list(valid_rows.keys())
+        for chunk_start in range(0, len(emails), chunk_size):
+            for email_address in User.objects.filter(username__in=emails[chunk_start:chunk_start + chunk_size]) \
+                                             .values_list('username', flat=True):
+                results[valid_rows.pop(email_address)]['error'] = 'The email has already been taken'
+        if len(valid_rows) == 0:
+            return results
+
+        # Hash every password across the process pool.
+        passwords = [rows[row_idx]['password'] for row_idx in valid_rows.values()]
+        if num_workers <= 1 or len(passwords) < 2 * num_workers:
+            password_hashes = [make_password(password) for password in passwords]
+        else:
+            password_hashes = list(cls._get_executor(num_workers).map(
+                make_password, passwords, chunksize=max(1, len(passwords) // (4 * num_workers))))
+
+        # Insert the users in chunks, falling back to one insert per user in chunks that hit a conflict
+        #   (i.e. with a user registered by another request in the meantime).
+        users = [User(username=email_address, password=password_hash)
+                 for email_address, password_hash in zip(valid_rows.keys(), password_hashes)]
+        created_emails = []
+        for chunk_start in range(0, len(users), chunk_size):
+            chunk = users[chunk_start:chunk_start + chunk_size]
+            try:
+                with transaction.atomic():
+                    User.objects.bulk_create(chunk)
+                created_emails += [user.username for user in chunk]
+                continue
+            except IntegrityError as e:
+                pass
+            for user in chunk:
+                try:
+                    with transaction.atomic():
+                        user.save()
+                    created_emails.append(user.username)
+                except IntegrityError as e:
+                    results[valid_rows[user.username]]['error'] = 'The email has already been taken'
+
+        # Save every created user's name in Redis.
+        for email_address in created_emails:
+            results[valid_rows[email_address]]['created'] = True
+        if not redis.save_new_users({email_address: rows[valid_rows[email_address]]['name'].strip()
+                                     for email_address in created_emails}):
+            for email_address in created_emails:
+                results[valid_rows[email_address]]['error'] = 'User was created, but its name could not be saved'
+        return results
+
+    @classmethod
+    def _get_executor(cls,
+                      num_workers: int) -> ProcessPoolExecutor:
+        """
+        Returns the pool of num_workers hashing processes, starting it if this process has none of that size.
+        The processes are spawned rather than forked, so they don't inherit the API worker's threads, connections
+            and locks (they find the Django settings through DJANGO_SETTINGS_MODULE).
+        """
+        with cls._executor_lock:
+            if cls._executor_pid != os.getpid() or cls._executor_workers != num_workers:
+                if cls._executor_pid == os.getpid():
+                    cls._executor.shutdown(wait=False)
+                cls._executor = ProcessPoolExecutor(max_workers=num_workers,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+                cls._executor_pid = os.getpid()
+                cls._executor_workers = num_workers
+            return cls._executor
+
+    @staticmethod
+    def validate(row: Dict) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Returns the row's cleaned email address (or None if it has none), and why the row is invalid
+            (or None if it is valid).
+        """
+        try:
+            email_address = row.get('email_address', None)
+            name = row.get('name', None)
+            password = row.get('password', None)
+            if not isinstance(email_address, str) or not isinstance(name, str) or not isinstance(password, str):
+                return email_address if isinstance(email_address, str) else None, \
+                    "Rows need an 'email_address', a 'name' and a 'password'"
+            email_address = clean_email(email_address)
+            if not 4 <= len(email_address.strip()) <= 150:
+                return email_address, "The 'email_address' must be between 4 and 150 characters"
+            if len(name.strip()) > 150:
+                return email_address, "The 'name' must not be longer than 150 characters"
+            if not 8 <= len(password.strip()) <= 30:
+                return email_address, "The 'password' must be between 8 and 30 characters"
+            return email_address, None
+        except Exception as e:
+            print(f'ERROR! Something went wrong trying to validate a new user: {traceback.format_exc()}')
+            return None, 'Invalid row'
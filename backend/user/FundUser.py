@@ -1,7 +1,9 @@
+import copy
 import json
 import traceback
 from typing import Dict, List, Optional
 
+from backend.redis.LocalCache import LocalCache
 from backend.redis.RedisManager import RedisManager
 from backend.util import clean_email
 
@@ -20,6 +22,9 @@ class FundUser:
     # Ids of funds in which the user participates or manages.
     funds: List[str]
 
+    # Profiles recently loaded from Redis, by RedisManager.user_key().
+    _cache: LocalCache = LocalCache('user_profiles')
+
     def __init__(self,
                  email: str,
                  name: str,
@@ -59,20 +64,27 @@ class FundUser:
     @classmethod
     def from_db(cls,
                 user_email: str,
-                redis: RedisManager) -> Optional['FundUser']:
+                redis: RedisManager,
+                use_cache: bool = True) -> Optional['FundUser']:
         """
         Loads and returns the FundUser data associated with the email,
             or None if the user doesn't have any data stored in Redis.
+        Recently loaded profiles are served from a local cache (as copies), unless use_cache is False.
         """
         try:
             user_email = clean_email(user_email)
-            name = redis.get_user_name(user_email)
-            if name is None:
-                return None
-            fund_ids = redis.get_user_fund_ids(user_email)
-            return FundUser(email=user_email,
-                            name=name,
-                            funds=fund_ids)
+            cache_key = RedisManager.user_key(user_email)
+            if use_cache:
+                cached_user = cls._cache.get(cache_key)
+                if cached_user is not LocalCache.MISSING:
+                    return copy.deepcopy(cached_user)
+            generation = cls._cache.generation()
+            name, fund_ids = redis.get_user_profile(user_email)
+            user = None if name is None else FundUser(email=user_email,
+                                                      name=name,
+                                                      funds=fund_ids)
+            cls._cache.set(cache_key, copy.deepcopy(user), generation)
+            return user
         except Exception as e:
             print(f'ERROR! Something went wrong trying to load a user profile '
                   f'from redis: {traceback.format_exc()}')